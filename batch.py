@@ -0,0 +1,154 @@
+import os
+
+try:
+    from utils.lazy_imports import lazy_module
+    from utils.metrics import span, algorithm_context, record_fallback, RECOMMENDATIONS
+except ImportError:
+    from lazy_imports import lazy_module
+    from metrics import span, algorithm_context, record_fallback, RECOMMENDATIONS
+
+try:
+    from models.memory_budget import FLOAT_BYTES
+except ImportError:
+    from memory_budget import FLOAT_BYTES
+
+np = lazy_module("numpy")
+sparse = lazy_module("scipy.sparse")
+
+# Số khách tối đa mỗi request và số dòng tối đa chấm điểm cùng lúc (bị chặn thêm bởi memory budget)
+BATCH_MAX_CUSTOMERS = int(os.environ.get("BATCH_MAX_CUSTOMERS", "10000"))
+BATCH_CHUNK_ROWS = int(os.environ.get("BATCH_CHUNK_ROWS", "256"))
+# Mỗi dòng của 1 chunk cần ~3 mảng dài n_items (điểm dự đoán, mặt nạ, điểm theo danh mục)
+_ROW_ARRAYS = 3
+
+
+def customer_page(db, after_id=0, limit=1000):
+    """Keyset qua bảng customers: tối đa `limit` customer_id > after_id (tăng dần)"""
+    return db.query_column(
+        "SELECT customer_id FROM customers WHERE customer_id > ? ORDER BY customer_id LIMIT ?",
+        (after_id, limit),
+    )
+
+
+class BatchRecommender:
+    """
+    Gợi ý cho nhiều khách trong 1 lần: nạp ma trận/nhân tử SVD MỘT lần, chấm điểm cả chunk khách bằng 1 phép
+    nhân ma trận (U[chunk]·Σ·Vᵀ), chọn ứng viên theo danh mục bằng numpy rồi đa dạng hoá như svd_recommendation
+    (cùng kết quả). Bộ nhớ bị chặn bởi kích thước chunk (BATCH_CHUNK_ROWS và memory budget của recommender).
+    Không đụng tới trạng thái phiên của recommender.
+    """
+
+    def __init__(self, recommender, chunk_rows=BATCH_CHUNK_ROWS):
+        self.recommender = recommender
+        self.chunk_rows = chunk_rows
+
+    def _chunk_size(self, n_items):
+        budget = self.recommender.memory_budget
+        if budget.limit_mb <= 0:
+            return self.chunk_rows
+        per_row = max(1, n_items * FLOAT_BYTES * _ROW_ARRAYS)
+        return max(1, min(self.chunk_rows, budget.limit_bytes // per_row))
+
+    def _load(self):
+        """(ma trận, user_ids, product_ids, nhân tử) từ mô hình đang phục vụ, hoặc dựng/phân rã 1 lần"""
+        rec = self.recommender
+        model = rec.model
+        if model is not None:
+            return model.matrix, model.user_ids, model.product_ids, model.factors
+        matrix, user_ids, product_ids = rec.get_interaction_matrix()
+        if matrix is None:
+            return None, None, None, None
+        return matrix, user_ids, product_ids, rec.factorize(matrix)
+
+    def _category_columns(self, product_ids):
+        """category -> mảng cột (theo product_id tăng dần) của ma trận"""
+        rec = self.recommender
+        rec.ensure_catalog()
+        product_list = product_ids.tolist()
+        order = np.argsort(np.asarray(product_list), kind="stable")
+        groups = {}
+        for col in order:
+            product = rec.catalog.get(product_list[col])
+            if product is not None:
+                groups.setdefault(product["category"], []).append(col)
+        return {c: np.asarray(cols, dtype=np.int64) for c, cols in groups.items()}
+
+    @staticmethod
+    def _candidates(predictions, valid, category_columns, product_list, n):
+        """
+        Với mỗi dòng: top-n điểm của từng danh mục + ứng viên có product_id nhỏ nhất của danh mục (giữ đúng
+        thứ tự danh mục mà apply_category_diversity duyệt) → dict {product_id: điểm} nhỏ, kết quả đa dạng hoá
+        giống khi truyền toàn bộ ứng viên.
+        """
+        rows = predictions.shape[0]
+        per_row = [dict() for _ in range(rows)]
+        for cols in category_columns.values():
+            mask = valid[:, cols]
+            if not mask.any():
+                continue
+            scores = np.where(mask, predictions[:, cols], -np.inf)
+            if len(cols) > n:
+                top = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+            else:
+                top = np.broadcast_to(np.arange(len(cols)), (rows, len(cols)))
+            first = mask.argmax(axis=1)
+            has_any = mask.any(axis=1)
+            for r in np.flatnonzero(has_any):
+                picked = per_row[r]
+                for j in (*top[r], first[r]):
+                    if mask[r, j]:
+                        picked[product_list[cols[j]]] = float(scores[r, j])
+        return per_row
+
+    def iter_results(self, customer_ids, n_recommendations=10):
+        """Yield {customer_id, source, recommendations} cho từng khách theo thứ tự đầu vào"""
+        rec = self.recommender
+        RECOMMENDATIONS.inc(len(customer_ids), algorithm="batch")
+        with algorithm_context("batch"):
+            matrix, user_ids, product_ids, factors = self._load()
+        popular = None
+
+        def fallback(customer_id, reason):
+            nonlocal popular
+            record_fallback(reason)
+            if popular is None:
+                popular = rec.get_diverse_popular_products(n_recommendations)
+            return {"customer_id": customer_id, "source": "popular", "recommendations": popular}
+
+        if matrix is None or factors is None:
+            reason = "cold_start" if matrix is None else "matrix_too_small"
+            for customer_id in customer_ids:
+                yield fallback(customer_id, reason)
+            return
+
+        user_means, U, sigma, Vt = factors
+        US = U * sigma
+        product_list = product_ids.tolist()
+        category_columns = self._category_columns(product_ids)
+        chunk = self._chunk_size(len(product_list))
+
+        for start in range(0, len(customer_ids), chunk):
+            batch = customer_ids[start:start + chunk]
+            known = [(i, user_ids.get_loc(c)) for i, c in enumerate(batch) if c in user_ids]
+            per_row = []
+            if known:
+                with algorithm_context("batch"), span("batch.score"):
+                    idx = np.fromiter((u for _, u in known), dtype=np.int64, count=len(known))
+                    predictions = US[idx] @ Vt + user_means[idx].reshape(-1, 1)
+                    purchased = matrix[idx]
+                    purchased = (purchased.toarray() if sparse.issparse(purchased) else np.asarray(purchased)) > 0
+                    valid = ~purchased & (predictions > 0.1)
+                    rec.memory_budget.record("batch.score", predictions, valid)
+                    per_row = self._candidates(predictions, valid, category_columns, product_list, n_recommendations)
+            scored = {i: candidates for (i, _), candidates in zip(known, per_row)}
+
+            for i, customer_id in enumerate(batch):
+                if i not in scored:
+                    yield fallback(customer_id, "cold_start")
+                    continue
+                top = rec.apply_category_diversity(scored[i], n_recommendations)
+                yield {
+                    "customer_id": customer_id,
+                    "source": "svd",
+                    "recommendations": rec.get_product_details(top, "Dự đoán theo hành vi"),
+                }
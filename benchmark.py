@@ -0,0 +1,230 @@
+# benchmark.py
+import sys
+import os
+import io
+import json
+import time
+import argparse
+import contextlib
+import platform
+import resource
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+# Thêm src vào path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_dir = os.path.join(current_dir, 'src')
+sys.path.append(src_dir)
+
+from models.recommender import AdvancedRecommender
+from utils.database import DatabaseManager
+from utils.data_generator import generate_dataset, date_window
+
+ALGORITHMS = ["popular", "content", "collaborative", "svd", "hybrid"]
+
+# Các mức quy mô dữ liệu: (khách hàng, sản phẩm, giao dịch)
+TIERS = {
+    "1k": (1_000, 500, 20_000),
+    "100k": (100_000, 10_000, 2_000_000),
+    "1m": (1_000_000, 100_000, 50_000_000),
+}
+
+BENCH_DIR = os.path.join(current_dir, "benchmarks")
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+
+class CountingDatabaseManager(DatabaseManager):
+    """DatabaseManager đếm số câu SQL thực thi (qua sqlite3 trace callback)"""
+
+    def __init__(self, db_path):
+        super().__init__(db_path)
+        self.query_count = 0
+
+    def _trace(self, statement):
+        self.query_count += 1
+
+    def connect(self):
+        conn = super().connect()
+        conn.set_trace_callback(self._trace)
+        return conn
+
+    def _reader(self):
+        # Truy vấn điểm (query_rows/query_one/...) đi qua connection đọc dùng lại theo thread, không qua connect()
+        conn = super()._reader()
+        conn.set_trace_callback(self._trace)
+        return conn
+
+
+def ensure_dataset(tier, seed, end_date=None):
+    """
+    Sinh dataset cho tier nếu chưa có (tái sử dụng giữa các lần chạy). Ngày mua nằm trong khoảng gần đây
+    kết thúc ở end_date (mặc định hôm nay); khoảng ngày nằm trong tên file nên dataset cũ không bị dùng lại
+    khi trọng số độ mới đã khác
+    """
+    n_customers, n_products, n_purchases = TIERS[tier]
+    start_date, end_date = date_window(end_date=end_date)
+    db_path = os.path.join(BENCH_DIR, "data", f"{tier}-seed{seed}-{start_date}_{end_date}.db")
+    if not os.path.exists(db_path):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        generate_dataset(n_customers=n_customers, n_products=n_products, n_purchases=n_purchases,
+                         seed=seed, start_date=start_date, end_date=end_date, db_path=db_path)
+    return db_path
+
+
+def sample_customers(db, n, seed):
+    conn = db.connect()
+    try:
+        ids = [r[0] for r in conn.execute("SELECT DISTINCT customer_id FROM purchase_history").fetchall()]
+    finally:
+        conn.close()
+    rng = np.random.default_rng(seed)
+    return rng.choice(ids, size=min(n, len(ids)), replace=False).tolist() if ids else []
+
+
+def run_algorithm(recommender, db, algorithm, customers, n_recommendations, verbose):
+    """Chạy 1 thuật toán cho danh sách khách, trả về chỉ số latency/throughput/SQL"""
+    latencies = []
+    errors = 0
+    db.query_count = 0
+    sink = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    wall_start = time.perf_counter()
+    with sink:
+        for customer_id in customers:
+            start = time.perf_counter()
+            try:
+                recommender.recommend_products(int(customer_id), n_recommendations, algorithm)
+            except MemoryError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+    wall = time.perf_counter() - wall_start
+
+    lat_ms = np.array(latencies) * 1000
+    return {
+        "calls": len(latencies),
+        "errors": errors,
+        "p50_ms": round(float(np.percentile(lat_ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(lat_ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(lat_ms, 99)), 2),
+        "mean_ms": round(float(lat_ms.mean()), 2),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall > 0 else 0.0,
+        "sql_queries_per_call": round(db.query_count / max(len(latencies), 1), 1),
+    }
+
+
+def measure_peak_memory(recommender, algorithm, customer_id, n_recommendations):
+    """Đo peak memory (tracemalloc) của 1 lần gợi ý — chạy riêng vì tracemalloc làm chậm"""
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            recommender.recommend_products(int(customer_id), n_recommendations, algorithm)
+        _, peak = tracemalloc.get_traced_memory()
+    except MemoryError:
+        peak = -1
+    finally:
+        tracemalloc.stop()
+    return round(peak / (1024 * 1024), 2)
+
+
+def run_benchmark(tiers, algorithms, n_customers, n_recommendations, seed, verbose=False, end_date=None):
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "seed": seed,
+        "date_window": list(date_window(end_date=end_date)),
+        "n_recommendations": n_recommendations,
+        "tiers": {},
+    }
+    for tier in tiers:
+        print(f"\n📦 Tier {tier}: {TIERS[tier][0]:,} khách, {TIERS[tier][1]:,} sản phẩm, {TIERS[tier][2]:,} giao dịch")
+        db = CountingDatabaseManager(ensure_dataset(tier, seed, end_date))
+        recommender = AdvancedRecommender(db=db)
+        customers = sample_customers(db, n_customers, seed)
+        tier_result = {}
+        if not customers:
+            print("   ⚠️ Tier không có giao dịch nào → bỏ qua")
+            results["tiers"][tier] = tier_result
+            continue
+        for algorithm in algorithms:
+            stats = run_algorithm(recommender, db, algorithm, customers, n_recommendations, verbose)
+            stats["peak_mem_mb"] = measure_peak_memory(recommender, algorithm, customers[0], n_recommendations)
+            tier_result[algorithm] = stats
+            print(f"   {algorithm:<14} p50 {stats['p50_ms']:>9.1f}ms | p95 {stats['p95_ms']:>9.1f}ms | "
+                  f"p99 {stats['p99_ms']:>9.1f}ms | {stats['throughput_rps']:>7.2f} req/s | "
+                  f"{stats['peak_mem_mb']:>8.1f} MB | {stats['sql_queries_per_call']:>6.1f} SQL/req")
+        results["tiers"][tier] = tier_result
+    results["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return results
+
+
+def compare_with_baseline(results, baseline, threshold):
+    """So sánh với baseline; trả về danh sách regression (tăng quá threshold)"""
+    regressions = []
+    metrics = ["p50_ms", "p95_ms", "p99_ms", "peak_mem_mb", "sql_queries_per_call"]
+    print(f"\n📊 So sánh với baseline ({baseline.get('timestamp', '?')}), ngưỡng +{threshold:.0%}")
+    for tier, algos in results["tiers"].items():
+        for algorithm, stats in algos.items():
+            base = baseline.get("tiers", {}).get(tier, {}).get(algorithm)
+            if not base:
+                continue
+            for metric in metrics:
+                old, new = base.get(metric), stats.get(metric)
+                if not old or new is None or old <= 0:
+                    continue
+                change = (new - old) / old
+                marker = "❌" if change > threshold else "✅"
+                if change > threshold:
+                    regressions.append({"tier": tier, "algorithm": algorithm, "metric": metric,
+                                        "baseline": old, "current": new, "change": round(change, 3)})
+                print(f"   {marker} {tier}/{algorithm}/{metric}: {old} → {new} ({change:+.1%})")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark các thuật toán gợi ý theo quy mô dữ liệu")
+    parser.add_argument("--tiers", nargs="+", choices=list(TIERS), default=["1k"])
+    parser.add_argument("--algorithms", nargs="+", choices=ALGORITHMS, default=ALGORITHMS)
+    parser.add_argument("--customers", type=int, default=20, help="Số khách mẫu mỗi thuật toán")
+    parser.add_argument("--n", type=int, default=5, help="Số sản phẩm gợi ý mỗi lần")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--end-date", default=None,
+                        help="Ngày cuối của dữ liệu sinh (mặc định hôm nay); cố định để dùng lại cùng dataset")
+    parser.add_argument("--output", default=None, help="File JSON kết quả (mặc định benchmarks/results/<thời gian>.json)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Ghi kết quả lần này làm baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Ngưỡng regression (0.2 = chậm hơn 20%%)")
+    parser.add_argument("--verbose", action="store_true", help="Hiện log của recommender")
+    args = parser.parse_args()
+
+    print("🏁 BENCHMARK HỆ THỐNG GỢI Ý")
+    print("=" * 60)
+    results = run_benchmark(args.tiers, args.algorithms, args.customers, args.n, args.seed, args.verbose,
+                            args.end_date)
+
+    output = args.output or os.path.join(BENCH_DIR, "results", f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Kết quả: {output}")
+
+    exit_code = 0
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"📌 Đã lưu baseline: {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare_with_baseline(results, json.load(f), args.threshold)
+        results["regressions"] = regressions
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        if regressions:
+            print(f"❌ Phát hiện {len(regressions)} regression")
+            exit_code = 1
+        else:
+            print("✅ Không có regression")
+    else:
+        print("ℹ️ Chưa có baseline — chạy lại với --save-baseline để tạo")
+    sys.exit(exit_code)
@@ -0,0 +1,278 @@
+import os
+import time
+import heapq
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+try:
+    from utils.lazy_imports import lazy_module
+    from utils.metrics import record_cache
+    from utils import changelog
+except ImportError:
+    from lazy_imports import lazy_module
+    from metrics import record_cache
+    import changelog
+
+pd = lazy_module("pandas")
+
+# Thời gian sống của cache catalog (giây) trước khi tự nạp lại
+CATALOG_TTL = float(os.environ.get("CATALOG_TTL_SECONDS", "300"))
+# Số thay đổi tối đa áp dụng tăng dần; nhiều hơn → nạp lại toàn bộ rẻ hơn
+SYNC_MAX_CHANGES = int(os.environ.get("CATALOG_SYNC_MAX_CHANGES", "5000"))
+
+
+class ProductCatalog:
+    """
+    Cache trong RAM của bảng products + thống kê mua (số lượt mua, rating TB, số khách).
+    Dùng cho bước hydration (tránh N+1 truy vấn) và danh sách sản phẩm phổ biến.
+    """
+
+    def __init__(self, db, ttl=CATALOG_TTL):
+        self.db = db
+        self.ttl = ttl
+        self.products = {}        # product_id -> dict
+        self.popular_by_category = {}  # category -> [product dict] theo độ phổ biến giảm dần
+        self.ids_by_category = {}  # category -> array product_id tăng dần (lấy mẫu ngẫu nhiên, xem sampler.py)
+        self.all_ids = array("q")
+        self.loaded_at = None
+        self.changelog_seq = 0  # vị trí changelog tương ứng với dữ liệu đang giữ
+        self.version = 0  # tăng mỗi lần dữ liệu thay đổi → index dẫn xuất (price_index) tự dựng lại
+        self._price_index = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self.loaded_at is not None
+
+    def is_fresh(self):
+        return self.loaded and (self.ttl <= 0 or time.time() - self.loaded_at < self.ttl)
+
+    @staticmethod
+    def _load_rows(conn, product_ids=None):
+        """Sản phẩm + thống kê mua (toàn bộ, hoặc chỉ các product_ids) → {product_id: dict}"""
+        where, params = "", []
+        if product_ids is not None:
+            where = f"WHERE product_id IN ({','.join('?' * len(product_ids))})"
+            params = list(product_ids)
+        products = pd.read_sql(f"SELECT product_id, name, category, price, brand FROM products {where}",
+                               conn, params=params)
+        stats = pd.read_sql(
+            f"""
+            SELECT
+                product_id,
+                COUNT(purchase_id) AS purchase_count,
+                AVG(rating) AS avg_rating,
+                COUNT(DISTINCT customer_id) AS unique_customers
+            FROM purchase_history
+            {where}
+            GROUP BY product_id
+            """,
+            conn,
+            params=params,
+        )
+
+        df = products.merge(stats, on="product_id", how="left")
+        df["purchase_count"] = df["purchase_count"].fillna(0).astype(int)
+        df["unique_customers"] = df["unique_customers"].fillna(0).astype(int)
+        df["popularity"] = df["purchase_count"] * 0.6 + df["avg_rating"].fillna(0) * 0.3 + df["unique_customers"] * 0.1
+
+        rows = {}
+        for row in df.to_dict("records"):
+            row["product_id"] = int(row["product_id"])
+            row["price"] = float(row["price"] or 0)
+            row["avg_rating"] = None if pd.isna(row["avg_rating"]) else float(row["avg_rating"])
+            rows[row["product_id"]] = row
+        return rows
+
+    @staticmethod
+    def _rank_category(catalog, category):
+        """Sản phẩm đã có lượt mua của 1 danh mục, độ phổ biến giảm dần (hoà → product_id tăng dần)"""
+        products = [p for p in catalog.values() if p["category"] == category and p["purchase_count"] > 0]
+        products.sort(key=lambda p: (-p["popularity"], p["product_id"]))
+        return products
+
+    @staticmethod
+    def _index_categories(catalog, categories=None):
+        """Mảng product_id (tăng dần → lấy mẫu theo seed tái lập được) của mọi danh mục hoặc chỉ `categories`"""
+        ids = {}
+        for p in catalog.values():
+            if categories is None or p["category"] in categories:
+                ids.setdefault(p["category"], []).append(p["product_id"])
+        return {c: array("q", sorted(pids)) for c, pids in ids.items()}
+
+    def refresh(self):
+        """Nạp lại toàn bộ catalog + thống kê độ phổ biến (2 truy vấn)"""
+        conn = self.db.connect()
+        try:
+            seq = changelog.latest_seq(conn)
+            catalog = self._load_rows(conn)
+        finally:
+            conn.close()
+
+        categories = {p["category"] for p in catalog.values() if p["purchase_count"] > 0 and p["category"]}
+        popular = {c: self._rank_category(catalog, c) for c in sorted(categories, key=str)}
+        ids_by_category = self._index_categories(catalog)
+
+        with self._lock:
+            self.products = catalog
+            self.popular_by_category = popular
+            self.ids_by_category = ids_by_category
+            self.all_ids = array("q", sorted(catalog))
+            self.version += 1
+            self.loaded_at = time.time()
+            self.changelog_seq = seq
+        print(f"📚 Catalog: {len(catalog):,} sản phẩm, {len(popular)} danh mục có lượt mua")
+        return self
+
+    def sync(self):
+        """
+        Cập nhật tăng dần từ changelog: chỉ nạp lại các sản phẩm có thay đổi (sản phẩm hoặc lượt mua của nó)
+        và xếp hạng lại danh mục bị ảnh hưởng. Gặp mốc reset hoặc quá nhiều thay đổi → nạp lại toàn bộ.
+        """
+        conn = self.db.connect()
+        try:
+            changes = changelog.changes_since(conn, self.changelog_seq, SYNC_MAX_CHANGES + 1,
+                                              ("products", "purchase_history"))
+            if not changes:
+                self.loaded_at = time.time()
+                return 0
+            if len(changes) > SYNC_MAX_CHANGES or any(c["op"] == "R" for c in changes):
+                conn.close()
+                conn = None
+                self.refresh()
+                return len(changes)
+            product_ids = sorted({c["product_id"] for c in changes if c["product_id"] is not None})
+            rows = self._load_rows(conn, product_ids)
+        finally:
+            if conn is not None:
+                conn.close()
+
+        with self._lock:
+            catalog = dict(self.products)
+            affected = {catalog[pid]["category"] for pid in product_ids if pid in catalog}
+            for pid in product_ids:
+                if pid in rows:
+                    catalog[pid] = rows[pid]
+                    affected.add(rows[pid]["category"])
+                else:
+                    catalog.pop(pid, None)  # sản phẩm đã bị xoá
+            popular = dict(self.popular_by_category)
+            for category in filter(None, affected):
+                ranked = self._rank_category(catalog, category)
+                if ranked:
+                    popular[category] = ranked
+                else:
+                    popular.pop(category, None)
+            ids_by_category = dict(self.ids_by_category)
+            for category in affected:
+                ids_by_category.pop(category, None)
+            ids_by_category.update(self._index_categories(catalog, affected))
+            self.products = catalog
+            self.popular_by_category = {c: popular[c] for c in sorted(popular, key=str)}
+            self.ids_by_category = ids_by_category
+            self.all_ids = array("q", sorted(catalog))
+            self.version += 1
+            self.loaded_at = time.time()
+            self.changelog_seq = changes[-1]["seq"]
+        return len(changes)
+
+    def ensure_fresh(self):
+        if not self.loaded:
+            self.refresh()
+        elif not self.is_fresh():
+            self.sync()
+        return self
+
+    def get(self, product_id):
+        product = self.products.get(int(product_id))
+        record_cache("catalog", product is not None)
+        return product
+
+    def price_index(self):
+        """Index giá/độ phổ biến theo danh mục của phiên bản catalog hiện tại (dựng lại lười khi version đổi)"""
+        index = self._price_index
+        if index is None or index.version != self.version:
+            with self._lock:
+                products, version = self.products, self.version
+            index = CategoryPriceIndex(products, version)
+            self._price_index = index
+        return index
+
+    def diverse_popular(self, n_recommendations, per_category=2):
+        """Top `per_category` sản phẩm phổ biến mỗi danh mục (theo thứ tự danh mục), cắt còn n"""
+        selected = []
+        for category in sorted(self.popular_by_category):
+            selected.extend(self.popular_by_category[category][:per_category])
+            if len(selected) >= n_recommendations * 2:
+                break
+        return selected[:n_recommendations]
+
+
+class CategoryPriceIndex:
+    """
+    Index chỉ đọc trên 1 phiên bản catalog: mỗi danh mục giữ product_id sắp theo giá tăng dần (mảng giá song song
+    → lọc khoảng giá = 2 lần bisect + 1 slice) và thứ hạng độ phổ biến (lượt mua, rating TB, giá thấp).
+    """
+
+    def __init__(self, products, version=0):
+        self.products = products
+        self.version = version
+        self._prices = {}         # category -> array giá tăng dần
+        self._ids = {}            # category -> array product_id theo cùng thứ tự giá
+        self._by_popularity = {}  # category -> [product dict] độ phổ biến giảm dần
+        self._rank = {}           # product_id -> thứ hạng trong danh mục
+        groups = {}
+        for p in products.values():
+            groups.setdefault(p["category"], []).append(p)
+        for category, items in groups.items():
+            items.sort(key=lambda p: (p["price"], p["product_id"]))
+            self._prices[category] = array("d", (p["price"] for p in items))
+            self._ids[category] = array("q", (p["product_id"] for p in items))
+            ranked = sorted(items, key=self.popularity_key)
+            self._by_popularity[category] = ranked
+            self._rank.update((p["product_id"], i) for i, p in enumerate(ranked))
+
+    @staticmethod
+    def popularity_key(p):
+        # Giống ORDER BY purchase_count DESC, avg_rating DESC NULLS LAST, price ASC (hoà → product_id)
+        return (-p["purchase_count"], p["avg_rating"] is None, -(p["avg_rating"] or 0), p["price"], p["product_id"])
+
+    @property
+    def categories(self):
+        return list(self._ids)
+
+    def _bounds(self, category, min_price, max_price):
+        prices = self._prices.get(category)
+        if prices is None:
+            return 0, 0
+        lo = 0 if min_price is None else bisect_left(prices, min_price)
+        hi = len(prices) if max_price is None else bisect_right(prices, max_price)
+        return lo, max(lo, hi)
+
+    def band_ids(self, category, min_price=None, max_price=None):
+        """product_id của danh mục có giá trong [min_price, max_price] (view không sao chép, theo giá tăng dần)"""
+        lo, hi = self._bounds(category, min_price, max_price)
+        return memoryview(self._ids.get(category, array("q")))[lo:hi]
+
+    def top(self, category, min_price=None, max_price=None, k=20):
+        """k sản phẩm phổ biến nhất của danh mục trong khoảng giá, không truy vấn SQLite"""
+        lo, hi = self._bounds(category, min_price, max_price)
+        size = hi - lo
+        if size <= 0 or k <= 0:
+            return []
+        ranked = self._by_popularity[category]
+        if size * size >= k * len(ranked):
+            # Dải giá rộng: duyệt theo độ phổ biến, dừng khi đủ k (kỳ vọng ~k·N/size bước)
+            low = self._prices[category][lo]
+            high = self._prices[category][hi - 1]
+            selected = []
+            for p in ranked:
+                if low <= p["price"] <= high:
+                    selected.append(p)
+                    if len(selected) >= k:
+                        break
+            return selected
+        # Dải giá hẹp: chọn k phần tử có thứ hạng nhỏ nhất trong slice
+        ids = heapq.nsmallest(k, self._ids[category][lo:hi], key=self._rank.__getitem__)
+        return [self.products[pid] for pid in ids]
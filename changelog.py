@@ -0,0 +1,183 @@
+import contextlib
+
+# Change-data-capture: trigger SQLite ghi mọi thay đổi của các bảng nguồn vào bảng `changelog`
+# với số thứ tự `seq` tăng dần (AUTOINCREMENT → không bao giờ tái sử dụng, kể cả sau khi prune).
+TRACKED_TABLES = ("customers", "products", "purchase_history")
+
+# op: I = insert, U = update, D = delete, R = reset (dữ liệu bảng bị nạp lại hàng loạt → consumer nạp lại toàn bộ)
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS changelog (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name TEXT NOT NULL,
+    op TEXT NOT NULL,
+    row_id INTEGER,
+    customer_id INTEGER,
+    product_id INTEGER,
+    changed_at INTEGER NOT NULL DEFAULT (strftime('%s', 'now'))
+);
+CREATE TABLE IF NOT EXISTS changelog_offsets (
+    consumer TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL
+);
+"""
+
+# (bảng, cột row_id, biểu thức customer_id, biểu thức product_id) — {r} = NEW hoặc OLD
+_KEYS = {
+    "customers": ("customer_id", "{r}.customer_id", "NULL"),
+    "products": ("product_id", "NULL", "{r}.product_id"),
+    "purchase_history": ("purchase_id", "{r}.customer_id", "{r}.product_id"),
+}
+
+_OPS = (("insert", "I", "INSERT", "NEW"), ("update", "U", "UPDATE", "NEW"), ("delete", "D", "DELETE", "OLD"))
+
+
+def _trigger_sql(table):
+    row_col, customer_expr, product_expr = _KEYS[table]
+    statements = []
+    for suffix, op, event, ref in _OPS:
+        values = (f"'{table}', '{op}', {ref}.{row_col}, "
+                  f"{customer_expr.format(r=ref)}, {product_expr.format(r=ref)}")
+        body = f"INSERT INTO changelog (table_name, op, row_id, customer_id, product_id) VALUES ({values});"
+        if table == "purchase_history" and op == "U":
+            # Giao dịch bị chuyển sang khách/sản phẩm khác → ghi thêm khoá cũ để consumer cập nhật cả 2 phía
+            body += (f" INSERT INTO changelog (table_name, op, row_id, customer_id, product_id) "
+                     f"SELECT '{table}', 'U', OLD.{row_col}, OLD.customer_id, OLD.product_id "
+                     f"WHERE OLD.customer_id IS NOT NEW.customer_id OR OLD.product_id IS NOT NEW.product_id;")
+        statements.append(
+            f"CREATE TRIGGER IF NOT EXISTS changelog_{table}_{suffix} AFTER {event} ON {table} "
+            f"BEGIN {body} END;"
+        )
+    return statements
+
+
+def install(conn):
+    """Tạo bảng changelog + trigger trên các bảng nguồn (idempotent)"""
+    conn.executescript(SCHEMA)
+    for table in TRACKED_TABLES:
+        for statement in _trigger_sql(table):
+            conn.execute(statement)
+
+
+def drop_triggers(conn):
+    for table in TRACKED_TABLES:
+        for suffix, *_ in _OPS:
+            conn.execute(f"DROP TRIGGER IF EXISTS changelog_{table}_{suffix}")
+
+
+@contextlib.contextmanager
+def suspended(conn, tables=TRACKED_TABLES):
+    """
+    Tắt capture trong lúc nạp dữ liệu hàng loạt (tránh 1 dòng changelog cho mỗi dòng dữ liệu).
+    Kết thúc bằng 1 bản ghi 'R' cho mỗi bảng → consumer biết phải nạp lại toàn bộ bảng đó.
+    """
+    drop_triggers(conn)
+    conn.commit()
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.executemany("INSERT INTO changelog (table_name, op) VALUES (?, 'R')", [(t,) for t in tables])
+        install(conn)
+        conn.commit()
+
+
+def latest_seq(conn):
+    row = conn.execute("SELECT MAX(seq) FROM changelog").fetchone()
+    return row[0] or 0
+
+
+def changes_since(conn, since=0, limit=1000, tables=None):
+    """Các thay đổi có seq > since (tăng dần), tối đa `limit` dòng, lọc theo `tables` nếu có"""
+    sql = "SELECT seq, table_name, op, row_id, customer_id, product_id, changed_at FROM changelog WHERE seq > ?"
+    params = [since]
+    if tables:
+        sql += f" AND table_name IN ({','.join('?' * len(tables))})"
+        params.extend(tables)
+    sql += " ORDER BY seq LIMIT ?"
+    params.append(limit)
+    columns = ("seq", "table", "op", "row_id", "customer_id", "product_id", "changed_at")
+    return [dict(zip(columns, row)) for row in conn.execute(sql, params).fetchall()]
+
+
+def prune(conn, keep_after=None):
+    """Xoá changelog đã được mọi consumer đăng ký đọc qua (hoặc seq <= keep_after nếu chỉ định)"""
+    if keep_after is None:
+        row = conn.execute("SELECT MIN(seq) FROM changelog_offsets").fetchone()
+        if row[0] is None:
+            return 0
+        keep_after = row[0]
+    deleted = conn.execute("DELETE FROM changelog WHERE seq <= ?", (keep_after,)).rowcount
+    conn.commit()
+    return deleted
+
+
+class ChangelogConsumer:
+    """
+    Đọc changelog theo lô cho 1 subscriber (cache, aggregate, cập nhật mô hình tăng dần...).
+    name != None → offset được lưu trong bảng changelog_offsets (tiếp tục sau khi khởi động lại).
+    """
+
+    def __init__(self, db, name=None, tables=None, batch_size=1000):
+        self.db = db
+        self.name = name
+        self.tables = tuple(tables) if tables else None
+        self.batch_size = batch_size
+        self.seq = self._load_offset()
+
+    def _load_offset(self):
+        if self.name is None:
+            return 0
+        conn = self.db.connect()
+        try:
+            row = conn.execute("SELECT seq FROM changelog_offsets WHERE consumer = ?", (self.name,)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else 0
+
+    def seek_to_end(self, conn=None):
+        """Bỏ qua các thay đổi cũ (vd: ngay sau khi nạp toàn bộ trạng thái)"""
+        own = conn is None
+        conn = conn or self.db.connect()
+        try:
+            self.seq = latest_seq(conn)
+        finally:
+            if own:
+                conn.close()
+        return self.seq
+
+    def poll(self, limit=None):
+        """Lô thay đổi tiếp theo (chưa commit offset)"""
+        conn = self.db.connect()
+        try:
+            return changes_since(conn, self.seq, limit or self.batch_size, self.tables)
+        finally:
+            conn.close()
+
+    def commit(self, seq):
+        """Xác nhận đã xử lý tới `seq`"""
+        self.seq = seq
+        if self.name is None:
+            return
+        conn = self.db.connect()
+        try:
+            conn.execute(
+                "INSERT INTO changelog_offsets (consumer, seq) VALUES (?, ?) "
+                "ON CONFLICT(consumer) DO UPDATE SET seq = excluded.seq",
+                (self.name, seq),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def drain(self, handler):
+        """Gọi handler(changes) cho từng lô tới khi hết; commit offset sau mỗi lô. Trả về số thay đổi đã xử lý."""
+        total = 0
+        while True:
+            changes = self.poll()
+            if not changes:
+                return total
+            handler(changes)
+            self.commit(changes[-1]["seq"])
+            total += len(changes)
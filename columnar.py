@@ -0,0 +1,188 @@
+import os
+import sys
+import shutil
+import tempfile
+import time
+import importlib.util
+
+try:
+    from utils.lazy_imports import lazy_module
+except ImportError:
+    from lazy_imports import lazy_module
+
+pd = lazy_module("pandas")
+
+# pyarrow là tuỳ chọn: chỉ cần khi dùng định dạng cột (nạp trễ ở lần dùng đầu tiên)
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+pa = lazy_module("pyarrow")
+ds = lazy_module("pyarrow.dataset")
+feather = lazy_module("pyarrow.feather")
+pq = lazy_module("pyarrow.parquet")
+
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+ARROW_EXTENSIONS = ('.arrow', '.feather', '.ipc')
+COLUMNAR_EXTENSIONS = PARQUET_EXTENSIONS + ARROW_EXTENSIONS
+
+# Các cột mà bước huấn luyện thực sự cần (column projection)
+INTERACTION_COLUMNS = ['customer_id', 'product_id', 'rating', 'purchase_date', 'category', 'brand', 'price']
+
+
+def require_pyarrow():
+    if not HAS_PYARROW:
+        raise ImportError("Cần cài pyarrow để đọc/ghi Parquet/Arrow: pip install pyarrow")
+
+
+def is_columnar_file(path):
+    return path.lower().endswith(COLUMNAR_EXTENSIONS)
+
+
+def read_table(path, columns=None):
+    """
+    Đọc file Parquet/Arrow (hoặc thư mục Parquet đã partition) thành pyarrow.Table.
+    - memory-map file thay vì đọc toàn bộ vào buffer
+    - chỉ đọc các cột cần thiết (columns=None → tất cả)
+    """
+    require_pyarrow()
+    if os.path.isdir(path):
+        dataset = ds.dataset(path, format="parquet", partitioning="hive")
+        if columns:
+            columns = [c for c in columns if c in dataset.schema.names]
+        return dataset.to_table(columns=columns)
+    if path.lower().endswith(ARROW_EXTENSIONS):
+        return feather.read_table(path, columns=columns, memory_map=True)
+    return pq.read_table(path, columns=columns, memory_map=True)
+
+
+def read_frame(path, columns=None):
+    """Như read_table nhưng trả về pandas DataFrame"""
+    return read_table(path, columns=columns).to_pandas()
+
+
+def load_interactions(path, columns=None):
+    """
+    Đọc dữ liệu tương tác (đã export) cho bước huấn luyện.
+    Trả về DataFrame cùng schema với truy vấn SQL trong get_enhanced_user_item_matrix.
+    """
+    start = time.perf_counter()
+    df = read_frame(path, columns=columns or INTERACTION_COLUMNS)
+    if "purchase_date" in df.columns:
+        # purchase_date lưu theo UTC (CURRENT_TIMESTAMP), giống julianday('now') trong truy vấn SQL
+        purchase_date = pd.to_datetime(df["purchase_date"], errors="coerce", utc=True)
+        df["days_since_purchase"] = (pd.Timestamp.now(tz="UTC") - purchase_date).dt.days.fillna(0).astype("int64")
+    print(f"📦 Đọc {len(df):,} tương tác từ {path} trong {time.perf_counter() - start:.2f}s")
+    return df
+
+
+def is_export_dir(path, partition_cols=("purchase_month",)):
+    """Thư mục chỉ gồm các partition của một lần export trước (purchase_month=...) → được phép ghi đè"""
+    prefix = f"{partition_cols[0]}="
+    return all(name.startswith(prefix) and os.path.isdir(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def export_purchase_history(db, out_dir, partition_cols=("purchase_month",), chunk_size=500_000, overwrite=False):
+    """
+    Export purchase_history JOIN products ra Parquet partition theo tháng mua (hive: purchase_month=YYYY-MM).
+    Đọc theo từng chunk để không giữ toàn bộ bảng trong RAM. Ghi vào thư mục tạm cạnh out_dir rồi os.replace
+    vào chỗ, nên lỗi giữa chừng không làm mất bản export cũ. Thư mục đích đã có chỉ bị thay nếu là bản export
+    trước đó (chỉ gồm partition) hoặc overwrite=True.
+    """
+    require_pyarrow()
+    start = time.perf_counter()
+    out_dir = os.path.abspath(out_dir)
+    if os.path.exists(out_dir):
+        if not os.path.isdir(out_dir):
+            raise FileExistsError(f"{out_dir} đã tồn tại và không phải thư mục")
+        if not overwrite and not is_export_dir(out_dir, partition_cols):
+            raise FileExistsError(f"{out_dir} chứa dữ liệu không phải bản export Parquet — "
+                                  f"dùng --overwrite nếu muốn thay thế")
+    parent = os.path.dirname(out_dir)
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=f".{os.path.basename(out_dir)}-", dir=parent)
+
+    query = """
+        SELECT
+            ph.purchase_id,
+            ph.customer_id,
+            ph.product_id,
+            ph.quantity,
+            ph.rating,
+            ph.purchase_date,
+            p.category,
+            p.brand,
+            p.price,
+            substr(ph.purchase_date, 1, 7) AS purchase_month
+        FROM purchase_history ph
+        JOIN products p ON ph.product_id = p.product_id
+    """
+    conn = db.connect()
+    total_rows = 0
+    try:
+        for i, chunk in enumerate(pd.read_sql(query, conn, chunksize=chunk_size)):
+            chunk["purchase_month"] = chunk["purchase_month"].fillna("unknown")
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            pq.write_to_dataset(
+                table,
+                root_path=tmp_dir,
+                partition_cols=list(partition_cols),
+                basename_template=f"part-{i:05d}-{{i}}.parquet",
+                existing_data_behavior="overwrite_or_ignore",
+            )
+            total_rows += len(chunk)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    finally:
+        conn.close()
+
+    # os.replace không thay được thư mục khác rỗng → dời bản cũ sang bên cạnh, thay, rồi mới xoá bản cũ
+    old_dir = None
+    if os.path.isdir(out_dir):
+        old_dir = tempfile.mkdtemp(prefix=f".{os.path.basename(out_dir)}-old-", dir=parent)
+        os.replace(out_dir, os.path.join(old_dir, "data"))
+    try:
+        os.replace(tmp_dir, out_dir)
+    except OSError:
+        if old_dir is not None:
+            os.replace(os.path.join(old_dir, "data"), out_dir)
+            shutil.rmtree(old_dir, ignore_errors=True)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    if old_dir is not None:
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ Đã export {total_rows:,} dòng ra {out_dir} trong {elapsed:.2f}s")
+    return {"rows": total_rows, "path": out_dir, "seconds": round(elapsed, 3)}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.append(os.path.dirname(current_dir))
+    try:
+        from utils.database import DatabaseManager
+    except ImportError:
+        from database import DatabaseManager
+
+    db = DatabaseManager()
+    parser = argparse.ArgumentParser(description="Import/export dữ liệu tương tác dạng cột (Parquet/Arrow)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export_cmd = sub.add_parser("export", help="Export purchase_history + thuộc tính sản phẩm ra Parquet")
+    export_cmd.add_argument("--out", default=os.path.join(os.path.dirname(db.db_path), "interactions"))
+    export_cmd.add_argument("--chunk-size", type=int, default=500_000)
+    export_cmd.add_argument("--overwrite", action="store_true",
+                            help="Cho phép thay thư mục --out đã có dữ liệu không phải bản export trước")
+    show_cmd = sub.add_parser("show", help="Đọc thử file/thư mục Parquet/Arrow")
+    show_cmd.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        try:
+            export_purchase_history(db, args.out, chunk_size=args.chunk_size, overwrite=args.overwrite)
+        except FileExistsError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+    else:
+        df = load_interactions(args.path)
+        print(df.head())
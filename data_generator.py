@@ -0,0 +1,367 @@
+import os
+import sys
+import time
+import sqlite3
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+# Thêm path để import từ cùng level
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(current_dir))
+
+try:
+    from utils.database import DatabaseManager
+    from utils.columnar import require_pyarrow
+    from utils import changelog
+    from utils import stats
+except ImportError:
+    from database import DatabaseManager
+    from columnar import require_pyarrow
+    import changelog
+    import stats
+
+# ==================== TỪ ĐIỂN SINH DỮ LIỆU ====================
+
+# Danh mục giống dữ liệu mẫu: (tỉ trọng số sản phẩm, khoảng giá min-max VND)
+CATEGORIES = {
+    "Thực phẩm": (0.22, 3_000, 300_000),
+    "Điện tử": (0.12, 300_000, 90_000_000),
+    "Thời trang": (0.18, 80_000, 5_000_000),
+    "Gia dụng": (0.14, 150_000, 25_000_000),
+    "Làm đẹp": (0.12, 50_000, 4_000_000),
+    "Sức khỏe": (0.07, 80_000, 3_000_000),
+    "Sách": (0.08, 40_000, 500_000),
+    "Văn phòng phẩm": (0.07, 3_000, 600_000),
+}
+
+PRODUCT_TEMPLATES = {
+    "Thực phẩm": (["Sữa tươi", "Bánh quy", "Cà phê hòa tan", "Nước suối", "Mì gói", "Kem", "Chocolate",
+                   "Trà túi lọc", "Bia lon", "Xúc xích", "Nước mắm", "Gạo thơm", "Dầu ăn", "Sữa chua"],
+                  ["Vinamilk", "TH True Milk", "Oreo", "G7", "Trung Nguyên", "Lavie", "Hảo Hảo", "Acecook",
+                   "Merino", "Lipton", "Tiger", "CP", "Nam Ngư", "Neptune"],
+                  ["hộp 1L", "gói 500g", "lốc 6", "thùng 24", "vị dâu", "ít đường", "loại đặc biệt"]),
+    "Điện tử": (["Điện thoại", "Laptop", "Tai nghe", "Đồng hồ thông minh", "Máy ảnh", "Loa bluetooth",
+                 "Máy tính bảng", "Smart TV", "Máy chơi game", "Sạc dự phòng"],
+                ["Apple", "Samsung", "Dell", "Sony", "Canon", "JBL", "Xiaomi", "Asus", "LG", "Oppo"],
+                ["bản tiêu chuẩn", "bản Pro", "128GB", "256GB", "55 inch", "thế hệ mới", "màu đen"]),
+    "Thời trang": (["Áo thun nam", "Váy liền nữ", "Giày thể thao", "Túi xách nữ", "Quần jeans",
+                    "Áo khoác", "Giày cao gót", "Đồng hồ đeo tay", "Kính mát", "Ví da"],
+                   ["Nike", "Adidas", "Zara", "Levi's", "Bitis", "Casio", "Ray-Ban", "Uniqlo", "Owen"],
+                   ["size S", "size M", "size L", "màu trắng", "màu xanh", "bản giới hạn", "da thật"]),
+    "Gia dụng": (["Máy xay sinh tố", "Nồi chiên không dầu", "Máy hút bụi", "Bình đun siêu tốc", "Máy giặt",
+                  "Tủ lạnh", "Máy lọc nước", "Bếp từ", "Lò vi sóng", "Nồi cơm điện"],
+                 ["Philips", "Lock&Lock", "Samsung", "Sunhouse", "Toshiba", "Panasonic", "Kangaroo", "Sharp"],
+                 ["1.5L", "5L", "inverter", "cao cấp", "gia đình", "mini", "thế hệ mới"]),
+    "Làm đẹp": (["Son kem lì", "Serum dưỡng ẩm", "Kem chống nắng", "Nước hoa", "Kem dưỡng da",
+                 "Dầu gội", "Sữa rửa mặt", "Mặt nạ giấy", "Nước tẩy trang"],
+                ["Maybelline", "La Roche-Posay", "Anessa", "Chanel", "Kiehl's", "Head & Shoulders",
+                 "Innisfree", "Bioderma"],
+                ["30ml", "50ml", "100ml", "cho da dầu", "cho da khô", "bản du lịch"]),
+    "Sức khỏe": (["Máy đo huyết áp", "Viên uống Omega-3", "Máy massage", "Nhiệt kế điện tử", "Vitamin C",
+                  "Khẩu trang y tế", "Máy đo đường huyết"],
+                 ["Omron", "Nature Made", "Beurer", "Microlife", "Blackmores", "DHC"],
+                 ["hộp 30 viên", "hộp 60 viên", "hộp 50 cái", "bản gia đình", "tiêu chuẩn"]),
+    "Sách": (["Đắc Nhân Tâm", "Nhà Giả Kim", "Tư Duy Phản Biện", "Atomic Habits", "Tuổi Trẻ Đáng Giá Bao Nhiêu",
+              "Dế Mèn Phiêu Lưu Ký", "Sapiens", "Cà Phê Cùng Tony", "Muôn Kiếp Nhân Sinh"],
+             ["First News", "Nhã Nam", "Alpha Books", "Penguin", "NXB Trẻ", "NXB Kim Đồng"],
+             ["bìa mềm", "bìa cứng", "tái bản", "bản đặc biệt"]),
+    "Văn phòng phẩm": (["Bút bi", "Vở học sinh", "Ba lô học sinh", "Máy tính cầm tay", "Bìa hồ sơ",
+                        "Giấy in A4", "Bút highlight", "Sổ tay"],
+                       ["Thiên Long", "Campus", "Simple", "Casio", "Deli", "Double A", "Hồng Hà"],
+                       ["hộp 10", "200 trang", "khổ A5", "màu xanh", "gói 5"]),
+}
+
+FAMILY_NAMES = ["Nguyễn", "Trần", "Lê", "Phạm", "Hoàng", "Huỳnh", "Phan", "Vũ", "Võ", "Đặng", "Bùi", "Đỗ",
+                "Hồ", "Ngô", "Dương", "Lý"]
+MIDDLE_NAMES = ["Văn", "Thị", "Hữu", "Minh", "Ngọc", "Thanh", "Đức", "Thu", "Quốc", "Gia"]
+GIVEN_NAMES = ["An", "Bình", "Cường", "Dung", "Em", "Lan", "Hùng", "Mai", "Nam", "Oanh", "Phúc", "Quân",
+               "Trang", "Tuấn", "Vy", "Yến", "Hải", "Linh", "Khoa", "Hương"]
+
+# Phân phối rating: lệch về 4-5 sao như dữ liệu thực tế
+RATING_PROBS = np.array([0.04, 0.08, 0.18, 0.36, 0.34])
+
+PURCHASE_COLUMNS = ['purchase_id', 'customer_id', 'product_id', 'quantity', 'rating', 'purchase_date']
+
+# Khoảng ngày mua mặc định: DEFAULT_DAYS ngày kết thúc hôm nay. Trọng số độ mới exp(-days/30) của recommender
+# gần như bằng 0 với giao dịch cũ hơn vài tháng, nên dữ liệu phải gần hiện tại mới kiểm thử đúng tải thực tế
+DEFAULT_DAYS = 365
+# File SQLite mặc định tách khỏi data/supermarket.db để không xoá nhầm dữ liệu đang dùng
+DEFAULT_DB_NAME = "synthetic.db"
+
+
+def date_window(start_date=None, end_date=None, days=DEFAULT_DAYS):
+    """(start_date, end_date) dạng ISO; thiếu end_date → hôm nay, thiếu start_date → end_date - days"""
+    end = date.fromisoformat(str(end_date)[:10]) if end_date else date.today()
+    start = date.fromisoformat(str(start_date)[:10]) if start_date else end - timedelta(days=days)
+    if start >= end:
+        raise ValueError(f"Khoảng ngày không hợp lệ: {start} → {end}")
+    return start.isoformat(), end.isoformat()
+
+
+def _has_data(db_path):
+    """File SQLite đã có dòng dữ liệu trong bảng nào đó chưa"""
+    if not os.path.exists(db_path) or os.path.getsize(db_path) == 0:
+        return False
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        tables = [r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+        return any(conn.execute(f'SELECT 1 FROM "{t}" LIMIT 1').fetchone() for t in tables)
+    finally:
+        conn.close()
+
+
+def _rng_names(rng, n, *parts):
+    idx = [rng.integers(0, len(p), n) for p in parts]
+    arrays = [np.asarray(p, dtype=object)[i] for p, i in zip(parts, idx)]
+    out = arrays[0]
+    for a in arrays[1:]:
+        out = out + " " + a
+    return out
+
+
+def generate_products(rng, n_products):
+    """Sinh catalog sản phẩm. Trả về DataFrame product_id, name, category, price, brand"""
+    names = list(CATEGORIES)
+    shares = np.array([CATEGORIES[c][0] for c in names])
+    category_idx = np.sort(rng.choice(len(names), size=n_products, p=shares / shares.sum()))
+
+    product_names = np.empty(n_products, dtype=object)
+    brands = np.empty(n_products, dtype=object)
+    prices = np.empty(n_products, dtype=np.float64)
+    for ci, category in enumerate(names):
+        mask = category_idx == ci
+        k = int(mask.sum())
+        if k == 0:
+            continue
+        items, cat_brands, variants = PRODUCT_TEMPLATES[category]
+        brand = np.asarray(cat_brands, dtype=object)[rng.integers(0, len(cat_brands), k)]
+        base = _rng_names(rng, k, items)
+        variant = _rng_names(rng, k, variants)
+        product_names[mask] = base + " " + brand + " " + variant
+        brands[mask] = brand
+        # Giá phân phối log-uniform trong khoảng của danh mục, làm tròn 1.000đ
+        lo, hi = CATEGORIES[category][1], CATEGORIES[category][2]
+        prices[mask] = np.round(np.exp(rng.uniform(np.log(lo), np.log(hi), k)), -3).clip(min=1000)
+
+    return pd.DataFrame({
+        'product_id': np.arange(1, n_products + 1, dtype=np.int64),
+        'name': product_names,
+        'category': np.asarray(names, dtype=object)[category_idx],
+        'price': prices,
+        'brand': brands,
+    })
+
+
+def generate_customers(rng, n_customers):
+    """Sinh khách hàng với họ tên tiếng Việt, SĐT 10 số không trùng"""
+    ids = np.arange(1, n_customers + 1, dtype=np.int64)
+    names = _rng_names(rng, n_customers, FAMILY_NAMES, MIDDLE_NAMES, GIVEN_NAMES)
+    # i * 7919 mod 10^8 là song ánh (7919 nguyên tố cùng nhau với 10^8) → SĐT không trùng
+    phones = np.char.add("09", np.char.zfill(((ids * 7919) % 100_000_000).astype(str), 8))
+    emails = np.char.add(np.char.add("khachhang", ids.astype(str)), "@email.com")
+    return pd.DataFrame({'customer_id': ids, 'name': names, 'phone': phones.astype(object),
+                         'email': emails.astype(object)})
+
+
+class _PurchaseSampler:
+    """
+    Sinh lịch sử mua hàng theo chunk (vector hóa bằng numpy):
+    - độ phổ biến sản phẩm theo luật lũy thừa (Zipf) trong từng danh mục
+    - mỗi khách có phân bố sở thích danh mục riêng (Dirichlet) và mức độ mua sắm riêng (log-normal)
+    """
+
+    def __init__(self, rng, products, n_customers, zipf_a, start_date, end_date):
+        self.rng = rng
+        self.categories = list(CATEGORIES)
+        cat_codes = pd.Categorical(products['category'], categories=self.categories).codes
+        n_cat = len(self.categories)
+
+        # Sản phẩm trong từng danh mục + CDF popularity theo Zipf trên thứ hạng ngẫu nhiên
+        self.cat_products = []
+        self.cat_cdf = []
+        for ci in range(n_cat):
+            pids = products['product_id'].to_numpy()[cat_codes == ci]
+            pids = rng.permutation(pids)
+            weights = 1.0 / np.power(np.arange(1, len(pids) + 1), zipf_a) if len(pids) else np.array([])
+            self.cat_products.append(pids)
+            self.cat_cdf.append(np.cumsum(weights) / weights.sum() if len(pids) else weights)
+
+        available = np.array([len(p) > 0 for p in self.cat_products], dtype=np.float64)
+        affinity = rng.dirichlet(np.full(n_cat, 0.4), size=n_customers).astype(np.float32) * available
+        affinity /= affinity.sum(axis=1, keepdims=True)
+        self.affinity_cdf = np.cumsum(affinity, axis=1)
+
+        activity = rng.lognormal(mean=0.0, sigma=1.0, size=n_customers)
+        self.customer_cdf = np.cumsum(activity) / activity.sum()
+
+        self.start = np.datetime64(start_date, 's')
+        self.span = int((np.datetime64(end_date, 's') - self.start).astype(np.int64))
+
+    def sample(self, n):
+        rng = self.rng
+        customers = np.searchsorted(self.customer_cdf, rng.random(n), side='right')
+        customers = np.minimum(customers, len(self.customer_cdf) - 1)
+        categories = (self.affinity_cdf[customers] < rng.random(n)[:, None]).sum(axis=1)
+        categories = np.minimum(categories, len(self.categories) - 1)
+
+        products = np.zeros(n, dtype=np.int64)
+        for ci, pids in enumerate(self.cat_products):
+            mask = categories == ci
+            k = int(mask.sum())
+            if k and len(pids):
+                pos = np.searchsorted(self.cat_cdf[ci], rng.random(k), side='right')
+                products[mask] = pids[np.minimum(pos, len(pids) - 1)]
+
+        offsets = rng.integers(0, max(self.span, 1), n)
+        dates = np.datetime_as_string(self.start + offsets.astype('timedelta64[s]'), unit='s')
+        return {
+            'customer_id': customers.astype(np.int64) + 1,
+            'product_id': products,
+            'quantity': (rng.geometric(0.6, n)).astype(np.int32),
+            'rating': (rng.choice(5, size=n, p=RATING_PROBS) + 1).astype(np.int8),
+            'purchase_date': np.char.replace(dates, 'T', ' '),
+        }
+
+
+def _write_sqlite(db, customers, products, purchase_chunks):
+    db.create_tables(drop_existing=True)
+    conn = db.connect()
+    try:
+        cursor = conn.cursor()
+        # Dựng database mới hoàn toàn → tắt journal/fsync để bulk insert nhanh
+        cursor.execute("PRAGMA journal_mode = OFF")
+        cursor.execute("PRAGMA synchronous = OFF")
+        # Bulk insert không ghi changelog/thống kê từng dòng (create_tables đã ghi mốc 'R'; thống kê tính lại 1 lần)
+        with changelog.suspended(conn, tables=()), stats.suspended(conn):
+            cursor.executemany("INSERT INTO customers (customer_id, name, phone, email) VALUES (?, ?, ?, ?)",
+                               customers.itertuples(index=False, name=None))
+            cursor.executemany("INSERT INTO products (product_id, name, category, price, brand) VALUES (?, ?, ?, ?, ?)",
+                               products.itertuples(index=False, name=None))
+            conn.commit()
+            total = 0
+            for chunk in purchase_chunks:
+                cursor.executemany(
+                    "INSERT INTO purchase_history (purchase_id, customer_id, product_id, quantity, rating, purchase_date) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    zip(*(chunk[c].tolist() for c in PURCHASE_COLUMNS))
+                )
+                conn.commit()
+                total += len(chunk['purchase_id'])
+                print(f"   💾 Đã ghi {total:,} giao dịch")
+    finally:
+        conn.close()
+
+
+def _write_parquet(out_dir, customers, products, purchase_chunks):
+    require_pyarrow()
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(out_dir, exist_ok=True)
+    customers.to_parquet(os.path.join(out_dir, "customers.parquet"), index=False)
+    products.to_parquet(os.path.join(out_dir, "products.parquet"), index=False)
+
+    # Giao dịch ghi theo layout giống columnar.export_purchase_history để dùng trực tiếp cho huấn luyện
+    interactions_dir = os.path.join(out_dir, "interactions")
+    attrs = products.set_index('product_id')
+    total = 0
+    for i, chunk in enumerate(purchase_chunks):
+        frame = pd.DataFrame(chunk)
+        joined = attrs.loc[frame['product_id'], ['category', 'brand', 'price']].reset_index(drop=True)
+        frame = pd.concat([frame, joined], axis=1)
+        frame['purchase_month'] = frame['purchase_date'].str.slice(0, 7)
+        pq.write_to_dataset(
+            pa.Table.from_pandas(frame, preserve_index=False),
+            root_path=interactions_dir,
+            partition_cols=['purchase_month'],
+            basename_template=f"part-{i:05d}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
+        total += len(frame)
+        print(f"   💾 Đã ghi {total:,} giao dịch")
+
+
+def generate_dataset(n_customers=1000, n_products=500, n_purchases=20000, seed=42,
+                     start_date=None, end_date=None, output="sqlite",
+                     db_path=None, out_dir=None, chunk_size=1_000_000, zipf_a=1.1,
+                     days=DEFAULT_DAYS, force=False):
+    """
+    Sinh bộ dữ liệu tổng hợp để kiểm thử tải (vd: 1M khách, 100k sản phẩm, 50M giao dịch).
+    - output="sqlite": tạo lại bảng trong db_path (mặc định data/synthetic.db) và bulk insert.
+      Database đã có dữ liệu chỉ bị xoá khi force=True
+    - output="parquet": ghi customers/products + interactions partition theo tháng vào out_dir
+    Ngày mua trải đều trong [start_date, end_date) — mặc định `days` ngày kết thúc hôm nay.
+    Cùng seed, cùng tham số và cùng khoảng ngày → cùng dữ liệu.
+    """
+    start = time.perf_counter()
+    start_date, end_date = date_window(start_date, end_date, days)
+    if output != "parquet":
+        db_path = db_path or os.path.join(os.path.dirname(DatabaseManager().db_path), DEFAULT_DB_NAME)
+        if not force and _has_data(db_path):
+            raise FileExistsError(f"{db_path} đã có dữ liệu — dùng --force (force=True) nếu muốn xoá và sinh lại")
+    rng = np.random.default_rng(seed)
+    print(f"🧪 Sinh dữ liệu: {n_customers:,} khách, {n_products:,} sản phẩm, {n_purchases:,} giao dịch "
+          f"({start_date} → {end_date}, seed={seed})")
+
+    products = generate_products(rng, n_products)
+    customers = generate_customers(rng, n_customers)
+    sampler = _PurchaseSampler(rng, products, n_customers, zipf_a, start_date, end_date)
+
+    def purchase_chunks():
+        next_id = 1
+        remaining = n_purchases
+        while remaining > 0:
+            n = min(chunk_size, remaining)
+            chunk = sampler.sample(n)
+            chunk['purchase_id'] = np.arange(next_id, next_id + n, dtype=np.int64)
+            next_id += n
+            remaining -= n
+            yield chunk
+
+    if output == "parquet":
+        out_dir = out_dir or os.path.join(os.path.dirname(DatabaseManager().db_path), "synthetic")
+        _write_parquet(out_dir, customers, products, purchase_chunks())
+        target = out_dir
+    else:
+        db = DatabaseManager(db_path)
+        _write_sqlite(db, customers, products, purchase_chunks())
+        target = db.db_path
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ Hoàn thành trong {elapsed:.1f}s → {target}")
+    return {'customers': n_customers, 'products': n_products, 'purchases': n_purchases,
+            'seed': seed, 'output': output, 'path': target, 'seconds': round(elapsed, 2)}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sinh dữ liệu tổng hợp quy mô lớn để kiểm thử tải")
+    parser.add_argument("--customers", type=int, default=1000)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--purchases", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--start-date", default=None, help="Mặc định: --end-date trừ --days ngày")
+    parser.add_argument("--end-date", default=None, help="Mặc định: hôm nay")
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS, help="Độ dài khoảng ngày mua khi thiếu --start-date")
+    parser.add_argument("--format", choices=["sqlite", "parquet"], default="sqlite")
+    parser.add_argument("--db", default=None, help=f"Đường dẫn file SQLite (mặc định: data/{DEFAULT_DB_NAME})")
+    parser.add_argument("--force", action="store_true", help="Cho phép xoá database --db đã có dữ liệu")
+    parser.add_argument("--out", default=None, help="Thư mục Parquet (mặc định: data/synthetic)")
+    parser.add_argument("--chunk-size", type=int, default=1_000_000)
+    parser.add_argument("--zipf", type=float, default=1.1, help="Số mũ luật lũy thừa cho độ phổ biến sản phẩm")
+    args = parser.parse_args()
+
+    try:
+        generate_dataset(
+            n_customers=args.customers, n_products=args.products, n_purchases=args.purchases,
+            seed=args.seed, start_date=args.start_date, end_date=args.end_date, output=args.format,
+            db_path=args.db, out_dir=args.out, chunk_size=args.chunk_size, zipf_a=args.zipf,
+            days=args.days, force=args.force,
+        )
+    except FileExistsError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
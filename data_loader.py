@@ -1,7 +1,8 @@
-import pandas as pd
-import numpy as np
 import os
 import sys
+import glob
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # Thêm path để import từ cùng level
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -18,6 +19,116 @@ except ImportError:
     spec.loader.exec_module(database_module)
     DatabaseManager = database_module.DatabaseManager
 
+try:
+    from utils.columnar import is_columnar_file, read_frame
+    from utils.lazy_imports import lazy_module
+    from utils import changelog
+    from utils import stats
+except ImportError:
+    from columnar import is_columnar_file, read_frame
+    from lazy_imports import lazy_module
+    import changelog
+    import stats
+
+pd = lazy_module("pandas")
+np = lazy_module("numpy")
+
+COLUMN_MAPPING = {
+    'customer_id': 'customer_id', 'user_id': 'customer_id',
+    'product_id': 'product_id', 'item_id': 'product_id',
+    'product_name': 'product_name', 'name': 'product_name',
+    'category': 'category', 'price': 'price', 'rating': 'rating'
+}
+
+# Nạp nhiều file partition còn nhận thêm số lượng/thương hiệu/ngày mua (đường nạp 1 file giữ nguyên COLUMN_MAPPING)
+PARTITION_COLUMN_MAPPING = dict(COLUMN_MAPPING, **{
+    'quantity': 'quantity', 'brand': 'brand',
+    'purchase_date': 'purchase_date', 'date': 'purchase_date', 'timestamp': 'purchase_date',
+})
+
+PRODUCT_ATTR_COLUMNS = ['product_name', 'category', 'price', 'brand']
+RATING_RANGE = (1, 5)
+QUANTITY_RANGE = (1, 2 ** 31 - 1)
+
+
+def _standardize(df, mapping=COLUMN_MAPPING):
+    return df.rename(columns={k: v for k, v in mapping.items() if k in df.columns})
+
+
+def _rounded_column(df, column, file_path, default, valid_range, dtype):
+    """Cột số nguyên: làm tròn nửa lên (4.4 → 4, 4.5 → 5), thiếu → default, ngoài valid_range → ValueError (không cắt/tràn số)"""
+    if column not in df.columns:
+        return np.full(len(df), default, dtype=dtype)
+    values = np.floor(pd.to_numeric(df[column], errors='coerce').fillna(default).to_numpy(dtype=np.float64) + 0.5)
+    low, high = valid_range
+    bad = (values < low) | (values > high)
+    if bad.any():
+        raise ValueError(f"{os.path.basename(file_path)}: {int(bad.sum())} dòng có {column} ngoài [{low}, {high}] "
+                         f"(vd: {df[column].to_numpy()[bad][0]})")
+    return values.astype(dtype)
+
+
+def _ratings(df, file_path):
+    """Cột rating → int8 trong [1, 5], thiếu → 5"""
+    return _rounded_column(df, 'rating', file_path, 5, RATING_RANGE, np.int8)
+
+
+def _quantities(df, file_path):
+    """Cột quantity → int32 trong [1, 2^31 - 1], thiếu → 1"""
+    return _rounded_column(df, 'quantity', file_path, 1, QUANTITY_RANGE, np.int32)
+
+
+def _read_partition(file_path):
+    """Đọc 1 file partition (CSV hoặc Parquet/Arrow) thành DataFrame"""
+    if is_columnar_file(file_path):
+        return read_frame(file_path)
+    return pd.read_csv(file_path)
+
+
+def _parse_partition(file_path):
+    """
+    Worker chạy trong process con: đọc + chuẩn hóa 1 file partition.
+    Trả về các mảng cột gọn (numpy) để process cha ghi vào SQLite.
+    """
+    start = time.perf_counter()
+    df = _standardize(_read_partition(file_path), PARTITION_COLUMN_MAPPING)
+
+    if 'customer_id' not in df.columns or 'product_id' not in df.columns:
+        raise ValueError(f"{os.path.basename(file_path)} thiếu cột customer_id/product_id")
+
+    df = df.dropna(subset=['customer_id', 'product_id'])
+    n_rows = len(df)
+
+    columns = {
+        'customer_id': df['customer_id'].to_numpy(dtype=np.int64),
+        'product_id': df['product_id'].to_numpy(dtype=np.int64),
+        'quantity': _quantities(df, file_path),
+        'rating': _ratings(df, file_path),
+    }
+    if 'purchase_date' in df.columns:
+        dates = pd.to_datetime(df['purchase_date'], errors='coerce')
+        columns['purchase_date'] = dates.to_numpy(dtype='datetime64[s]')
+
+    # Thuộc tính sản phẩm: mỗi product_id chỉ giữ 1 dòng
+    attr_cols = [c for c in PRODUCT_ATTR_COLUMNS if c in df.columns]
+    products = None
+    if attr_cols:
+        first = df.drop_duplicates('product_id')
+        products = {'product_id': first['product_id'].to_numpy(dtype=np.int64)}
+        for c in attr_cols:
+            col = first[c].astype(object)
+            products[c] = col.where(col.notna(), None).to_numpy()
+
+    return {
+        'file': file_path,
+        'rows': n_rows,
+        'bytes': os.path.getsize(file_path),
+        'parse_seconds': time.perf_counter() - start,
+        'columns': columns,
+        'products': products,
+    }
+
+
 class DataLoader:
     def __init__(self):
         self.db = DatabaseManager()
@@ -38,7 +149,138 @@ class DataLoader:
         target_file = preferred_files[0] if preferred_files else csv_files[0]
         
         return self.process_local_file(target_file)
-    
+
+    # ==================== NẠP NHIỀU FILE SONG SONG ====================
+
+    def resolve_files(self, patterns):
+        """Mở rộng glob pattern (tương đối theo data_dir) thành danh sách file đã sắp xếp"""
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        files = set()
+        for pattern in patterns:
+            if not os.path.isabs(pattern):
+                pattern = os.path.join(self.data_dir, pattern)
+            files.update(f for f in glob.glob(pattern, recursive=True) if os.path.isfile(f))
+        return sorted(files)
+
+    def load_partitioned_dataset(self, patterns="*.csv", max_workers=None, replace=False):
+        """
+        Nạp nhiều file partition (vd: export theo ngày) vào database.
+        - Parse + chuẩn hóa song song bằng process pool, worker trả về mảng cột gọn.
+        - Chỉ process cha ghi SQLite (1 writer duy nhất) → không tranh chấp khóa ghi.
+        - replace=True: xóa dữ liệu cũ trước khi nạp; mặc định nạp bổ sung.
+        Trả về danh sách báo cáo throughput theo từng file.
+        """
+        files = self.resolve_files(patterns)
+        if not files:
+            print(f"❌ Không tìm thấy file nào khớp {patterns}")
+            return []
+
+        max_workers = max_workers or min(len(files), os.cpu_count() or 1)
+        print(f"📂 Nạp {len(files)} file với {max_workers} worker...")
+        total_start = time.perf_counter()
+
+        conn = self.db.connect()
+        cursor = conn.cursor()
+        reports = []
+        try:
+            # Nạp hàng loạt: tạm tắt changelog + trigger thống kê, kết thúc bằng mốc 'R' và 1 lần tính lại thống kê
+            with changelog.suspended(conn), stats.suspended(conn):
+                if replace:
+                    cursor.execute("DELETE FROM purchase_history")
+                    cursor.execute("DELETE FROM products")
+                    cursor.execute("DELETE FROM customers")
+                    conn.commit()
+
+                if max_workers == 1:
+                    for f in files:
+                        reports.append(self._parse_and_commit(conn, f, lambda f=f: _parse_partition(f)))
+                else:
+                    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                        futures = {pool.submit(_parse_partition, f): f for f in files}
+                        for future in as_completed(futures):
+                            reports.append(self._parse_and_commit(conn, futures[future], future.result))
+        finally:
+            conn.close()
+
+        total_seconds = time.perf_counter() - total_start
+        total_rows = sum(r['rows'] for r in reports)
+        print(f"✅ Đã nạp {total_rows:,} dòng từ {len(files)} file trong {total_seconds:.2f}s "
+              f"({total_rows / max(total_seconds, 1e-9):,.0f} dòng/s)")
+        return reports
+
+    def _parse_and_commit(self, conn, file_path, get_result):
+        try:
+            return self._commit_partition(conn, get_result())
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ Lỗi xử lý {os.path.basename(file_path)}: {e}")
+            return {'file': file_path, 'rows': 0, 'error': str(e)}
+
+    def _commit_partition(self, conn, result):
+        """Writer: ghi mảng cột của 1 partition trong 1 transaction"""
+        start = time.perf_counter()
+        cols = result['columns']
+        cursor = conn.cursor()
+
+        customer_ids = np.unique(cols['customer_id']).tolist()
+        cursor.executemany(
+            "INSERT OR IGNORE INTO customers (customer_id, name) VALUES (?, ?)",
+            ((cid, f'Customer_{cid}') for cid in customer_ids)
+        )
+
+        products = result['products']
+        if products is not None:
+            n = len(products['product_id'])
+            names = products.get('product_name')
+            categories = products.get('category')
+            prices = products.get('price')
+            brands = products.get('brand')
+            cursor.executemany(
+                "INSERT OR IGNORE INTO products (product_id, name, category, price, brand) VALUES (?, ?, ?, ?, ?)",
+                ((int(products['product_id'][i]),
+                  str(names[i]) if names is not None else f"Product_{products['product_id'][i]}",
+                  categories[i] if categories is not None else None,
+                  None if prices is None or prices[i] is None else float(prices[i]),
+                  brands[i] if brands is not None else None) for i in range(n))
+            )
+        else:
+            cursor.executemany(
+                "INSERT OR IGNORE INTO products (product_id, name) VALUES (?, ?)",
+                ((pid, f'Product_{pid}') for pid in np.unique(cols['product_id']).tolist())
+            )
+
+        base = [cols['customer_id'].tolist(), cols['product_id'].tolist(),
+                cols['quantity'].tolist(), cols['rating'].tolist()]
+        if 'purchase_date' in cols:
+            dates = np.char.replace(np.datetime_as_string(cols['purchase_date'], unit='s'), 'T', ' ')
+            dates = [None if d == 'NaT' else d for d in dates.tolist()]
+            cursor.executemany(
+                "INSERT INTO purchase_history (customer_id, product_id, quantity, rating, purchase_date) "
+                "VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))",
+                zip(*base, dates)
+            )
+        else:
+            cursor.executemany(
+                "INSERT INTO purchase_history (customer_id, product_id, quantity, rating) VALUES (?, ?, ?, ?)",
+                zip(*base)
+            )
+        conn.commit()
+
+        write_seconds = time.perf_counter() - start
+        rows = result['rows']
+        report = {
+            'file': result['file'],
+            'rows': rows,
+            'bytes': result['bytes'],
+            'parse_seconds': round(result['parse_seconds'], 4),
+            'write_seconds': round(write_seconds, 4),
+            'rows_per_second': round(rows / max(result['parse_seconds'] + write_seconds, 1e-9), 1),
+        }
+        print(f"   📄 {os.path.basename(result['file'])}: {rows:,} dòng | parse {report['parse_seconds']:.2f}s "
+              f"| ghi {report['write_seconds']:.2f}s | {report['rows_per_second']:,.0f} dòng/s")
+        return report
+
     def process_local_file(self, csv_file):
         """Xử lý file CSV"""
         try:
@@ -67,51 +309,47 @@ class DataLoader:
         conn = self.db.connect()
         cursor = conn.cursor()
         
-        # Xóa dữ liệu cũ
-        cursor.execute("DELETE FROM purchase_history")
-        cursor.execute("DELETE FROM products") 
-        cursor.execute("DELETE FROM customers")
+        # Thay toàn bộ dữ liệu: tạm tắt changelog + trigger thống kê, kết thúc bằng mốc 'R' và tính lại thống kê
+        with changelog.suspended(conn), stats.suspended(conn):
+            # Xóa dữ liệu cũ
+            cursor.execute("DELETE FROM purchase_history")
+            cursor.execute("DELETE FROM products") 
+            cursor.execute("DELETE FROM customers")
         
-        # Thêm khách hàng
-        unique_customers = df['customer_id'].dropna().unique()
-        for customer_id in unique_customers:
-            cursor.execute("INSERT INTO customers (customer_id, name) VALUES (?, ?)",
-                          (int(customer_id), f'Customer_{customer_id}'))
+            # Thêm khách hàng
+            unique_customers = df['customer_id'].dropna().unique()
+            for customer_id in unique_customers:
+                cursor.execute("INSERT INTO customers (customer_id, name) VALUES (?, ?)",
+                              (int(customer_id), f'Customer_{customer_id}'))
         
-        # Thêm sản phẩm
-        unique_products = df['product_id'].dropna().unique()
-        categories = ['Điện tử', 'Thời trang', 'Gia dụng', 'Sách', 'Thể thao']
-        brands = ['Apple', 'Samsung', 'Sony', 'Nike', 'Adidas']
+            # Thêm sản phẩm
+            unique_products = df['product_id'].dropna().unique()
+            categories = ['Điện tử', 'Thời trang', 'Gia dụng', 'Sách', 'Thể thao']
+            brands = ['Apple', 'Samsung', 'Sony', 'Nike', 'Adidas']
         
-        for i, product_id in enumerate(unique_products):
-            category = categories[i % len(categories)]
-            brand = brands[i % len(brands)]
-            cursor.execute(
-                "INSERT INTO products (product_id, name, category, price, brand) VALUES (?, ?, ?, ?, ?)",
-                (int(product_id), f'{brand} {category} {product_id}', category, 
-                 np.random.randint(50000, 5000000), brand)
-            )
+            for i, product_id in enumerate(unique_products):
+                category = categories[i % len(categories)]
+                brand = brands[i % len(brands)]
+                cursor.execute(
+                    "INSERT INTO products (product_id, name, category, price, brand) VALUES (?, ?, ?, ?, ?)",
+                    (int(product_id), f'{brand} {category} {product_id}', category, 
+                     np.random.randint(50000, 5000000), brand)
+                )
         
-        # Thêm lịch sử mua hàng
-        for _, row in df.iterrows():
-            cursor.execute(
-                "INSERT INTO purchase_history (customer_id, product_id, quantity, rating) VALUES (?, ?, ?, ?)",
-                (int(row['customer_id']), int(row['product_id']), 1, int(row['rating']))
-            )
+            # Thêm lịch sử mua hàng
+            for _, row in df.iterrows():
+                cursor.execute(
+                    "INSERT INTO purchase_history (customer_id, product_id, quantity, rating) VALUES (?, ?, ?, ?)",
+                    (int(row['customer_id']), int(row['product_id']), 1, int(row['rating']))
+                )
         
-        conn.commit()
+            conn.commit()
         conn.close()
         return True
     
     def standardize_columns(self, df):
         """Chuẩn hóa tên cột"""
-        column_mapping = {
-            'customer_id': 'customer_id', 'user_id': 'customer_id',
-            'product_id': 'product_id', 'item_id': 'product_id',
-            'product_name': 'product_name', 'name': 'product_name',
-            'category': 'category', 'price': 'price', 'rating': 'rating'
-        }
-        return df.rename(columns={k: v for k, v in column_mapping.items() if k in df.columns})
+        return _standardize(df)
     
     def load_to_database(self, df):
         """Load dữ liệu vào database"""
@@ -119,50 +357,52 @@ class DataLoader:
             conn = self.db.connect()
             cursor = conn.cursor()
             
-            # Xóa dữ liệu cũ
-            cursor.execute("DELETE FROM purchase_history")
-            cursor.execute("DELETE FROM products")
-            cursor.execute("DELETE FROM customers")
+            # Thay toàn bộ dữ liệu: tạm tắt changelog + trigger thống kê, kết thúc bằng mốc 'R' và tính lại thống kê
+            with changelog.suspended(conn), stats.suspended(conn):
+                # Xóa dữ liệu cũ
+                cursor.execute("DELETE FROM purchase_history")
+                cursor.execute("DELETE FROM products")
+                cursor.execute("DELETE FROM customers")
             
-            # Xử lý khách hàng
-            if 'customer_id' not in df.columns:
-                df['customer_id'] = range(1, len(df) + 1)
+                # Xử lý khách hàng
+                if 'customer_id' not in df.columns:
+                    df['customer_id'] = range(1, len(df) + 1)
             
-            unique_customers = df['customer_id'].dropna().unique()
-            for customer_id in unique_customers:
-                cursor.execute("INSERT INTO customers (customer_id, name) VALUES (?, ?)",
-                              (int(customer_id), f'Customer_{customer_id}'))
+                unique_customers = df['customer_id'].dropna().unique()
+                for customer_id in unique_customers:
+                    cursor.execute("INSERT INTO customers (customer_id, name) VALUES (?, ?)",
+                                  (int(customer_id), f'Customer_{customer_id}'))
             
-            # Xử lý sản phẩm
-            if 'product_id' not in df.columns and 'product_name' in df.columns:
-                unique_products = df['product_name'].dropna().unique()
-                product_mapping = {name: i+1 for i, name in enumerate(unique_products)}
-                df['product_id'] = df['product_name'].map(product_mapping)
+                # Xử lý sản phẩm
+                if 'product_id' not in df.columns and 'product_name' in df.columns:
+                    unique_products = df['product_name'].dropna().unique()
+                    product_mapping = {name: i+1 for i, name in enumerate(unique_products)}
+                    df['product_id'] = df['product_name'].map(product_mapping)
             
-            unique_products = df['product_id'].dropna().unique()
-            categories = ['Điện tử', 'Thời trang', 'Gia dụng', 'Sách', 'Thể thao']
-            brands = ['Apple', 'Samsung', 'Sony', 'Nike', 'Adidas']
+                unique_products = df['product_id'].dropna().unique()
+                categories = ['Điện tử', 'Thời trang', 'Gia dụng', 'Sách', 'Thể thao']
+                brands = ['Apple', 'Samsung', 'Sony', 'Nike', 'Adidas']
             
-            for product_id in unique_products:
-                product_data = df[df['product_id'] == product_id].iloc[0]
-                name = product_data.get('product_name', f'Product_{product_id}')
-                category = product_data.get('category', categories[product_id % len(categories)])
-                price = product_data.get('price', np.random.randint(10000, 500000))
+                for product_id in unique_products:
+                    product_data = df[df['product_id'] == product_id].iloc[0]
+                    name = product_data.get('product_name', f'Product_{product_id}')
+                    category = product_data.get('category', categories[product_id % len(categories)])
+                    price = product_data.get('price', np.random.randint(10000, 500000))
                 
-                cursor.execute(
-                    "INSERT INTO products (product_id, name, category, price, brand) VALUES (?, ?, ?, ?, ?)",
-                    (int(product_id), str(name), str(category), float(price), brands[product_id % len(brands)])
-                )
+                    cursor.execute(
+                        "INSERT INTO products (product_id, name, category, price, brand) VALUES (?, ?, ?, ?, ?)",
+                        (int(product_id), str(name), str(category), float(price), brands[product_id % len(brands)])
+                    )
             
-            # Thêm lịch sử mua hàng
-            for _, row in df.iterrows():
-                cursor.execute(
-                    "INSERT INTO purchase_history (customer_id, product_id, quantity, rating) VALUES (?, ?, ?, ?)",
-                    (int(row['customer_id']), int(row['product_id']), 
-                     int(row.get('quantity', 1)), int(row.get('rating', np.random.randint(3, 6))))
-                )
+                # Thêm lịch sử mua hàng
+                for _, row in df.iterrows():
+                    cursor.execute(
+                        "INSERT INTO purchase_history (customer_id, product_id, quantity, rating) VALUES (?, ?, ?, ?)",
+                        (int(row['customer_id']), int(row['product_id']), 
+                         int(row.get('quantity', 1)), int(row.get('rating', np.random.randint(3, 6))))
+                    )
             
-            conn.commit()
+                conn.commit()
             conn.close()
             return True
             
@@ -171,6 +411,19 @@ class DataLoader:
             return False
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Nạp dữ liệu vào database")
+    parser.add_argument("patterns", nargs="*",
+                        help="Glob pattern các file partition CSV/Parquet/Arrow (vd: 'daily/*.csv', 'daily/*.parquet')")
+    parser.add_argument("--workers", type=int, default=None, help="Số process parse song song")
+    parser.add_argument("--replace", action="store_true", help="Xóa dữ liệu cũ trước khi nạp")
+    args = parser.parse_args()
+
     loader = DataLoader()
-    success = loader.load_local_dataset()
+    if args.patterns:
+        reports = loader.load_partitioned_dataset(args.patterns, max_workers=args.workers, replace=args.replace)
+        success = bool(reports) and not any('error' in r for r in reports)
+    else:
+        success = loader.load_local_dataset()
     print("✅ Thành công!" if success else "❌ Thất bại!")
\ No newline at end of file
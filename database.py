@@ -1,28 +1,170 @@
 import sqlite3
-import pandas as pd
 import os
+import json
+import base64
+import threading
+
+try:
+    from utils.lazy_imports import lazy_module
+    from utils.metrics import timed_query
+    from utils.query_profiler import connect as profiled_connect
+    from utils import changelog
+    from utils import event_buffer
+    from utils import stats
+    from utils import phones
+except ImportError:
+    from lazy_imports import lazy_module
+    from metrics import timed_query
+    from query_profiler import connect as profiled_connect
+    import changelog
+    import event_buffer
+    import stats
+    import phones
+
+np = lazy_module("numpy")
+
+# Số prepared statement sqlite3 giữ trên mỗi connection đọc (truy vấn điểm lặp lại không phải parse lại)
+READER_CACHED_STATEMENTS = int(os.environ.get("DB_READER_CACHED_STATEMENTS", "256"))
+
+# Phân trang lịch sử mua (keyset trên (purchase_date, purchase_id), index idx_purchase_history_customer_date)
+HISTORY_PAGE_SIZE = int(os.environ.get("PURCHASE_HISTORY_PAGE_SIZE", "20"))
+MAX_HISTORY_PAGE_SIZE = 200
+
+_HISTORY_PAGE_SQL = """
+    SELECT
+        ph.purchase_id,
+        p.product_id,
+        p.name,
+        p.category,
+        p.price,
+        p.brand,
+        ph.quantity,
+        ph.rating,
+        ph.purchase_date
+    FROM purchase_history ph
+    JOIN products p ON ph.product_id = p.product_id
+    WHERE ph.customer_id = ? AND {where}
+    ORDER BY ph.purchase_date DESC, ph.purchase_id DESC
+    LIMIT ?
+"""
+
+
+def encode_history_cursor(purchase_date, purchase_id):
+    """Cursor mờ = vị trí (purchase_date, purchase_id) của giao dịch cuối trang"""
+    raw = json.dumps({"d": purchase_date, "i": purchase_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_history_cursor(cursor):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if data["d"] is not None and not isinstance(data["d"], str):
+            raise ValueError
+        return data["d"], int(data["i"])
+    except Exception:
+        raise ValueError("cursor lịch sử mua không hợp lệ")
+
 
 class DatabaseManager:
-    def __init__(self):
+    def __init__(self, db_path=None):
         current_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-        self.db_path = os.path.join(current_dir, "data", "supermarket.db")
+        self.db_path = db_path or os.path.join(current_dir, "data", "supermarket.db")
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        # Được gắn bởi warmup: cache catalog (ProductCatalog) → lọc danh mục/khoảng giá trong RAM
+        self.catalog = None
+        # Được gắn bởi warmup: bảng tra SĐT chuẩn → khách hàng (phones.CustomerDirectory)
+        self.customers = None
+        self._phone_index_ready = False
+        # Connection đọc dùng lại theo thread (xem _reader)
+        self._local = threading.local()
+        self._inherited_readers = []
         
     def connect(self):
-        return sqlite3.connect(self.db_path)
+        return profiled_connect(self.db_path)
+
+    # ==================== TRUY VẤN NHẸ (không qua pandas) ====================
+
+    def _reader(self):
+        """
+        Connection đọc của thread hiện tại, mở 1 lần rồi dùng lại: sqlite3 cache prepared statement theo
+        connection nên truy vấn điểm lặp lại không phải mở file/parse SQL. Gắn với PID: sau fork (serve.py)
+        worker mở connection riêng; connection thừa hưởng từ master chỉ được giữ lại, không đóng trong con.
+        """
+        local = self._local
+        conn = getattr(local, "conn", None)
+        if conn is not None and local.pid != os.getpid():
+            self._inherited_readers.append(conn)
+            conn = None
+        if conn is None:
+            conn = profiled_connect(self.db_path, cached_statements=READER_CACHED_STATEMENTS)
+            local.conn, local.pid = conn, os.getpid()
+        return conn
+
+    def close_reader(self):
+        """Đóng connection đọc của thread hiện tại (lần truy vấn sau tự mở lại)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local.conn = None
+
+    def query_rows(self, sql, params=()):
+        """list[tuple] trực tiếp từ cursor"""
+        return self._reader().execute(sql, params).fetchall()
+
+    def query_one(self, sql, params=()):
+        """Dòng đầu tiên dạng dict (None nếu không có)"""
+        cursor = self._reader().execute(sql, params)
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip([d[0] for d in cursor.description], row))
+
+    def query_dicts(self, sql, params=()):
+        """list[dict] (tên cột → giá trị), thay cho read_sql(...).to_dict('records')"""
+        cursor = self._reader().execute(sql, params)
+        columns = [d[0] for d in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def query_column(self, sql, params=()):
+        """Cột đầu tiên dạng list"""
+        return [row[0] for row in self._reader().execute(sql, params).fetchall()]
+
+    def query_array(self, sql, params=(), dtype="float64"):
+        """Cột đầu tiên dạng mảng NumPy (NULL → NaN với dtype số thực)"""
+        rows = self._reader().execute(sql, params).fetchall()
+        if np.dtype(dtype).kind == "f":
+            return np.fromiter((np.nan if r[0] is None else r[0] for r in rows), dtype=dtype, count=len(rows))
+        return np.fromiter((r[0] for r in rows), dtype=dtype, count=len(rows))
+
+    def ensure_phone_index(self):
+        """Cột SĐT chuẩn + index (database tạo trước khi có cột này → bổ sung 1 lần khi dùng lần đầu)"""
+        if self._phone_index_ready:
+            return
+        conn = self.connect()
+        try:
+            phones.install(conn)
+            conn.commit()
+        finally:
+            conn.close()
+        self._phone_index_ready = True
+
+    def column_exists(self, table_name, column_name):
+        """Bảng có cột column_name không (PRAGMA table_info)"""
+        return any(row[1] == column_name for row in self.query_rows(f"PRAGMA table_info({table_name})"))
     
-    def create_tables(self):
+    def create_tables(self, drop_existing=False):
+        """Tạo schema nếu chưa có (idempotent). drop_existing=True: xoá toàn bộ bảng cũ trước khi tạo."""
         conn = self.connect()
         cursor = conn.cursor()
         
-        # Xóa các bảng cũ nếu tồn tại
-        cursor.execute("DROP TABLE IF EXISTS purchase_history")
-        cursor.execute("DROP TABLE IF EXISTS products")
-        cursor.execute("DROP TABLE IF EXISTS customers")
+        if drop_existing:
+            # Xóa các bảng cũ nếu tồn tại
+            cursor.execute("DROP TABLE IF EXISTS purchase_history")
+            cursor.execute("DROP TABLE IF EXISTS products")
+            cursor.execute("DROP TABLE IF EXISTS customers")
         
-        # Tạo lại các bảng
         cursor.execute("""
-            CREATE TABLE customers (
+            CREATE TABLE IF NOT EXISTS customers (
                 customer_id INTEGER PRIMARY KEY AUTOINCREMENT,
                 name TEXT NOT NULL,
                 phone TEXT,
@@ -31,7 +173,7 @@ class DatabaseManager:
         """)
         
         cursor.execute("""
-            CREATE TABLE products (
+            CREATE TABLE IF NOT EXISTS products (
                 product_id INTEGER PRIMARY KEY AUTOINCREMENT,
                 name TEXT NOT NULL,
                 category TEXT,
@@ -41,7 +183,7 @@ class DatabaseManager:
         """)
         
         cursor.execute("""
-            CREATE TABLE purchase_history (
+            CREATE TABLE IF NOT EXISTS purchase_history (
                 purchase_id INTEGER PRIMARY KEY AUTOINCREMENT,
                 customer_id INTEGER,
                 product_id INTEGER,
@@ -53,6 +195,28 @@ class DatabaseManager:
             )
         """)
         
+        # Lịch sử mua của 1 khách theo thời gian (keyset phân trang, mọi truy vấn WHERE customer_id = ?)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_purchase_history_customer_date "
+                       "ON purchase_history(customer_id, purchase_date, purchase_id)")
+
+        # SĐT chuẩn hoá (cột sinh + index) → tra khách theo mọi định dạng số
+        phones.install(conn)
+
+        # Sự kiện view/click/add_to_cart (thô + trọng số đã rollup)
+        event_buffer.install(conn)
+
+        # Change-data-capture: bảng changelog + trigger trên 3 bảng nguồn
+        changelog.install(conn)
+        if drop_existing:
+            # Không xoá changelog (seq phải tăng liên tục) → báo consumer nạp lại toàn bộ
+            cursor.executemany("INSERT INTO changelog (table_name, op) VALUES (?, 'R')",
+                               [(t,) for t in changelog.TRACKED_TABLES])
+
+        # Thống kê lưu sẵn (system_stats/customer_stats) do trigger cập nhật tăng dần
+        stats.install(conn)
+        if drop_existing:
+            stats.recompute(conn)
+        
         conn.commit()
         conn.close()
         print("✅ Đã tạo các bảng database thành công!")
@@ -199,29 +363,35 @@ class DatabaseManager:
     
     # ==================== CÁC PHƯƠNG THỨC MỚI CẦN THIẾT ====================
     
+    @timed_query
     def get_customer_by_phone(self, phone_number):
-        """Tìm khách hàng bằng số điện thoại - PHƯƠNG THỨC QUAN TRỌNG"""
-        conn = self.connect()
+        """
+        Tìm khách hàng bằng số điện thoại - PHƯƠNG THỨC QUAN TRỌNG. Trả về dict (None nếu không có).
+        Chấp nhận mọi định dạng (0…, 84…, +84…, có dấu cách/chấm/gạch): tra bảng SĐT trong RAM, rồi index SQLite.
+        """
         try:
-            query = "SELECT * FROM customers WHERE phone = ?"
             print(f"🔍 Đang tìm khách hàng với SĐT: {phone_number}")
-            customer_df = pd.read_sql_query(query, conn, params=[phone_number])
+            phone = phones.normalize_phone(phone_number)
+            self.ensure_phone_index()
+            customer = None
+            if phone is not None and self.customers is not None and self.customers.loaded:
+                customer = self.customers.ensure_fresh().get(phone)
+            if customer is None and phone is not None:
+                customer = phones.lookup(self, phone)
             
-            if customer_df.empty:
+            if customer is None:
                 print(f"❌ Không tìm thấy khách hàng với SĐT: {phone_number}")
             else:
-                print(f"✅ Tìm thấy khách hàng: {customer_df.iloc[0]['name']}")
+                print(f"✅ Tìm thấy khách hàng: {customer['name']}")
                 
-            return customer_df
+            return customer
         except Exception as e:
             print(f"❌ Lỗi khi tìm khách hàng: {e}")
-            return pd.DataFrame()
-        finally:
-            conn.close()
+            return None
     
+    @timed_query
     def get_customer_purchase_history(self, customer_id):
         """Lấy lịch sử mua hàng của khách hàng"""
-        conn = self.connect()
         try:
             query = """
                 SELECT 
@@ -238,34 +408,94 @@ class DatabaseManager:
                 WHERE ph.customer_id = ?
                 ORDER BY ph.purchase_date DESC
             """
-            history_df = pd.read_sql_query(query, conn, params=[customer_id])
-            print(f"📊 Lấy được {len(history_df)} lịch sử mua hàng cho customer_id: {customer_id}")
-            return history_df.to_dict('records')
+            history = self.query_dicts(query, (customer_id,))
+            print(f"📊 Lấy được {len(history)} lịch sử mua hàng cho customer_id: {customer_id}")
+            return history
         except Exception as e:
             print(f"❌ Lỗi khi lấy lịch sử mua hàng: {e}")
             return []
+    
+    @timed_query
+    def get_purchase_history_page(self, customer_id, limit=HISTORY_PAGE_SIZE, cursor=None):
+        """
+        1 trang lịch sử mua (mới nhất trước) → {'items', 'next_cursor'} (next_cursor None = hết).
+        Keyset trên (purchase_date, purchase_id): mỗi trang là 1 lần đọc khoảng index, không OFFSET.
+        Giao dịch không có purchase_date nằm cuối danh sách (như ORDER BY ... DESC của SQLite).
+        cursor không hợp lệ → ValueError.
+        """
+        limit = max(1, min(int(limit), MAX_HISTORY_PAGE_SIZE))
+        after_date, after_id = decode_history_cursor(cursor) if cursor else (None, None)
+        rows = []
+        if after_date is not None or after_id is None:
+            where, params = "ph.purchase_date IS NOT NULL", [customer_id]
+            if after_date is not None:
+                where += " AND (ph.purchase_date, ph.purchase_id) < (?, ?)"
+                params += [after_date, after_id]
+            rows = self.query_dicts(_HISTORY_PAGE_SQL.format(where=where), params + [limit + 1])
+        if len(rows) <= limit:
+            # Hết giao dịch có ngày → tiếp tục với giao dịch thiếu ngày (theo purchase_id giảm dần)
+            where, params = "ph.purchase_date IS NULL", [customer_id]
+            if after_date is None and after_id is not None:
+                where += " AND ph.purchase_id < ?"
+                params.append(after_id)
+            rows += self.query_dicts(_HISTORY_PAGE_SQL.format(where=where), params + [limit + 1 - len(rows)])
+        items = rows[:limit]
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = encode_history_cursor(items[-1]["purchase_date"], items[-1]["purchase_id"])
+        return {'items': items, 'next_cursor': next_cursor}
+    
+    @timed_query
+    def find_missing_references(self, customer_ids, product_ids):
+        """customer_id / product_id chưa có trong database (kiểm tra trước khi ghi giao dịch)"""
+        conn = self.connect()
+        try:
+            missing = {}
+            for table, column, ids in (("customers", "customer_id", customer_ids),
+                                       ("products", "product_id", product_ids)):
+                ids = sorted(set(ids))
+                if not ids:
+                    missing[column] = []
+                    continue
+                placeholders = ",".join("?" * len(ids))
+                found = {r[0] for r in conn.execute(
+                    f"SELECT {column} FROM {table} WHERE {column} IN ({placeholders})", ids).fetchall()}
+                missing[column] = [i for i in ids if i not in found]
+            return missing
         finally:
             conn.close()
     
+    @timed_query
     def get_categories(self):
         """Lấy danh sách danh mục sản phẩm"""
-        conn = self.connect()
         try:
             query = "SELECT DISTINCT category FROM products WHERE category IS NOT NULL ORDER BY category"
-            categories_df = pd.read_sql_query(query, conn)
-            categories_list = categories_df['category'].tolist()
+            categories_list = self.query_column(query)
             print(f"📋 Tìm thấy {len(categories_list)} danh mục: {categories_list}")
             return categories_list
         except Exception as e:
             print(f"❌ Lỗi khi lấy danh mục: {e}")
             # Danh mục mặc định nếu có lỗi
             return ['Thực phẩm', 'Điện tử', 'Thời trang', 'Gia dụng', 'Làm đẹp', 'Sách']
-        finally:
-            conn.close()
     
+    @timed_query
     def get_products_by_category(self, category, min_price=0, max_price=100000000):
-        """Lấy sản phẩm theo danh mục và khoảng giá - ĐÃ SỬA LỖI INDENTATION"""
-        conn = self.connect()
+        """Lấy sản phẩm theo danh mục và khoảng giá (top 20 phổ biến nhất)"""
+        if self.catalog is not None and self.catalog.loaded:
+            # Index giá theo danh mục của catalog: bisect khoảng giá + chọn top 20, không truy vấn SQLite
+            index = self.catalog.ensure_fresh().price_index()
+            products_list = [{
+                'product_id': p['product_id'],
+                'name': p['name'],
+                'category': p['category'],
+                'price': p['price'],
+                'brand': p['brand'],
+                'avg_rating': p['avg_rating'] or 0,
+                'purchase_count': p['purchase_count'],
+            } for p in index.top(category, min_price, max_price, 20)]
+            print(f"🛍️ Tìm thấy {len(products_list)} sản phẩm trong danh mục '{category}'")
+            return products_list
+
         try:
             query = """
                 SELECT 
@@ -284,21 +514,16 @@ class DatabaseManager:
                     price ASC
                 LIMIT 20
             """
-            products_df = pd.read_sql_query(query, conn, params=[category, min_price, max_price])
-            
-            # Chuyển đổi sang dictionary
-            products_list = []
-            for _, row in products_df.iterrows():
-                product = {
-                    'product_id': row['product_id'],
-                    'name': row['name'],
-                    'category': row['category'],
-                    'price': float(row['price']),
-                    'brand': row['brand'],
-                    'avg_rating': float(row['avg_rating']) if row['avg_rating'] else 0,
-                    'purchase_count': row['purchase_count'] or 0
-                }
-                products_list.append(product)
+            products_list = [{
+                'product_id': product_id,
+                'name': name,
+                'category': category,
+                'price': float(price),
+                'brand': brand,
+                'avg_rating': float(avg_rating) if avg_rating else 0,
+                'purchase_count': purchase_count or 0
+            } for product_id, name, category, price, brand, avg_rating, purchase_count
+                in self.query_rows(query, (category, min_price, max_price))]
             
             print(f"🛍️ Tìm thấy {len(products_list)} sản phẩm trong danh mục '{category}'")
             return products_list
@@ -306,50 +531,30 @@ class DatabaseManager:
         except Exception as e:
             print(f"❌ Lỗi khi lấy sản phẩm theo danh mục: {e}")
             return []
-        finally:
-            conn.close()
     
+    @timed_query
     def get_customer_total_stats(self, customer_id):
-        """Lấy thống kê tổng quan của khách hàng"""
+        """Lấy thống kê tổng quan của khách hàng (đọc 1 dòng customer_stats do trigger duy trì)"""
         conn = self.connect()
         try:
-            query = """
-                SELECT 
-                    COUNT(*) as total_purchases,
-                    SUM(p.price * ph.quantity) as total_spent,
-                    AVG(ph.rating) as avg_rating
-                FROM purchase_history ph
-                JOIN products p ON ph.product_id = p.product_id
-                WHERE ph.customer_id = ?
-            """
-            stats_df = pd.read_sql_query(query, conn, params=[customer_id])
-            return {
-                'total_purchases': stats_df.iloc[0]['total_purchases'] if not stats_df.empty else 0,
-                'total_spent': stats_df.iloc[0]['total_spent'] if not stats_df.empty else 0,
-                'avg_rating': round(stats_df.iloc[0]['avg_rating'], 1) if not stats_df.empty and stats_df.iloc[0]['avg_rating'] else 0
-            }
+            return stats.read_customer_stats(conn, customer_id)
         except Exception as e:
             print(f"❌ Lỗi khi lấy thống kê khách hàng: {e}")
             return {'total_purchases': 0, 'total_spent': 0, 'avg_rating': 0}
         finally:
             conn.close()
     
+    @timed_query
     def get_system_stats(self):
-        """Thống kê hệ thống"""
+        """Thống kê hệ thống (đọc 1 dòng system_stats do trigger duy trì)"""
         conn = self.connect()
         try:
-            stats = {
-                'total_customers': pd.read_sql("SELECT COUNT(*) as count FROM customers", conn).iloc[0]['count'],
-                'total_products': pd.read_sql("SELECT COUNT(*) as count FROM products", conn).iloc[0]['count'],
-                'total_purchases': pd.read_sql("SELECT COUNT(*) as count FROM purchase_history", conn).iloc[0]['count'],
-                'total_revenue': pd.read_sql("""
-                    SELECT SUM(p.price * ph.quantity) as revenue 
-                    FROM purchase_history ph 
-                    JOIN products p ON ph.product_id = p.product_id
-                """, conn).iloc[0]['revenue'] or 0,
-                'avg_rating': pd.read_sql("SELECT AVG(rating) as avg_rating FROM purchase_history WHERE rating > 0", conn).iloc[0]['avg_rating'] or 0
-            }
-            return stats
+            system_stats = stats.read_system_stats(conn)
+            if system_stats is None:
+                # Database tạo trước khi có bảng thống kê → tính lại 1 lần
+                stats.install(conn)
+                system_stats = stats.read_system_stats(conn)
+            return system_stats
         except Exception as e:
             print(f"❌ Lỗi khi lấy thống kê hệ thống: {e}")
             return {}
@@ -364,16 +569,14 @@ class DatabaseManager:
             conn = self.connect()
             
             # Kiểm tra tables
-            tables_query = "SELECT name FROM sqlite_master WHERE type='table'"
-            tables_df = pd.read_sql_query(tables_query, conn)
-            print("📊 Tables trong database:", tables_df['name'].tolist())
+            tables = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()]
+            print("📊 Tables trong database:", tables)
             
             # Kiểm tra số lượng bản ghi
             for table in ['customers', 'products', 'purchase_history']:
-                if table in tables_df['name'].values:
-                    count_query = f"SELECT COUNT(*) as count FROM {table}"
-                    count_df = pd.read_sql_query(count_query, conn)
-                    print(f"   {table}: {count_df.iloc[0]['count']} bản ghi")
+                if table in tables:
+                    count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                    print(f"   {table}: {count} bản ghi")
             
             conn.close()
             return True
@@ -385,7 +588,7 @@ if __name__ == "__main__":
     db = DatabaseManager()
     
     print("🚀 Khởi tạo database...")
-    db.create_tables()
+    db.create_tables(drop_existing=True)
     db.insert_sample_data()
     
     print("\n🧪 Kiểm tra database...")
@@ -394,9 +597,9 @@ if __name__ == "__main__":
     print("\n🔍 Test tìm kiếm khách hàng...")
     test_phone = "0899590556"
     customer = db.get_customer_by_phone(test_phone)
-    if not customer.empty:
-        customer_id = customer.iloc[0]['customer_id']
-        print(f"✅ Tìm thấy: {customer.iloc[0]['name']} (ID: {customer_id})")
+    if customer is not None:
+        customer_id = customer['customer_id']
+        print(f"✅ Tìm thấy: {customer['name']} (ID: {customer_id})")
         
         # Test lấy lịch sử mua hàng
         history = db.get_customer_purchase_history(customer_id)
@@ -9,7 +9,13 @@ def _ensure_customer(context):
         return False, "Mình chưa biết bạn là khách nào. Bạn gửi số điện thoại (vd: 0899xxxxxx) nhé?", _quick("Tôi muốn nhập số điện thoại")
     return True, None, []
 
-def handle_turn(text: str, nlu: Dict[str, Any], context: Dict[str, Any], db, recommender) -> Tuple[str, Dict[str, Any], List[str]]:
+def _format_smart(recs, header):
+    lines = [header]
+    for r in recs:
+        lines.append(f"• {r['name']} ({r['category']}) – {r['price']:,.0f}đ — {r.get('reason','')}")
+    return "\n".join(lines)
+
+def handle_turn(text: str, nlu: Dict[str, Any], context: Dict[str, Any], db, recommender, pager=None) -> Tuple[str, Dict[str, Any], List[str]]:
     intent = nlu.get('intent', 'chitchat')
     ents = nlu.get('entities', {})
     context = dict(context or {})
@@ -20,12 +26,13 @@ def handle_turn(text: str, nlu: Dict[str, Any], context: Dict[str, Any], db, rec
         phone_raw = ents['phone']
         try:
             cust = db.get_customer_by_phone(phone_raw)
-            if not cust.empty:
-                cid = int(cust.iloc[0]['customer_id'])
+            if cust is not None:
+                cid = int(cust['customer_id'])
                 context['customer_id'] = cid
+                context.pop('smart_cursor', None)
                 if hasattr(recommender, "reset_for_new_customer"):
                     recommender.reset_for_new_customer(cid)
-                name = cust.iloc[0].get('name', 'khách hàng')
+                name = cust.get('name', 'khách hàng')
                 return (f"Đã xác nhận SĐT {phone_raw}. Xin chào {name}! "
                         f"Bạn muốn mình hỗ trợ gì?"), context, _quick("Gợi ý thông minh", "Gợi ý theo danh mục", "Xem lịch sử mua")
             else:
@@ -41,18 +48,41 @@ def handle_turn(text: str, nlu: Dict[str, Any], context: Dict[str, Any], db, rec
     if intent == 'search_customer':
         return "Bạn gửi mình số điện thoại (vd: 0899xxxxxx) để mình tìm khách hàng nhé.", context, []
 
+    # "Xem thêm" khi chưa có danh sách phân trang → coi như gợi ý thông minh (trang đầu)
+    if intent == 'show_more' and not (pager is not None and context.get('smart_cursor')):
+        intent = 'recommend_smart'
+
     if intent == 'recommend_smart':
         ok, msg, sug = _ensure_customer(context)
         if not ok: return msg, context, sug
         limit = ents.get('limit') or 5
         cid = context['customer_id']
-        recs = recommender.recommend_products(customer_id=cid, n_recommendations=limit, algorithm='hybrid')
+        if pager is not None and context.get('session_id'):
+            # Danh sách xếp hạng tính 1 lần cho phiên; "Xem thêm" đọc trang kế tiếp qua cursor
+            page = pager.page(context['session_id'], cid, limit, 'hybrid')
+            recs = page['recommendations']
+            context['smart_cursor'] = page['next_cursor']
+        else:
+            recs = recommender.recommend_products(customer_id=cid, n_recommendations=limit, algorithm='hybrid')
         if not recs:
             return "Chưa có gợi ý phù hợp. Bạn thử chọn danh mục ưa thích?", context, _quick("Điện tử", "Thời trang", "Thực phẩm")
-        lines = ["Dưới đây là gợi ý nổi bật:"]
-        for r in recs[:limit]:
-            lines.append(f"• {r['name']} ({r['category']}) – {r['price']:,.0f}đ — {r.get('reason','')}")
-        return "\n".join(lines), context, _quick("Xem thêm", "Gợi ý theo danh mục")
+        return _format_smart(recs[:limit], "Dưới đây là gợi ý nổi bật:"), context, _quick("Xem thêm", "Gợi ý theo danh mục")
+
+    if intent == 'show_more':
+        ok, msg, sug = _ensure_customer(context)
+        if not ok: return msg, context, sug
+        limit = ents.get('limit') or 5
+        try:
+            page = pager.page(context['session_id'], context['customer_id'], limit, 'hybrid',
+                              cursor=context['smart_cursor'])
+        except ValueError:
+            page = pager.page(context['session_id'], context['customer_id'], limit, 'hybrid')
+        context['smart_cursor'] = page['next_cursor']
+        recs = page['recommendations']
+        if not recs:
+            return "Mình đã gợi ý hết các sản phẩm phù hợp rồi. Bạn thử theo danh mục nhé?", context, _quick("Gợi ý theo danh mục")
+        suggestions = _quick("Xem thêm", "Gợi ý theo danh mục") if page['next_cursor'] else _quick("Gợi ý theo danh mục")
+        return _format_smart(recs, "Thêm vài gợi ý cho bạn:"), context, suggestions
 
     if intent == 'recommend_manual':
         ok, msg, sug = _ensure_customer(context)
@@ -62,32 +92,25 @@ def handle_turn(text: str, nlu: Dict[str, Any], context: Dict[str, Any], db, rec
             cats_all = db.get_categories()
             return "Bạn muốn gợi ý theo danh mục nào? (bạn có thể gõ tên danh mục)", context, cats_all[:6]
         # lấy nhanh theo danh mục
-        conn = db.connect()
-        try:
-            import pandas as pd
-            placeholders = ",".join(["?"] * len(cats))
-            sql = f"""
-                SELECT p.product_id, p.name, p.category, p.price, p.brand
-                FROM products p
-                WHERE p.category IN ({placeholders})
-                ORDER BY p.product_id DESC
-                LIMIT 5
-            """
-            df = pd.read_sql(sql, conn, params=cats)
-            if df.empty:
-                return f"Chưa có sản phẩm trong các danh mục {', '.join(cats)}.", context, _quick("Chọn danh mục khác", "Gợi ý thông minh")
-            lines = [f"Mình chọn nhanh theo danh mục {', '.join(cats)}:"]
-            for _, r in df.iterrows():
-                lines.append(f"• {r['name']} ({r['brand']}) – {r['price']:,.0f}đ")
-            return "\n".join(lines), context, _quick("Gợi ý thông minh", "Xem thêm")
-        finally:
-            conn.close()
+        placeholders = ",".join(["?"] * len(cats))
+        sql = f"""
+            SELECT p.product_id, p.name, p.category, p.price, p.brand
+            FROM products p
+            WHERE p.category IN ({placeholders})
+            ORDER BY p.product_id DESC
+            LIMIT 5
+        """
+        rows = db.query_dicts(sql, cats)
+        if not rows:
+            return f"Chưa có sản phẩm trong các danh mục {', '.join(cats)}.", context, _quick("Chọn danh mục khác", "Gợi ý thông minh")
+        lines = [f"Mình chọn nhanh theo danh mục {', '.join(cats)}:"]
+        for r in rows:
+            lines.append(f"• {r['name']} ({r['brand']}) – {r['price']:,.0f}đ")
+        return "\n".join(lines), context, _quick("Gợi ý thông minh", "Xem thêm")
 
     if intent == 'product_query':
         # tra cứu theo brand/category đơn giản
-        conn = db.connect()
         try:
-            import pandas as pd
             q = (text or '').lower()
             cats = db.get_categories()
             found_cats = [c for c in cats if c and c.lower() in q]
@@ -107,17 +130,15 @@ def handle_turn(text: str, nlu: Dict[str, Any], context: Dict[str, Any], db, rec
                 sql += " AND lower(brand) = ?"
                 params.append(brand.lower())
             sql += " ORDER BY price ASC LIMIT 5"
-            df = pd.read_sql(sql, conn, params=params)
-            if df.empty:
+            rows = db.query_dicts(sql, params)
+            if not rows:
                 return "Mình chưa tìm thấy sản phẩm khớp mô tả. Bạn có thể cho mình biết danh mục hoặc thương hiệu cụ thể hơn không?", context, _quick("Điện tử", "Thời trang", "Thực phẩm")
             lines = ["Mình thấy các sản phẩm liên quan:"]
-            for _, r in df.iterrows():
+            for r in rows:
                 lines.append(f"• {r['name']} – {r['brand']} – {r['category']} – {r['price']:,.0f}đ")
             return "\n".join(lines), context, _quick("Gợi ý thông minh", "Xem thêm")
         except Exception as e:
             return f"Không tra cứu được sản phẩm vì lỗi: {e}", context, _quick("Gợi ý thông minh")
-        finally:
-            conn.close()
 
     if intent == 'goodbye':
         return "Cảm ơn bạn đã trò chuyện. Hẹn gặp lại! 👋", context, []
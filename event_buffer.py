@@ -0,0 +1,270 @@
+import os
+import sys
+import time
+import atexit
+import threading
+from array import array
+from collections import Counter
+
+try:
+    from utils.metrics import EVENTS, EVENT_FLUSH_ROWS, EVENT_FLUSH_LATENCY
+except ImportError:
+    from metrics import EVENTS, EVENT_FLUSH_ROWS, EVENT_FLUSH_LATENCY
+
+# Loại sự kiện (lưu dạng số nhỏ) và trọng số implicit feedback khi rollup
+EVENT_TYPES = {"view": 1, "click": 2, "add_to_cart": 3}
+EVENT_NAMES = {code: name for name, code in EVENT_TYPES.items()}
+EVENT_WEIGHTS = {
+    "view": float(os.environ.get("EVENT_WEIGHT_VIEW", "0.1")),
+    "click": float(os.environ.get("EVENT_WEIGHT_CLICK", "0.3")),
+    "add_to_cart": float(os.environ.get("EVENT_WEIGHT_ADD_TO_CART", "1.0")),
+}
+
+# Cấu hình write-behind qua biến môi trường
+EVENT_FLUSH_SIZE = int(os.environ.get("EVENT_FLUSH_SIZE", "5000"))          # số sự kiện trong buffer → flush
+EVENT_FLUSH_SECONDS = float(os.environ.get("EVENT_FLUSH_SECONDS", "2"))     # tuổi tối đa của buffer
+EVENT_BUFFER_MAX = int(os.environ.get("EVENT_BUFFER_MAX", "200000"))        # vượt → bỏ sự kiện (không chặn request)
+EVENT_ROLLUP_SECONDS = float(os.environ.get("EVENT_ROLLUP_SECONDS", "60"))  # 0 = chỉ rollup thủ công
+EVENT_RETENTION_DAYS = float(os.environ.get("EVENT_RETENTION_DAYS", "7"))   # giữ sự kiện thô đã rollup
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS interaction_events (
+    event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    customer_id INTEGER NOT NULL,
+    product_id INTEGER NOT NULL,
+    event_type INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS interaction_weights (
+    customer_id INTEGER NOT NULL,
+    product_id INTEGER NOT NULL,
+    weight REAL NOT NULL,
+    event_count INTEGER NOT NULL,
+    last_event_at REAL NOT NULL,
+    PRIMARY KEY (customer_id, product_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS interaction_rollup_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    last_event_id INTEGER NOT NULL
+);
+"""
+
+
+def install(conn):
+    """Tạo bảng sự kiện thô, trọng số đã rollup và vị trí rollup (idempotent)"""
+    conn.executescript(SCHEMA)
+
+
+def parse_event(item):
+    """Kiểm tra 1 sự kiện từ JSON → (customer_id, product_id, event_code, created_at)"""
+    if not isinstance(item, dict):
+        raise ValueError("Mỗi sự kiện phải là object JSON")
+    event_type = item.get("event_type")
+    if event_type not in EVENT_TYPES:
+        raise ValueError(f"event_type phải là một trong {', '.join(EVENT_TYPES)}")
+    try:
+        customer_id = int(item["customer_id"])
+        product_id = int(item["product_id"])
+        created_at = float(item.get("timestamp") or time.time())
+    except KeyError as e:
+        raise ValueError(f"Thiếu {e.args[0]}")
+    except (TypeError, ValueError):
+        raise ValueError("customer_id, product_id phải là số nguyên, timestamp là epoch giây")
+    if customer_id <= 0 or product_id <= 0:
+        raise ValueError("customer_id và product_id phải dương")
+    return customer_id, product_id, EVENT_TYPES[event_type], created_at
+
+
+class EventBuffer:
+    """
+    Buffer write-behind cho view/click/add_to_cart: sự kiện được giữ trong RAM dưới dạng mảng cột gọn
+    (array 'q'/'b'/'d' ~17 byte/sự kiện), flush hàng loạt (1 transaction executemany) khi đủ `flush_size`
+    sự kiện hoặc buffer cũ hơn `flush_seconds`; định kỳ rollup thành trọng số theo cặp (khách, sản phẩm).
+    Request không bao giờ chờ SQLite; mất tối đa 1 buffer nếu tiến trình chết đột ngột.
+    """
+
+    def __init__(self, db, flush_size=EVENT_FLUSH_SIZE, flush_seconds=EVENT_FLUSH_SECONDS,
+                 max_buffered=EVENT_BUFFER_MAX, rollup_seconds=EVENT_ROLLUP_SECONDS):
+        self.db = db
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self.max_buffered = max_buffered
+        self.rollup_seconds = rollup_seconds
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._reset_buffer()
+        atexit.register(self.close)
+
+    def _reset_buffer(self):
+        self._customers = array("q")
+        self._products = array("q")
+        self._types = array("b")
+        self._times = array("d")
+        self._oldest = None
+
+    def __len__(self):
+        return len(self._types)
+
+    def _ensure_started(self):
+        # Khởi động lười; sau fork (serve.py) tiến trình con tự tạo thread flush riêng
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                self._reset_buffer()  # buffer kế thừa từ tiến trình cha do cha tự flush
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="event-flusher", daemon=True)
+            self._thread.start()
+
+    def add_many(self, events):
+        """Thêm các sự kiện đã kiểm tra (parse_event); trả về số sự kiện nhận (phần vượt EVENT_BUFFER_MAX bị bỏ)"""
+        self._ensure_started()
+        events = list(events)
+        accepted = 0
+        with self._lock:
+            for customer_id, product_id, code, created_at in events:
+                if len(self._types) >= self.max_buffered:
+                    break
+                self._customers.append(customer_id)
+                self._products.append(product_id)
+                self._types.append(code)
+                self._times.append(created_at)
+                accepted += 1
+            if self._oldest is None and accepted:
+                self._oldest = time.monotonic()
+            full = len(self._types) >= self.flush_size
+        for code, count in Counter(e[2] for e in events[:accepted]).items():
+            EVENTS.inc(count, event_type=EVENT_NAMES[code], result="buffered")
+        if accepted < len(events):
+            EVENTS.inc(len(events) - accepted, event_type="", result="dropped")
+        if full:
+            self._wakeup.set()
+        return accepted
+
+    def add(self, customer_id, product_id, event_type, created_at=None):
+        return self.add_many([(customer_id, product_id, EVENT_TYPES[event_type], created_at or time.time())])
+
+    def flush(self):
+        """Ghi toàn bộ buffer xuống interaction_events trong 1 transaction; trả về số sự kiện đã ghi"""
+        with self._flush_lock:
+            with self._lock:
+                columns = (self._customers, self._products, self._types, self._times)
+                self._reset_buffer()
+            n = len(columns[2])
+            if not n:
+                return 0
+            start = time.perf_counter()
+            conn = self.db.connect()
+            try:
+                conn.executemany(
+                    "INSERT INTO interaction_events (customer_id, product_id, event_type, created_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    zip(*columns),
+                )
+                conn.commit()
+            except Exception as e:
+                print(f"❌ Lỗi flush {n:,} sự kiện: {e}")
+                EVENTS.inc(n, event_type="", result="failed")
+                return 0
+            finally:
+                conn.close()
+            EVENT_FLUSH_LATENCY.observe(time.perf_counter() - start)
+            EVENT_FLUSH_ROWS.observe(n)
+            return n
+
+    def _due(self):
+        with self._lock:
+            if not len(self._types):
+                return False
+            return len(self._types) >= self.flush_size or time.monotonic() - self._oldest >= self.flush_seconds
+
+    def _run(self):
+        next_rollup = time.monotonic() + self.rollup_seconds
+        while not self._stop.is_set():
+            self._wakeup.wait(min(self.flush_seconds, 1.0))
+            self._wakeup.clear()
+            if self._due():
+                self.flush()
+            if self.rollup_seconds > 0 and time.monotonic() >= next_rollup:
+                next_rollup = time.monotonic() + self.rollup_seconds
+                try:
+                    rollup(self.db)
+                except Exception as e:
+                    print(f"❌ Lỗi rollup sự kiện: {e}")
+
+    def close(self):
+        """Dừng thread flush và ghi nốt buffer"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(5)
+        if self._pid == os.getpid():
+            self.flush()
+
+
+def rollup(db, retention_days=EVENT_RETENTION_DAYS):
+    """
+    Cộng dồn sự kiện mới (event_id > vị trí rollup lần trước) vào interaction_weights theo cặp
+    (khách, sản phẩm) bằng 1 câu INSERT ... SELECT ... GROUP BY ... ON CONFLICT; xoá sự kiện thô đã rollup
+    cũ hơn `retention_days`. Trả về số sự kiện đã rollup.
+    """
+    weight_case = " ".join(f"WHEN {EVENT_TYPES[name]} THEN {weight}" for name, weight in EVENT_WEIGHTS.items())
+    conn = db.connect()
+    try:
+        # BEGIN IMMEDIATE: nhiều tiến trình (worker serve.py) không rollup trùng cùng một đoạn sự kiện
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT last_event_id FROM interaction_rollup_state WHERE id = 1").fetchone()
+        last_id = row[0] if row else 0
+        max_id = conn.execute("SELECT MAX(event_id) FROM interaction_events").fetchone()[0]
+        if max_id is None or max_id <= last_id:
+            conn.rollback()
+            return 0
+        conn.execute(
+            f"""
+            INSERT INTO interaction_weights (customer_id, product_id, weight, event_count, last_event_at)
+            SELECT customer_id, product_id, SUM(CASE event_type {weight_case} ELSE 0 END), COUNT(*), MAX(created_at)
+            FROM interaction_events
+            WHERE event_id > ? AND event_id <= ?
+            GROUP BY customer_id, product_id
+            ON CONFLICT(customer_id, product_id) DO UPDATE SET
+                weight = weight + excluded.weight,
+                event_count = event_count + excluded.event_count,
+                last_event_at = MAX(last_event_at, excluded.last_event_at)
+            """,
+            (last_id, max_id),
+        )
+        rolled = conn.execute(
+            "SELECT COUNT(*) FROM interaction_events WHERE event_id > ? AND event_id <= ?", (last_id, max_id)
+        ).fetchone()[0]
+        conn.execute(
+            "INSERT INTO interaction_rollup_state (id, last_event_id) VALUES (1, ?) "
+            "ON CONFLICT(id) DO UPDATE SET last_event_id = excluded.last_event_id",
+            (max_id,),
+        )
+        if retention_days > 0:
+            # Giữ lại dòng max_id: bảng tạo trước khi có AUTOINCREMENT sẽ cấp lại event_id <= vị trí rollup nếu
+            # xoá hết các dòng có id lớn nhất → sự kiện mới không bao giờ được rollup
+            conn.execute("DELETE FROM interaction_events WHERE event_id < ? AND created_at < ?",
+                         (max_id, time.time() - retention_days * 86400))
+        conn.commit()
+        return rolled
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.append(os.path.dirname(current_dir))
+    from utils.database import DatabaseManager
+
+    db = DatabaseManager()
+    db.create_tables()
+    start = time.perf_counter()
+    n = rollup(db)
+    print(f"✅ Rollup {n:,} sự kiện trong {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,49 @@
+import sys
+import importlib
+import threading
+import types
+
+
+class LazyModule(types.ModuleType):
+    """
+    Proxy cho 1 module nặng (pandas, numpy, sklearn, scipy...): chỉ import thật ở lần truy cập thuộc tính đầu tiên.
+    Sau khi nạp, thuộc tính của module được chép vào proxy nên các lần truy cập sau không tốn thêm chi phí.
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__["_lazy_lock"] = threading.Lock()
+        self.__dict__["_lazy_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_lazy_module"]
+        if module is None:
+            with self.__dict__["_lazy_lock"]:
+                module = self.__dict__["_lazy_module"]
+                if module is None:
+                    module = importlib.import_module(self.__name__)
+                    self.__dict__.update(module.__dict__)
+                    self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        # Chỉ được gọi khi thuộc tính chưa có trong proxy (lần đầu, hoặc submodule nạp sau)
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_lazy_module"] is not None else "not loaded"
+        return f"<lazy module '{self.__name__}' ({state})>"
+
+
+def lazy_module(name):
+    """Trả về module đã import (nếu có) hoặc LazyModule nạp trễ"""
+    return sys.modules.get(name) or LazyModule(name)
+
+
+def preload(*names):
+    """Nạp trước các module (dùng khi warmup để request đầu tiên không chịu chi phí import)"""
+    for name in names:
+        importlib.import_module(name)
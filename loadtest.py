@@ -0,0 +1,235 @@
+# loadtest.py
+import sys
+import os
+import io
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+import contextlib
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Thêm src vào path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_dir = os.path.join(current_dir, 'src')
+sys.path.append(src_dir)
+
+from utils.database import DatabaseManager
+
+# Tỉ trọng các endpoint trong kịch bản tải (mô phỏng luồng dùng thực tế)
+ENDPOINT_MIX = {
+    "/api/customer/search": 0.30,
+    "/api/recommend/smart": 0.35,
+    "/api/recommend/manual": 0.20,
+    "/api/chat": 0.15,
+}
+
+CHAT_MESSAGES = [
+    "xin chào",
+    "gợi ý thông minh cho tôi",
+    "tôi muốn mua đồ điện tử",
+    "gợi ý theo danh mục thời trang",
+    "giá sản phẩm thương hiệu samsung bao nhiêu",
+    "tạm biệt",
+]
+
+# Biên histogram latency (ms)
+HISTOGRAM_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf")]
+
+
+class WorkloadData:
+    """Dữ liệu thật lấy từ DB để sinh payload (SĐT, customer_id, danh mục)"""
+
+    def __init__(self, db, sample_size=500):
+        conn = db.connect()
+        try:
+            rows = conn.execute(
+                "SELECT customer_id, phone FROM customers WHERE phone IS NOT NULL LIMIT ?", (sample_size,)
+            ).fetchall()
+            if not rows:
+                rows = conn.execute("SELECT customer_id, phone FROM customers LIMIT ?", (sample_size,)).fetchall()
+            self.categories = [r[0] for r in conn.execute(
+                "SELECT DISTINCT category FROM products WHERE category IS NOT NULL").fetchall()]
+        finally:
+            conn.close()
+        self.customers = rows
+
+    def payload(self, endpoint, rng):
+        customer_id, phone = rng.choice(self.customers)
+        if endpoint == "/api/customer/search":
+            return {"phone": phone}
+        if endpoint == "/api/recommend/smart":
+            return {"customer_id": customer_id, "n_recommendations": 5}
+        if endpoint == "/api/recommend/manual":
+            k = min(len(self.categories), rng.randint(1, 2))
+            return {"customer_id": customer_id, "categories": rng.sample(self.categories, k), "n_recommendations": 5}
+        return {"message": rng.choice(CHAT_MESSAGES), "customer_id": customer_id,
+                "session_id": f"load-{threading.get_ident()}"}
+
+
+class InProcessClient:
+    """Gọi Flask app qua app.test_client() — không cần mở cổng mạng"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def post(self, path, payload):
+        response = self.client.post(path, json=payload)
+        return response.status_code
+
+
+class HttpClient:
+    """Gọi server WSGI đang chạy (vd: python main.py / serve.py) qua HTTP"""
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def post(self, path, payload):
+        req = urllib.request.Request(
+            self.base_url + path, data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"}, method="POST",
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                resp.read()
+                return resp.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+def _worker(make_client, data, deadline, seed, records, lock):
+    rng = random.Random(seed)
+    client = make_client()
+    endpoints = list(ENDPOINT_MIX)
+    weights = list(ENDPOINT_MIX.values())
+    local = []
+    while time.perf_counter() < deadline:
+        endpoint = rng.choices(endpoints, weights)[0]
+        payload = data.payload(endpoint, rng)
+        start = time.perf_counter()
+        try:
+            status = client.post(endpoint, payload)
+        except Exception:
+            status = 0
+        local.append((endpoint, (time.perf_counter() - start) * 1000, status))
+    with lock:
+        records.extend(local)
+
+
+def run_level(make_client, data, concurrency, duration, seed):
+    """Chạy tải với `concurrency` client đồng thời trong `duration` giây"""
+    records, lock = [], threading.Lock()
+    start = time.perf_counter()
+    deadline = start + duration
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i in range(concurrency):
+            pool.submit(_worker, make_client, data, deadline, seed + i, records, lock)
+    elapsed = time.perf_counter() - start
+    return summarize(records, elapsed, concurrency)
+
+
+def summarize(records, elapsed, concurrency):
+    per_endpoint = {}
+    for endpoint in ENDPOINT_MIX:
+        rows = [r for r in records if r[0] == endpoint]
+        if not rows:
+            continue
+        lat = np.array([r[1] for r in rows])
+        errors = sum(1 for r in rows if r[2] == 0 or r[2] >= 400)
+        counts, _ = np.histogram(lat, bins=[0] + HISTOGRAM_BUCKETS_MS)
+        per_endpoint[endpoint] = {
+            "requests": len(rows),
+            "errors": errors,
+            "error_rate": round(errors / len(rows), 4),
+            "throughput_rps": round(len(rows) / elapsed, 2),
+            "p50_ms": round(float(np.percentile(lat, 50)), 2),
+            "p95_ms": round(float(np.percentile(lat, 95)), 2),
+            "p99_ms": round(float(np.percentile(lat, 99)), 2),
+            "histogram": {f"le_{b:g}ms": int(c) for b, c in zip(HISTOGRAM_BUCKETS_MS, counts)},
+        }
+    all_lat = np.array([r[1] for r in records]) if records else np.array([0.0])
+    total_errors = sum(1 for r in records if r[2] == 0 or r[2] >= 400)
+    return {
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 2),
+        "requests": len(records),
+        "throughput_rps": round(len(records) / elapsed, 2) if elapsed else 0.0,
+        "error_rate": round(total_errors / max(len(records), 1), 4),
+        "p50_ms": round(float(np.percentile(all_lat, 50)), 2),
+        "p95_ms": round(float(np.percentile(all_lat, 95)), 2),
+        "p99_ms": round(float(np.percentile(all_lat, 99)), 2),
+        "endpoints": per_endpoint,
+    }
+
+
+def print_level(result):
+    print(f"\n⚡ Concurrency {result['concurrency']}: {result['requests']} request trong {result['seconds']}s "
+          f"→ {result['throughput_rps']} req/s | p95 {result['p95_ms']}ms | lỗi {result['error_rate']:.1%}")
+    for endpoint, stats in result["endpoints"].items():
+        print(f"   {endpoint:<24} {stats['requests']:>6} req | {stats['throughput_rps']:>7.2f} req/s | "
+              f"p50 {stats['p50_ms']:>8.1f} | p95 {stats['p95_ms']:>8.1f} | p99 {stats['p99_ms']:>8.1f}ms | "
+              f"lỗi {stats['error_rate']:.1%}")
+        peak = max(stats["histogram"].values()) or 1
+        for bucket, count in stats["histogram"].items():
+            if count:
+                print(f"      {bucket:>12} {'█' * max(1, int(30 * count / peak))} {count}")
+
+
+def print_degradation(results):
+    print("\n📉 Suy giảm theo mức đồng thời")
+    print(f"   {'clients':>7} | {'req/s':>8} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8} | {'lỗi':>6}")
+    for r in results:
+        print(f"   {r['concurrency']:>7} | {r['throughput_rps']:>8.2f} | {r['p50_ms']:>8.1f} | "
+              f"{r['p95_ms']:>8.1f} | {r['p99_ms']:>8.1f} | {r['error_rate']:>6.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kiểm thử tải API gợi ý (in-process hoặc qua HTTP)")
+    parser.add_argument("--url", default=None, help="URL server đang chạy; bỏ trống = chạy in-process qua test_client()")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8],
+                        help="Các mức số client đồng thời (chạy lần lượt)")
+    parser.add_argument("--duration", type=float, default=10.0, help="Số giây cho mỗi mức")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Ghi kết quả JSON")
+    parser.add_argument("--verbose", action="store_true", help="Giữ log của app")
+    args = parser.parse_args()
+
+    data = WorkloadData(DatabaseManager())
+    if not data.customers:
+        print("❌ Database chưa có khách hàng — hãy seed dữ liệu trước")
+        sys.exit(1)
+
+    if args.url:
+        make_client = lambda: HttpClient(args.url)
+        target = args.url
+    else:
+        with contextlib.redirect_stdout(io.StringIO()):
+            from main import app
+        make_client = lambda: InProcessClient(app)
+        target = "in-process (app.test_client)"
+    if not args.verbose:
+        logging.disable(logging.INFO)
+
+    print(f"🔥 LOAD TEST → {target}")
+    print(f"   Mix: {', '.join(f'{k} {v:.0%}' for k, v in ENDPOINT_MIX.items())}")
+    results = []
+    with open(os.devnull, "w") as devnull:
+        for level in args.concurrency:
+            sink = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(devnull)
+            with sink:
+                result = run_level(make_client, data, level, args.duration, args.seed)
+            print_level(result)
+            results.append(result)
+
+    print_degradation(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"target": target, "mix": ENDPOINT_MIX, "levels": results}, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Kết quả: {args.output}")
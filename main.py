@@ -1,7 +1,9 @@
 import sys
 import os
-from flask import Flask, request, jsonify, render_template
-import pandas as pd
+import time
+import json
+import argparse
+from flask import Flask, request, jsonify, render_template, g, Response, send_file, stream_with_context
 import logging
 
 # Cấu hình logging
@@ -20,8 +22,19 @@ templates_dir = os.path.join(static_dir, 'templates')  # GIỮ NGUYÊN như ban
 # Import từ các module trong src
 try:
     from models.recommender import AdvancedRecommender
-    from utils.database import DatabaseManager
+    from utils.database import DatabaseManager, HISTORY_PAGE_SIZE
     from utils.data_loader import DataLoader
+    from utils.metrics import REGISTRY, HTTP_REQUESTS, HTTP_LATENCY
+    from utils import query_profiler
+    from utils import profiling
+    from utils import warmup
+    from utils import changelog
+    from utils.purchase_writer import GroupCommitWriter, WriteQueueFull, parse_purchase, PURCHASE_ASYNC, MAX_BULK
+    from utils.event_buffer import EventBuffer, parse_event
+    from models import retrain
+    from models.pagination import RecommendationPager, InvalidCursor
+    from models import streaming
+    from models.batch import BatchRecommender, customer_page, BATCH_MAX_CUSTOMERS
     print("✅ Import modules thành công")
 except ImportError as e:
     print(f"❌ Lỗi import: {e}")
@@ -38,10 +51,56 @@ try:
     db = DatabaseManager()
     recommender = AdvancedRecommender()
     data_loader = DataLoader()
+    # Ghi giao dịch qua 1 thread writer (group commit), khởi động ở lần ghi đầu tiên
+    purchase_writer = GroupCommitWriter(db)
+    # Sự kiện view/click/add_to_cart: buffer trong RAM, flush hàng loạt + rollup định kỳ
+    event_buffer = EventBuffer(db)
+    # "Xem thêm": danh sách xếp hạng tính 1 lần mỗi phiên, phục vụ theo trang bằng cursor
+    recommendation_pager = RecommendationPager(recommender)
+    # Gợi ý hàng loạt cho CRM: 1 lần nạp mô hình + chấm điểm vector hoá cho cả lô khách
+    batch_recommender = BatchRecommender(recommender)
     print("✅ Khởi tạo components thành công")
 except Exception as e:
     print(f"❌ Lỗi khởi tạo components: {e}")
 
+
+def _is_admin():
+    return profiling.is_authorized(request.headers.get('X-Admin-Token'))
+
+
+@app.before_request
+def _start_timer():
+    g.request_start = time.perf_counter()
+    query_profiler.start_request()
+    # Profiling theo yêu cầu: chỉ khi có header X-Profile / ?profile= VÀ đúng token admin
+    mode = profiling.requested_mode(request.headers.get('X-Profile') or request.args.get('profile'))
+    if mode and _is_admin():
+        try:
+            g.profile_session = profiling.start(mode)
+        except ValueError as e:  # cProfile khác đang chạy (request song song)
+            logger.warning(f"⚠️ Không bật được profiler: {e}")
+
+
+@app.after_request
+def _record_request_metrics(response):
+    """Ghi nhận số request + latency theo endpoint (dùng rule để tránh bùng nổ label)"""
+    start = g.get('request_start')
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    session = g.pop('profile_session', None)
+    if session is not None:
+        profile_id = profiling.finish(session, endpoint, request.method, response.status_code,
+                                      time.perf_counter() - start)
+        response.headers['X-Profile-Id'] = profile_id
+    if start is not None:
+        HTTP_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint, method=request.method)
+    HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=str(response.status_code))
+    if app.debug:
+        sql_count, sql_seconds = query_profiler.request_stats()
+        response.headers['X-SQL-Queries'] = str(sql_count)
+        response.headers['X-SQL-Time-Ms'] = f"{sql_seconds * 1000:.2f}"
+    return response
+
+
 @app.route('/')
 def home():
     """Trang chủ với giao diện tìm kiếm bằng số điện thoại"""
@@ -112,6 +171,7 @@ def search_customer():
     Tìm khách hàng bằng số điện thoại.
     - Khi tìm thấy: RESET trạng thái recommender cho khách hàng mới ngay lập tức.
     - FE có thể dựa vào field 'reset': true để clear UI (danh mục gợi ý & gợi ý thông minh).
+    - Chỉ kèm trang đầu lịch sử mua + tổng quan; trang sau đọc qua /api/customer/<id>/purchases?cursor=...
     Body: { "phone": "0899..." }
     """
     try:
@@ -128,7 +188,7 @@ def search_customer():
         # Tìm khách hàng trong database (yêu cầu DatabaseManager có hàm này)
         customer = db.get_customer_by_phone(phone_number)
         
-        if customer.empty:
+        if customer is None:
             logger.warning(f"❌ Không tìm thấy khách hàng: {phone_number}")
             return jsonify({
                 'success': False,
@@ -136,12 +196,13 @@ def search_customer():
                 'message': 'Không tìm thấy khách hàng với số điện thoại này'
             }), 404
         
-        customer_info = customer.iloc[0].to_dict()
+        customer_info = customer
         customer_id = int(customer_info['customer_id'])
         logger.info(f"✅ Tìm thấy khách hàng: {customer_info.get('name', 'N/A')} (ID={customer_id})")
 
-        # Lấy lịch sử mua hàng của khách hàng
-        purchase_history = db.get_customer_purchase_history(customer_id)
+        # Trang đầu lịch sử mua hàng (mới nhất trước) + tổng quan từ customer_stats
+        history = db.get_purchase_history_page(customer_id)
+        purchase_summary = db.get_customer_total_stats(customer_id)
 
         # 🔄 RESET recommender state NGAY TẠI ĐÂY
         if hasattr(recommender, "reset_for_new_customer"):
@@ -160,7 +221,9 @@ def search_customer():
             'success': True,
             'found': True,
             'customer': customer_info,
-            'purchase_history': purchase_history,
+            'purchase_history': history['items'],
+            'purchase_history_next_cursor': history['next_cursor'],
+            'purchase_summary': purchase_summary,
             'reset': True,  # FE dựa vào đây để clear 2 panel gợi ý
             'message': 'Tìm thấy khách hàng thành công'
         })
@@ -173,6 +236,26 @@ def search_customer():
         }), 500
 
 
+@app.route('/api/customer/<int:customer_id>/purchases', methods=['GET'])
+def get_customer_purchases(customer_id):
+    """
+    Lịch sử mua theo trang (mới nhất trước), keyset trên (purchase_date, purchase_id).
+    Query: ?limit=20&cursor=<next_cursor của trang trước>
+    """
+    limit = request.args.get('limit', HISTORY_PAGE_SIZE, type=int)
+    try:
+        page = db.get_purchase_history_page(customer_id, limit, request.args.get('cursor') or None)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({
+        'success': True,
+        'customer_id': customer_id,
+        'purchases': page['items'],
+        'count': len(page['items']),
+        'next_cursor': page['next_cursor'],
+    })
+
+
 @app.route('/api/categories', methods=['GET'])
 def get_categories():
     """Lấy danh sách danh mục sản phẩm"""
@@ -196,14 +279,16 @@ def recommend_manual():
     """
     Gợi ý sản phẩm theo danh mục.
     - Nhận customer_id để đảm bảo đúng phiên; nếu khác phiên hiện tại → reset.
-    - Loại trừ sản phẩm đã mua.
-    Body: { "customer_id": 1, "categories": ["Điện tử"], "n_recommendations": 5 }
+    - Loại trừ sản phẩm đã mua; lọc khoảng giá nếu có min_price/max_price.
+    Body: { "customer_id": 1, "categories": ["Điện tử"], "n_recommendations": 5, "min_price": 0, "max_price": 500000 }
     """
     try:
         data = request.get_json() or {}
         customer_id = data.get('customer_id')
         categories = data.get('categories', [])
         n_recommendations = int(data.get('n_recommendations', 5))
+        min_price = float(data['min_price']) if data.get('min_price') is not None else None
+        max_price = float(data['max_price']) if data.get('max_price') is not None else None
         
         logger.info(f"🎯 Gợi ý manual - Customer ID: {customer_id}, Danh mục: {categories}, Số lượng: {n_recommendations}")
         
@@ -231,44 +316,24 @@ def recommend_manual():
                     recommender._session_recommended_ids = set()
             logger.info("🔄 Manual: đã reset phiên do customer_id thay đổi.")
 
-        # Lấy sản phẩm theo danh mục, loại trừ đã mua
-        conn = db.connect()
-        try:
-            params = [int(customer_id)]
-            where_cat = ""
-            if categories:
-                placeholders = ",".join(["?"] * len(categories))
-                where_cat = f" AND p.category IN ({placeholders})"
-                params += categories
-
-            sql = f"""
-                SELECT p.product_id, p.name, p.category, p.price, p.brand
-                FROM products p
-                WHERE p.product_id NOT IN (
-                    SELECT product_id FROM purchase_history WHERE customer_id = ?
-                )
-                {where_cat}
-                ORDER BY RANDOM()
-                LIMIT {n_recommendations}
-            """
-            df = pd.read_sql(sql, conn, params=params)
-
-            recs = []
-            for _, r in df.iterrows():
-                recs.append({
-                    "product_id": int(r["product_id"]),
-                    "name": r["name"],
-                    "category": r["category"],
-                    "price": float(r["price"]),
-                    "brand": r["brand"],
-                    "score": 0.7,
-                    "reason": "Gợi ý theo danh mục đã chọn"
-                })
-
-            return jsonify({"success": True, "recommendations": recs, "count": len(recs)})
-
-        finally:
-            conn.close()
+        # Lấy mẫu ngẫu nhiên theo danh mục từ catalog trong RAM, loại trừ đã mua
+        purchased = recommender._get_user_purchased_ids(int(customer_id))
+        products = recommender.sample_products(n_recommendations, categories, exclude=purchased,
+                                               seed=data.get('seed'), min_price=min_price, max_price=max_price)
+
+        recs = []
+        for r in products:
+            recs.append({
+                "product_id": int(r["product_id"]),
+                "name": r["name"],
+                "category": r["category"],
+                "price": float(r["price"]),
+                "brand": r["brand"],
+                "score": 0.7,
+                "reason": "Gợi ý theo danh mục đã chọn"
+            })
+
+        return jsonify({"success": True, "recommendations": recs, "count": len(recs)})
         
     except Exception as e:
         logger.error(f"Lỗi gợi ý manual: {e}")
@@ -328,6 +393,161 @@ def health_check():
         }), 500
     
 
+@app.route('/api/ready', methods=['GET'])
+def readiness():
+    """Readiness cho load balancer: 503 cho tới khi warm-up (catalog, mô hình, request giả lập) hoàn tất"""
+    state = warmup.STATE.to_dict()
+    return jsonify(state), (200 if state['ready'] else 503)
+
+
+@app.route('/api/changes', methods=['GET'])
+def get_changes():
+    """Changelog (CDC) của customers/products/purchase_history: các thay đổi có seq > since"""
+    since = request.args.get('since', 0, type=int)
+    limit = min(max(request.args.get('limit', 1000, type=int), 1), 10000)
+    tables = [t for t in request.args.get('tables', '').split(',') if t]
+    unknown = set(tables) - set(changelog.TRACKED_TABLES)
+    if unknown:
+        return jsonify({'success': False, 'error': f'Bảng không được theo dõi: {", ".join(sorted(unknown))}'}), 400
+    conn = db.connect()
+    try:
+        changes = changelog.changes_since(conn, since, limit, tables or None)
+        latest = changelog.latest_seq(conn)
+    finally:
+        conn.close()
+    return jsonify({
+        'success': True,
+        'changes': changes,
+        'next_since': changes[-1]['seq'] if changes else since,
+        'latest_seq': latest,
+    })
+
+
+def _record_purchases(items):
+    """Kiểm tra + ghi danh sách giao dịch; trả về (body, status)"""
+    rows = []
+    for i, item in enumerate(items):
+        try:
+            rows.append(parse_purchase(item))
+        except ValueError as e:
+            return {'success': False, 'error': f'Giao dịch #{i}: {e}'}, 400
+
+    missing = db.find_missing_references([r[0] for r in rows], [r[1] for r in rows])
+    if missing['customer_id'] or missing['product_id']:
+        return {'success': False, 'error': 'Khách hàng/sản phẩm không tồn tại', 'missing': missing}, 404
+
+    # ?async=1 hoặc PURCHASE_ASYNC=1 → trả về ngay khi đã xếp hàng (chưa đảm bảo đã ghi xuống đĩa)
+    async_mode = request.args.get('async', '1' if PURCHASE_ASYNC else '0') == '1'
+    try:
+        purchase_ids = purchase_writer.submit(rows, wait=not async_mode)
+    except WriteQueueFull as e:
+        return {'success': False, 'error': str(e)}, 503
+    except TimeoutError as e:
+        return {'success': False, 'error': str(e)}, 504
+
+    if async_mode:
+        return {'success': True, 'queued': len(rows), 'durable': False}, 202
+    return {'success': True, 'count': len(rows), 'purchase_ids': purchase_ids, 'durable': True}, 201
+
+
+@app.route('/api/purchase', methods=['POST'])
+def record_purchase():
+    """Ghi 1 giao dịch: {customer_id, product_id, quantity?, rating?, purchase_date?}"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'error': 'No JSON data provided'}), 400
+    body, status = _record_purchases([data])
+    if status == 201:
+        body['purchase_id'] = body['purchase_ids'][0]
+    return jsonify(body), status
+
+
+@app.route('/api/purchase/bulk', methods=['POST'])
+def record_purchases_bulk():
+    """Ghi nhiều giao dịch trong 1 request: {"purchases": [...]} (tối đa MAX_BULK), tất cả hoặc không gì cả"""
+    data = request.get_json(silent=True) or {}
+    purchases = data.get('purchases') if isinstance(data, dict) else None
+    if not isinstance(purchases, list) or not purchases:
+        return jsonify({'success': False, 'error': 'Thiếu danh sách purchases'}), 400
+    if len(purchases) > MAX_BULK:
+        return jsonify({'success': False, 'error': f'Tối đa {MAX_BULK} giao dịch mỗi request'}), 413
+    body, status = _record_purchases(purchases)
+    return jsonify(body), status
+
+
+@app.route('/api/events', methods=['POST'])
+def record_events():
+    """
+    Ghi nhận sự kiện implicit: {customer_id, product_id, event_type: view|click|add_to_cart, timestamp?}
+    hoặc {"events": [...]}. Trả về 202 ngay (write-behind), không chờ SQLite.
+    """
+    data = request.get_json(silent=True)
+    items = data.get('events') if isinstance(data, dict) and 'events' in data else [data]
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'error': 'Thiếu danh sách events'}), 400
+    if len(items) > MAX_BULK:
+        return jsonify({'success': False, 'error': f'Tối đa {MAX_BULK} sự kiện mỗi request'}), 413
+    try:
+        events = [parse_event(item) for item in items]
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    accepted = event_buffer.add_many(events)
+    if not accepted:
+        return jsonify({'success': False, 'error': 'Buffer sự kiện đang đầy'}), 503
+    return jsonify({'success': True, 'accepted': accepted, 'dropped': len(events) - accepted}), 202
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Xuất metric (request, latency từng giai đoạn, fallback, cache) theo định dạng Prometheus"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/api/debug/sql', methods=['GET'])
+def debug_sql():
+    """Top câu SQL theo tổng thời gian + slow-query log (chỉ bật ở debug mode)"""
+    if not app.debug:
+        return jsonify({'success': False, 'error': 'Chỉ khả dụng ở debug mode'}), 404
+    n = request.args.get('n', 20, type=int)
+    return jsonify({
+        'success': True,
+        'slow_threshold_ms': query_profiler.PROFILER.slow_ms,
+        'top': query_profiler.PROFILER.top(n),
+        'slow_queries': query_profiler.PROFILER.slow_queries(n),
+    })
+
+
+@app.route('/api/admin/profiles', methods=['GET'])
+def list_profiles():
+    """Danh sách profile gần đây (cần X-Admin-Token)"""
+    if not _is_admin():
+        return jsonify({'success': False, 'error': 'Không có quyền'}), 403
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({'success': True, 'profiles': profiling.list_profiles(limit)})
+
+
+@app.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """Chi tiết 1 profile: top hàm theo cumulative time"""
+    if not _is_admin():
+        return jsonify({'success': False, 'error': 'Không có quyền'}), 403
+    profile = profiling.load_profile(profile_id)
+    if not profile:
+        return jsonify({'success': False, 'error': 'Không tìm thấy profile'}), 404
+    return jsonify({'success': True, 'profile': profile})
+
+
+@app.route('/api/admin/profiles/<profile_id>/download', methods=['GET'])
+def download_profile(profile_id):
+    """Tải file profile: ?format=collapsed (flamegraph) | prof (pstats) | json"""
+    if not _is_admin():
+        return jsonify({'success': False, 'error': 'Không có quyền'}), 403
+    path = profiling.profile_path(profile_id, request.args.get('format', 'collapsed'))
+    if not path:
+        return jsonify({'success': False, 'error': 'Không tìm thấy file profile'}), 404
+    return send_file(path, as_attachment=True, download_name=os.path.basename(path))
+
+
 @app.route('/api/recommend/smart', methods=['POST'])
 def recommend_smart():
     """
@@ -383,6 +603,122 @@ def recommend_smart():
         }), 500
 
 
+@app.route('/api/recommend/smart/page', methods=['POST'])
+def recommend_smart_page():
+    """
+    Gợi ý thông minh theo trang ("Xem thêm"): trang đầu tính danh sách xếp hạng cho phiên, các trang sau
+    gửi lại `next_cursor` của trang trước → không lặp/bỏ sót sản phẩm giữa các trang.
+    Body: { "customer_id": 1, "session_id": "web-abc123", "n_recommendations": 5, "algorithm": "hybrid", "cursor": null }
+    """
+    try:
+        data = request.get_json() or {}
+        customer_id = data.get('customer_id') or getattr(recommender, "_current_customer_id", None)
+        if not customer_id:
+            return jsonify({'success': False, 'error': 'Thiếu customer_id'}), 400
+        session_id = data.get('session_id') or f"sid_{request.remote_addr}"
+
+        page = recommendation_pager.page(
+            session_id,
+            int(customer_id),
+            n=int(data.get('n_recommendations', 5)),
+            algorithm=data.get('algorithm') or 'hybrid',
+            cursor=data.get('cursor'),
+        )
+        return jsonify({
+            'success': True,
+            'recommendations': page['recommendations'],
+            'count': len(page['recommendations']),
+            'next_cursor': page['next_cursor'],
+            'model_version': page['model_version'],
+        })
+    except InvalidCursor as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Lỗi gợi ý theo trang: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/recommend/smart/stream', methods=['GET', 'POST'])
+def recommend_smart_stream():
+    """
+    Gợi ý thông minh dạng stream: gửi ngay xếp hạng từ nguồn rẻ (popular), sau đó gửi bản xếp hạng cập nhật
+    mỗi khi content / collaborative / svd xong. Mỗi chunk có version, completeness, complete.
+    - NDJSON (mặc định) hoặc SSE (?format=sse hoặc Accept: text/event-stream; GET dùng được với EventSource)
+    Body/query: { "customer_id": 1, "n_recommendations": 5, "algorithm": "hybrid" }
+    """
+    data = request.get_json(silent=True) or request.args
+    customer_id = data.get('customer_id') or getattr(recommender, "_current_customer_id", None)
+    if not customer_id:
+        return jsonify({'success': False, 'error': 'Thiếu customer_id'}), 400
+    try:
+        customer_id = int(customer_id)
+        n_recommendations = int(data.get('n_recommendations', 5))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'customer_id và n_recommendations phải là số nguyên'}), 400
+    algorithm = data.get('algorithm') or 'hybrid'
+
+    use_sse = (request.args.get('format') == 'sse'
+               or request.accept_mimetypes.best == streaming.SSE_MIMETYPE)
+    chunks = streaming.iter_chunks(recommender, customer_id, n_recommendations, algorithm)
+    body = streaming.sse(chunks) if use_sse else streaming.ndjson(chunks)
+    return Response(
+        stream_with_context(body),
+        mimetype=streaming.SSE_MIMETYPE if use_sse else streaming.NDJSON_MIMETYPE,
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@app.route('/api/recommend/batch', methods=['POST'])
+def recommend_batch():
+    """
+    Gợi ý cho nhiều khách trong 1 request (chiến dịch CRM).
+    Body: { "customer_ids": [1, 2, 3], "n_recommendations": 10 }
+       hoặc duyệt toàn bộ khách theo cursor: { "after_id": 0, "limit": 1000, "n_recommendations": 10 }
+    "stream": true (hoặc Accept: application/x-ndjson) → NDJSON, mỗi khách 1 dòng, dòng cuối { "done": true, ... }
+    """
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'error': 'Body phải là object JSON'}), 400
+    try:
+        n_recommendations = int(data.get('n_recommendations', 10))
+        if 'customer_ids' in data:
+            # Chuỗi "123" cũng lặp được → phải chặn trước, nếu không sẽ thành khách 1, 2, 3
+            if not isinstance(data['customer_ids'], list):
+                return jsonify({'success': False, 'error': 'customer_ids phải là danh sách'}), 400
+            customer_ids = [int(c) for c in data['customer_ids']]
+            if len(customer_ids) > BATCH_MAX_CUSTOMERS:
+                return jsonify({'success': False,
+                                'error': f'Tối đa {BATCH_MAX_CUSTOMERS} khách mỗi request'}), 413
+            next_after_id = None
+        else:
+            limit = min(max(int(data.get('limit', 1000)), 1), BATCH_MAX_CUSTOMERS)
+            customer_ids = customer_page(db, int(data.get('after_id', 0)), limit)
+            next_after_id = customer_ids[-1] if len(customer_ids) == limit else None
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'customer_ids, after_id, limit, n_recommendations phải là số nguyên'}), 400
+
+    results = batch_recommender.iter_results(customer_ids, n_recommendations)
+    if data.get('stream') or request.accept_mimetypes.best == streaming.NDJSON_MIMETYPE:
+        def lines():
+            for item in results:
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+            yield json.dumps({'done': True, 'count': len(customer_ids), 'next_after_id': next_after_id}) + "\n"
+        return Response(stream_with_context(lines()), mimetype=streaming.NDJSON_MIMETYPE,
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    try:
+        items = list(results)
+    except Exception as e:
+        logger.error(f"Lỗi gợi ý hàng loạt: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    return jsonify({
+        'success': True,
+        'results': items,
+        'count': len(items),
+        'next_after_id': next_after_id,
+    })
+
+
 # (Tuỳ chọn) API reset thủ công, dùng khi cần
 @app.route('/api/session/reset', methods=['POST'])
 def reset_session():
@@ -440,6 +776,7 @@ def chat():
         context = store.get(sid, cid)
         if cid and (context.get('customer_id') != int(cid)):
             context = store.reset(sid, customer_id=int(cid))
+        context['session_id'] = sid
 
         # === Dialog manager ===
         from bot.dialog import handle_turn
@@ -448,7 +785,8 @@ def chat():
             nlu=nlu,
             context=context,
             db=db,
-            recommender=recommender
+            recommender=recommender,
+            pager=recommendation_pager
         )
 
         store.set(sid, context_upd)
@@ -467,6 +805,17 @@ def chat():
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Chạy server gợi ý sản phẩm")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--debug', action='store_true', help="Bật debug mode của Flask (reloader, header X-SQL-*)")
+    parser.add_argument('--seed-sample-data', action='store_true',
+                        help="XOÁ toàn bộ dữ liệu hiện có rồi nạp dữ liệu mẫu (chỉ dùng cho demo/test)")
+    args = parser.parse_args()
+    # Profiler SQL mặc định tắt; debug mode bật để có header X-SQL-* và /api/debug/sql (trừ khi SQL_PROFILER=0)
+    if args.debug and os.environ.get("SQL_PROFILER") != "0":
+        query_profiler.enable()
+
     print("🚀 Starting Smart Product Recommendation System...")
     print(f"📁 Current directory: {current_dir}")
     print(f"📁 Static directory: {static_dir}")
@@ -490,23 +839,37 @@ if __name__ == '__main__':
         print("❌ Thư mục templates KHÔNG tồn tại")
         print(f"   Đường dẫn: {templates_dir}")
     
-    # Kiểm tra database
+    # Kiểm tra database: tạo schema nếu thiếu, KHÔNG xoá dữ liệu trừ khi chỉ định --seed-sample-data
     try:
-        db.create_tables()
-        db.insert_sample_data()
-        print("✅ Database initialized")
+        if args.seed_sample_data:
+            db.create_tables(drop_existing=True)
+            db.insert_sample_data()
+            print("✅ Database đã được nạp lại dữ liệu mẫu")
+        else:
+            db.create_tables()
+            print("✅ Database initialized")
     except Exception as e:
         print(f"❌ Database error: {e}")
     
+    # Retrain nền theo chu kỳ / số lượt mua mới, hot swap mô hình (RETRAIN_ENABLED=0 để tắt). Warm-up nạp mô hình
+    # CURRENT hoặc publish mô hình đầu tiên qua scheduler rồi mới khởi động nó → không huấn luyện 'initial' hai lần
+    scheduler = retrain.create_scheduler(recommender, db)
+    # Warm-up ở thread nền: /api/ready trả 503 cho tới khi xong
+    warmup.start_warmup(recommender, db, scheduler=scheduler)
+    
     print("\n🌐 Starting Flask server...")
     print("🔧 Available APIs:")
     print("   GET  /api/health - Kiểm tra hệ thống")
+    print("   GET  /api/ready - Sẵn sàng nhận traffic (sau warm-up)")
+    print("   GET  /api/metrics - Metric Prometheus (latency theo endpoint/giai đoạn, fallback)")
+    print("   GET  /api/debug/sql - Top truy vấn + slow-query log (debug mode)")
+    print("   GET  /api/admin/profiles - Danh sách profile theo request (X-Admin-Token)")
     print("   POST /api/customer/search - Tìm khách hàng bằng SĐT (có reset)")
     print("   GET  /api/categories - Lấy danh sách danh mục")
     print("   POST /api/recommend/manual - Gợi ý theo danh mục (auto-reset nếu đổi khách)")
     print("   POST /api/recommend/smart - Gợi ý thông minh (auto-reset nếu đổi khách)")
     print("   POST /api/session/reset - Reset phiên recommender (tuỳ chọn)")
     print("\n📞 Test với SĐT mẫu: 0899590556")
-    print("✅ System ready! Open: http://localhost:5000")
+    print(f"✅ System ready! Open: http://localhost:{args.port}")
     
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    app.run(debug=args.debug, host=args.host, port=args.port)
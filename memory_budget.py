@@ -0,0 +1,63 @@
+import os
+
+try:
+    from utils.metrics import STAGE_MEMORY_PEAK, MEMORY_MODE, current_algorithm
+except ImportError:
+    from metrics import STAGE_MEMORY_PEAK, MEMORY_MODE, current_algorithm
+
+# Ngân sách bộ nhớ cho 1 cấu trúc dữ liệu trung gian của recommender (MB, 0 = không giới hạn)
+DEFAULT_BUDGET_MB = float(os.environ.get("RECOMMENDER_MEMORY_BUDGET_MB", "1024"))
+
+FLOAT_BYTES = 8
+# pivot_table tạo thêm bản sao trung gian (groupby + unstack) → ước lượng gấp đôi ma trận kết quả
+PIVOT_OVERHEAD = 2.0
+# CSR: data float64 + indices int32 (+ indptr không đáng kể)
+SPARSE_ENTRY_BYTES = FLOAT_BYTES + 4
+
+
+def dense_bytes(rows, cols, overhead=1.0):
+    return int(rows * cols * FLOAT_BYTES * overhead)
+
+
+def sparse_bytes(nnz):
+    return int(nnz * SPARSE_ENTRY_BYTES)
+
+
+def nbytes(obj):
+    """Dung lượng thực tế của ndarray / scipy sparse / DataFrame"""
+    if obj is None:
+        return 0
+    if hasattr(obj, "memory_usage") and hasattr(obj, "columns"):
+        return int(obj.memory_usage(index=False, deep=False).sum())
+    if hasattr(obj, "nnz"):
+        return int(obj.data.nbytes + obj.indices.nbytes + obj.indptr.nbytes)
+    return int(getattr(obj, "nbytes", 0))
+
+
+class MemoryBudget:
+    """
+    Ước lượng bộ nhớ trước mỗi bước nặng và quyết định chế độ thực thi:
+    vừa budget → cách làm gốc (dense), vượt budget → chế độ rẻ hơn (sparse / theo từng dòng / fallback).
+    """
+
+    def __init__(self, limit_mb=None):
+        self.limit_mb = DEFAULT_BUDGET_MB if limit_mb is None else float(limit_mb)
+
+    @property
+    def limit_bytes(self):
+        return int(self.limit_mb * 1024 * 1024)
+
+    def allows(self, stage, estimated_bytes, cheaper_mode):
+        """True nếu bước `stage` được chạy đầy đủ; False → caller chuyển sang `cheaper_mode`"""
+        ok = self.limit_mb <= 0 or estimated_bytes <= self.limit_bytes
+        MEMORY_MODE.inc(stage=stage, mode="full" if ok else cheaper_mode)
+        if not ok:
+            print(f"⚠️ {stage}: ước lượng {estimated_bytes / 1024 ** 2:.1f}MB > budget {self.limit_mb:.0f}MB "
+                  f"→ chuyển sang chế độ {cheaper_mode}")
+        return ok
+
+    def record(self, stage, *objects):
+        """Ghi nhận dung lượng thực tế của các cấu trúc vừa cấp phát (peak theo stage)"""
+        total = sum(nbytes(o) for o in objects)
+        STAGE_MEMORY_PEAK.set_max(total, algorithm=current_algorithm(), stage=stage)
+        return total
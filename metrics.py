@@ -0,0 +1,218 @@
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+# Biên histogram thời gian (giây) — đủ rộng cho cả truy vấn SQL lẫn pipeline hybrid
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Thuật toán đang chạy trong request hiện tại (gắn làm label cho các span bên trong)
+_current_algorithm = ContextVar("current_algorithm", default="none")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def set_max(self, value, **labels):
+        """Chỉ ghi nếu lớn hơn giá trị hiện tại (dùng cho peak)"""
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            if value > self._values.get(key, float("-inf")):
+                self._values[key] = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # key -> [bucket_counts(list), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][idx] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._series.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                labels = _format_labels(self.labelnames, key, 'le="%s"' % le)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """Xuất toàn bộ metric theo Prometheus text format (version 0.0.4)"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUESTS = REGISTRY.counter("http_requests_total", "Số request HTTP", ("endpoint", "method", "status"))
+HTTP_LATENCY = REGISTRY.histogram("http_request_duration_seconds", "Thời gian xử lý request HTTP",
+                                  ("endpoint", "method"))
+RECOMMENDATIONS = REGISTRY.counter("recommendations_total", "Số lần gọi gợi ý theo thuật toán", ("algorithm",))
+RECOMMEND_LATENCY = REGISTRY.histogram("recommend_duration_seconds", "Thời gian gợi ý theo thuật toán",
+                                       ("algorithm",))
+STAGE_LATENCY = REGISTRY.histogram("recommender_stage_duration_seconds", "Thời gian từng giai đoạn của thuật toán",
+                                   ("algorithm", "stage"))
+DB_LATENCY = REGISTRY.histogram("db_query_duration_seconds", "Thời gian các truy vấn của DatabaseManager",
+                                ("method",))
+FALLBACKS = REGISTRY.counter("recommender_fallback_total",
+                             "Số lần rơi về get_diverse_popular_products", ("algorithm", "reason"))
+STAGE_MEMORY_PEAK = REGISTRY.gauge("recommender_stage_peak_bytes",
+                                   "Dung lượng lớn nhất của cấu trúc dữ liệu chính trong từng giai đoạn",
+                                   ("algorithm", "stage"))
+MEMORY_MODE = REGISTRY.counter("recommender_memory_mode_total",
+                               "Chế độ thực thi được chọn theo memory budget", ("stage", "mode"))
+CACHE_REQUESTS = REGISTRY.counter("cache_requests_total", "Số lần tra cache theo kết quả hit/miss",
+                                  ("cache", "result"))
+MODEL_RETRAINS = REGISTRY.counter("recommender_model_retrains_total", "Số lần huấn luyện lại mô hình theo kết quả",
+                                  ("reason", "result"))
+MODEL_TRAINED_AT = REGISTRY.gauge("recommender_model_trained_timestamp_seconds",
+                                  "Thời điểm huấn luyện của mô hình đang phục vụ")
+WRITES = REGISTRY.counter("purchase_writes_total", "Số giao dịch ghi qua group commit theo kết quả", ("result",))
+WRITE_BATCH_ROWS = REGISTRY.histogram("purchase_write_batch_rows", "Số dòng mỗi transaction group commit",
+                                      buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000))
+WRITE_COMMIT_LATENCY = REGISTRY.histogram("purchase_write_commit_seconds", "Thời gian ghi + commit mỗi lô")
+WRITE_QUEUE_DEPTH = REGISTRY.gauge("purchase_write_queue_depth", "Số lệnh ghi đang chờ trong hàng đợi")
+EVENTS = REGISTRY.counter("interaction_events_total", "Sự kiện view/click/add_to_cart theo kết quả",
+                          ("event_type", "result"))
+EVENT_FLUSH_ROWS = REGISTRY.histogram("interaction_event_flush_rows", "Số sự kiện mỗi lần flush",
+                                      buckets=(10, 100, 500, 1000, 5000, 10000, 50000, 200000))
+EVENT_FLUSH_LATENCY = REGISTRY.histogram("interaction_event_flush_seconds", "Thời gian ghi 1 lần flush sự kiện")
+
+
+@contextmanager
+def algorithm_context(algorithm):
+    """Gắn tên thuật toán cho các span chạy bên trong"""
+    token = _current_algorithm.set(algorithm)
+    try:
+        yield
+    finally:
+        _current_algorithm.reset(token)
+
+
+def current_algorithm():
+    return _current_algorithm.get()
+
+
+@contextmanager
+def span(stage):
+    """Đo thời gian 1 giai đoạn (sql, pivot, svds, diversification, hydration...) của thuật toán hiện tại"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - start, algorithm=_current_algorithm.get(), stage=stage)
+
+
+def traced(stage):
+    """Decorator: bọc toàn bộ 1 phương thức trong span(stage)"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_query(func):
+    """Decorator đo thời gian 1 phương thức truy vấn của DatabaseManager"""
+    name = func.__name__
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            DB_LATENCY.observe(time.perf_counter() - start, method=name)
+    return wrapper
+
+
+def record_fallback(reason):
+    FALLBACKS.inc(algorithm=_current_algorithm.get(), reason=reason)
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
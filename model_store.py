@@ -0,0 +1,237 @@
+import os
+import sys
+import json
+import time
+import shutil
+
+try:
+    from utils.lazy_imports import lazy_module
+except ImportError:
+    from lazy_imports import lazy_module
+
+pd = lazy_module("pandas")
+np = lazy_module("numpy")
+sparse = lazy_module("scipy.sparse")
+
+# Thư mục artifact mô hình dùng khi serve (mặc định data/model cạnh database)
+DEFAULT_MODEL_DIR = os.environ.get("RECOMMENDER_MODEL_DIR") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data", "model")
+META_FILE = "meta.json"
+# Registry nhiều phiên bản: <root>/versions/<version>/ + file CURRENT chứa tên phiên bản đang phục vụ
+VERSIONS_DIR = "versions"
+CURRENT_FILE = "CURRENT"
+FACTOR_NAMES = ("user_means", "U", "sigma", "Vt")
+
+
+class RecommenderModel:
+    """
+    Mô hình huấn luyện sẵn cho CF/SVD: ma trận user × item (dense hoặc CSR), chỉ mục user/product
+    và các nhân tử SVD. Được dùng chung (chỉ đọc) bởi mọi request thay vì dựng lại trong từng request.
+    """
+
+    def __init__(self, matrix, user_ids, product_ids, factors=None, version=None, trained_at=None):
+        self.matrix = matrix
+        self.user_ids = pd.Index(user_ids)
+        self.product_ids = pd.Index(product_ids)
+        self.factors = factors  # (user_means, U, sigma, Vt) hoặc None nếu ma trận quá nhỏ
+        self.version = version or time.strftime("%Y%m%d-%H%M%S")
+        self.trained_at = trained_at or time.time()
+
+    @classmethod
+    def train(cls, recommender, k=20, version=None):
+        """Dựng ma trận + phân rã SVD một lần (tôn trọng memory budget của recommender)"""
+        start = time.perf_counter()
+        matrix, user_ids, product_ids = recommender.get_interaction_matrix()
+        if matrix is None:
+            return None
+        factors = recommender.factorize(matrix, k=k)
+        model = cls(matrix, user_ids, product_ids, factors, version=version)
+        print(f"🧠 Đã huấn luyện mô hình {model.version}: {len(user_ids):,} khách × {len(product_ids):,} sản phẩm "
+              f"trong {time.perf_counter() - start:.2f}s")
+        return model
+
+    def save(self, path):
+        """
+        Ghi artifact ra thư mục `path` (mỗi mảng 1 file .npy để nạp lại bằng mmap).
+        Ghi vào thư mục tạm rồi đổi tên → tiến trình đang đọc không bao giờ thấy artifact dở dang.
+        """
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        tmp = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        is_sparse = sparse.issparse(self.matrix)
+        if is_sparse:
+            csr = self.matrix.tocsr()
+            np.save(os.path.join(tmp, "matrix_data.npy"), csr.data)
+            np.save(os.path.join(tmp, "matrix_indices.npy"), csr.indices)
+            np.save(os.path.join(tmp, "matrix_indptr.npy"), csr.indptr)
+        else:
+            np.save(os.path.join(tmp, "matrix.npy"), np.ascontiguousarray(self.matrix))
+        np.save(os.path.join(tmp, "user_ids.npy"), np.asarray(self.user_ids))
+        np.save(os.path.join(tmp, "product_ids.npy"), np.asarray(self.product_ids))
+        if self.factors is not None:
+            for name, array in zip(FACTOR_NAMES, self.factors):
+                np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(array))
+
+        meta = dict(self.summary(), shape=list(self.matrix.shape))
+        with open(os.path.join(tmp, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+
+        old = f"{path}.old-{os.getpid()}"
+        if os.path.isdir(path):
+            os.rename(path, old)
+        os.rename(tmp, path)
+        shutil.rmtree(old, ignore_errors=True)
+        print(f"💾 Đã lưu mô hình {self.version} vào {path}")
+        return path
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Nạp artifact; mmap=True → các mảng được memory-map (chỉ đọc), nhiều worker dùng chung page cache
+        thay vì mỗi tiến trình giữ 1 bản sao. `path` là registry thì nạp phiên bản CURRENT.
+        """
+        path = resolve_model_path(path)
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        mode = "r" if mmap else None
+
+        def _load(name):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode)
+
+        if meta.get("sparse"):
+            matrix = sparse.csr_matrix(
+                (_load("matrix_data"), _load("matrix_indices"), _load("matrix_indptr")),
+                shape=tuple(meta["shape"]), copy=False,
+            )
+        else:
+            matrix = _load("matrix")
+        factors = None
+        if meta.get("rank"):
+            factors = tuple(_load(name) for name in FACTOR_NAMES)
+        return cls(matrix, _load("user_ids"), _load("product_ids"), factors,
+                   version=meta["version"], trained_at=meta["trained_at"])
+
+    def summary(self):
+        return {
+            "version": self.version,
+            "trained_at": self.trained_at,
+            "users": len(self.user_ids),
+            "products": len(self.product_ids),
+            "sparse": hasattr(self.matrix, "nnz"),
+            "rank": 0 if self.factors is None else len(self.factors[2]),
+        }
+
+
+def current_version(root):
+    """Tên phiên bản trong file CURRENT của registry, None nếu chưa có"""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def resolve_model_path(path):
+    """Thư mục artifact thực: versions/<CURRENT> nếu `path` là registry, ngược lại chính `path`"""
+    version = current_version(path)
+    return os.path.join(path, VERSIONS_DIR, version) if version else path
+
+
+def list_versions(root):
+    """Các phiên bản hoàn chỉnh (có meta.json) trong registry, cũ → mới"""
+    versions_dir = os.path.join(root, VERSIONS_DIR)
+    try:
+        names = os.listdir(versions_dir)
+    except OSError:
+        return []
+    return sorted(n for n in names if os.path.isfile(os.path.join(versions_dir, n, META_FILE)))
+
+
+def save_version(root, model):
+    """Lưu mô hình thành phiên bản mới trong registry (chưa phục vụ) → đường dẫn thư mục phiên bản"""
+    base = model.version
+    suffix = 0
+    while os.path.exists(os.path.join(root, VERSIONS_DIR, model.version)):
+        suffix += 1
+        model.version = f"{base}-{suffix}"
+    return model.save(os.path.join(root, VERSIONS_DIR, model.version))
+
+
+def set_current(root, version):
+    """Trỏ CURRENT sang `version` bằng os.replace (nguyên tử: người đọc thấy phiên bản cũ hoặc mới, không dở dang)"""
+    if version not in list_versions(root):
+        raise ValueError(f"Không có phiên bản {version} trong {root}")
+    tmp = os.path.join(root, f"{CURRENT_FILE}.tmp-{os.getpid()}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(root, CURRENT_FILE))
+
+
+def publish(root, model):
+    """Lưu phiên bản mới rồi chuyển CURRENT sang nó"""
+    save_version(root, model)
+    set_current(root, model.version)
+    return model.version
+
+
+def rollback(root, version=None):
+    """Chuyển CURRENT về `version`, mặc định phiên bản liền trước phiên bản hiện tại"""
+    if version is None:
+        current = current_version(root)
+        older = [v for v in list_versions(root) if current is None or v < current]
+        if not older:
+            raise ValueError("Không có phiên bản cũ hơn để rollback")
+        version = older[-1]
+    set_current(root, version)
+    return version
+
+
+def gc_versions(root, keep=5):
+    """Xoá phiên bản cũ, giữ `keep` phiên bản mới nhất và luôn giữ phiên bản CURRENT"""
+    versions = list_versions(root)
+    protected = set(versions[-keep:] if keep > 0 else []) | {current_version(root)}
+    removed = []
+    for version in versions:
+        if version not in protected:
+            # Worker đang mmap file cũ vẫn đọc được (inode chỉ giải phóng khi đóng map)
+            shutil.rmtree(os.path.join(root, VERSIONS_DIR, version), ignore_errors=True)
+            removed.append(version)
+    return removed
+
+
+def read_version(path):
+    """Phiên bản của artifact tại `path` (registry → theo CURRENT; đọc meta.json), None nếu chưa có"""
+    try:
+        with open(os.path.join(resolve_model_path(path), META_FILE), encoding="utf-8") as f:
+            return json.load(f).get("version")
+    except (OSError, ValueError):
+        return None
+
+
+if __name__ == "__main__":
+    import argparse
+
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.append(os.path.dirname(current_dir))
+    from models.recommender import AdvancedRecommender
+
+    parser = argparse.ArgumentParser(description="Huấn luyện và lưu artifact mô hình CF/SVD")
+    parser.add_argument("--out", default=DEFAULT_MODEL_DIR)
+    parser.add_argument("--rank", type=int, default=20)
+    parser.add_argument("--single", action="store_true",
+                        help="Ghi thẳng vào --out (1 artifact) thay vì thêm phiên bản vào registry")
+    args = parser.parse_args()
+
+    model = RecommenderModel.train(AdvancedRecommender(), k=args.rank)
+    if model is None:
+        print("❌ Chưa có dữ liệu tương tác để huấn luyện")
+        sys.exit(1)
+    if args.single:
+        model.save(args.out)
+    else:
+        print(f"✅ CURRENT → {publish(args.out, model)}")
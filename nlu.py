@@ -1,7 +1,9 @@
 import re
 from typing import Dict, Any, List
 
-PHONE_RE = re.compile(r'(0|\+?84)(\d{9,10})\b')
+PHONE_RE = re.compile(r'(0|\+?84)(\d{9,10})(?!\d)')
+# Dấu cách và dấu chấm/gạch nằm giữa các chữ số (0899.590.556, 0899-590-556) được bỏ trước khi tìm SĐT
+_PHONE_SEPARATORS = re.compile(r'\s+|(?<=\d)[.\-](?=\d)')
 NUM_RE = re.compile(r'\b(\d{1,2})\b', re.UNICODE)
 
 BASIC_INTENTS = {
@@ -11,6 +13,7 @@ BASIC_INTENTS = {
     'search_customer': ['tìm khách', 'tìm sđt', 'tìm số', 'khách hàng'],
     'recommend_smart': ['gợi ý thông minh', 'gợi ý smart', 'đề xuất thông minh'],
     'recommend_manual': ['gợi ý theo danh mục', 'gợi ý danh mục', 'theo danh mục'],
+    'show_more': ['xem thêm', 'gợi ý thêm', 'thêm nữa'],
     'product_query': ['sản phẩm', 'mặt hàng', 'giá', 'thương hiệu', 'brand', 'bao nhiêu'],
 }
 
@@ -22,7 +25,7 @@ def detect_intent_entities(text: str, known_categories: List[str]) -> Dict[str,
     """
     Kết quả:
     {
-      'intent': 'recommend_manual' | 'recommend_smart' | 'search_customer' | 'product_query' | 'chitchat',
+      'intent': 'recommend_manual' | 'recommend_smart' | 'show_more' | 'search_customer' | 'product_query' | 'chitchat',
       'entities': { 'phone': '0899...', 'categories': [...], 'limit': 5 }
     }
     """
@@ -42,7 +45,7 @@ def detect_intent_entities(text: str, known_categories: List[str]) -> Dict[str,
 
     # phone
     phone = None
-    m = PHONE_RE.search(text.replace(' ', ''))
+    m = PHONE_RE.search(_PHONE_SEPARATORS.sub('', text))
     if m:
         phone = m.group(0)
 
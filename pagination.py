@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    from utils.metrics import record_cache
+except ImportError:
+    from metrics import record_cache
+
+# Cấu hình phân trang gợi ý ("Xem thêm") qua biến môi trường
+PAGE_DEPTH = int(os.environ.get("RECOMMEND_PAGE_DEPTH", "100"))          # độ dài danh sách xếp hạng tính 1 lần
+PAGE_TTL = float(os.environ.get("RECOMMEND_PAGE_TTL_SECONDS", "900"))    # tuổi tối đa của danh sách trong cache
+PAGE_MAX_SESSIONS = int(os.environ.get("RECOMMEND_PAGE_MAX_SESSIONS", "1000"))
+MAX_PAGE_SIZE = 50
+# Số product_id đã hiển thị tối đa mang theo trong cursor (giữ các ID mới nhất)
+MAX_CURSOR_SHOWN = 500
+
+
+class InvalidCursor(ValueError):
+    """Cursor không giải mã được hoặc không thuộc phiên này → API trả 400"""
+
+
+def encode_cursor(session_key, version, offset, shown=()):
+    """
+    Cursor mờ: vị trí trong danh sách xếp hạng + các product_id đã hiển thị của chuỗi trang này
+    (để worker khác/danh sách hết hạn tính lại vẫn loại được phần đã xem)
+    """
+    shown = list(shown)[-MAX_CURSOR_SHOWN:]
+    raw = json.dumps({"s": session_key, "v": version, "o": offset, "x": shown}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        return data["s"], data["v"], int(data["o"]), [int(pid) for pid in data.get("x", [])]
+    except Exception:
+        raise InvalidCursor("cursor không hợp lệ")
+
+
+class _RankedList:
+    __slots__ = ("items", "version", "created_at")
+
+    def __init__(self, items, version):
+        self.items = items
+        self.version = version
+        self.created_at = time.monotonic()
+
+
+class RecommendationPager:
+    """
+    Phân trang gợi ý ổn định trong 1 phiên: danh sách xếp hạng dài (`depth` sản phẩm) được tính MỘT lần cho mỗi
+    (phiên, khách, thuật toán, phiên bản mô hình) rồi cắt trang bằng cursor mờ (offset trong danh sách đó) →
+    trang sau không lặp/bỏ sót do nhiễu ngẫu nhiên của pipeline. Danh sách mới (hết hạn, đổi mô hình, worker
+    khác không có cache) loại các sản phẩm đã hiển thị mang trong cursor và trong phiên (`_session_recommended_ids`).
+    """
+
+    def __init__(self, recommender, depth=PAGE_DEPTH, ttl=PAGE_TTL, max_sessions=PAGE_MAX_SESSIONS):
+        self.recommender = recommender
+        self.depth = depth
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._lists = OrderedDict()  # session_key -> _RankedList (LRU)
+        self._lock = threading.Lock()
+        # Trạng thái phiên của recommender dùng chung (_current_customer_id, _session_recommended_ids) bị đọc-sửa-ghi
+        # khi tính danh sách/ghi nhận trang → tuần tự hoá để 2 request song song không ghi đè tập đã hiển thị của nhau
+        self._session_lock = threading.Lock()
+
+    @staticmethod
+    def session_key(session_id, customer_id, algorithm):
+        raw = f"{session_id}|{customer_id}|{algorithm}".encode()
+        return hashlib.sha1(raw).hexdigest()[:16]
+
+    def _model_version(self):
+        return getattr(self.recommender.model, "version", None)
+
+    def _get(self, key, version):
+        with self._lock:
+            ranked = self._lists.get(key)
+            if ranked is None:
+                return None
+            if ranked.version != version or (self.ttl > 0 and time.monotonic() - ranked.created_at > self.ttl):
+                del self._lists[key]
+                return None
+            self._lists.move_to_end(key)
+            return ranked
+
+    def _put(self, key, ranked):
+        with self._lock:
+            self._lists[key] = ranked
+            self._lists.move_to_end(key)
+            while len(self._lists) > self.max_sessions:
+                self._lists.popitem(last=False)
+
+    def _compute(self, customer_id, algorithm, version, exclude=()):
+        recommender = self.recommender
+        with self._session_lock:
+            if recommender._current_customer_id != customer_id:
+                recommender.reset_for_new_customer(customer_id)
+            # recommend_products ghi mọi ID trả về vào _session_recommended_ids; ở đây tập đó chỉ nên chứa các
+            # sản phẩm đã thực sự hiển thị → giữ bản chụp trước khi tính
+            session_shown = set(recommender._session_recommended_ids)
+            shown = session_shown | set(exclude)
+            items = recommender.recommend_products(customer_id, self.depth + len(shown), algorithm)
+            recommender._session_recommended_ids = session_shown
+        items = [p for p in items if p["product_id"] not in shown][:self.depth]
+        return _RankedList(items, version)
+
+    def page(self, session_id, customer_id, n=10, algorithm="hybrid", cursor=None):
+        """
+        Trang gợi ý tiếp theo → {recommendations, next_cursor (None = hết), model_version, offset}.
+        cursor=None → trang đầu (tính lại danh sách xếp hạng cho phiên).
+        """
+        n = max(1, min(int(n), MAX_PAGE_SIZE))
+        key = self.session_key(session_id, customer_id, algorithm)
+        version = self._model_version()
+        offset = 0
+        shown = []
+        ranked = None
+        if cursor:
+            cursor_key, cursor_version, offset, shown = decode_cursor(cursor)
+            if cursor_key != key or offset < 0:
+                raise InvalidCursor("cursor không thuộc phiên/khách hàng này")
+            ranked = self._get(key, version)
+            if ranked is None or cursor_version != version:
+                # Danh sách đã hết hạn/bị thay (mô hình mới) hoặc nằm ở worker khác: tính lại, loại phần đã hiển
+                # thị (mang trong cursor), bắt đầu từ đầu danh sách mới
+                ranked, offset = None, 0
+        record_cache("recommend_pages", ranked is not None)
+        if ranked is None:
+            ranked = self._compute(customer_id, algorithm, version, exclude=shown)
+            self._put(key, ranked)
+
+        items = ranked.items[offset:offset + n]
+        page_ids = [p["product_id"] for p in items]
+        with self._session_lock:
+            # Recommender dùng chung có thể đã chuyển sang khách khác → không ghi vào tập loại trừ của khách đó
+            if self.recommender._current_customer_id == customer_id:
+                self.recommender._session_recommended_ids.update(page_ids)
+        next_offset = offset + len(items)
+        next_cursor = None
+        if next_offset < len(ranked.items):
+            next_cursor = encode_cursor(key, version, next_offset, shown + page_ids)
+        return {
+            "recommendations": items,
+            "next_cursor": next_cursor,
+            "model_version": version,
+            "offset": offset,
+        }
+
+    def invalidate(self, session_id=None, customer_id=None, algorithm="hybrid"):
+        """Bỏ danh sách của 1 phiên (hoặc toàn bộ nếu không chỉ định)"""
+        with self._lock:
+            if session_id is None:
+                self._lists.clear()
+            else:
+                self._lists.pop(self.session_key(session_id, customer_id, algorithm), None)
@@ -0,0 +1,202 @@
+import os
+import time
+import threading
+
+try:
+    from utils.metrics import record_cache
+    from utils import changelog
+except ImportError:
+    from metrics import record_cache
+    import changelog
+
+# Dạng chuẩn của SĐT: "0" + số quốc gia, bỏ khoảng trắng/dấu phân cách.
+# +84 899 590 556 / 84899590556 / 0084-899-590-556 / 0899.590.556 / 899590556 → 0899590556
+COLUMN = "phone_normalized"
+INDEX = "idx_customers_phone_normalized"
+_WHITESPACE = " \t\n\r"
+_SEPARATORS = (" ", ".", "-", "(", ")")
+
+# Thời gian sống của bảng tra SĐT trong RAM trước khi đồng bộ lại từ changelog (giây)
+DIRECTORY_TTL = float(os.environ.get("CUSTOMER_DIRECTORY_TTL_SECONDS", "60"))
+# Quá số khách này thì không giữ bảng tra trong RAM (chỉ dùng index SQLite)
+DIRECTORY_MAX_CUSTOMERS = int(os.environ.get("CUSTOMER_DIRECTORY_MAX_CUSTOMERS", "500000"))
+# Số thay đổi tối đa áp dụng tăng dần; nhiều hơn → nạp lại toàn bộ
+SYNC_MAX_CHANGES = int(os.environ.get("CUSTOMER_DIRECTORY_SYNC_MAX_CHANGES", "5000"))
+
+
+def normalize_phone(raw):
+    """SĐT → dạng chuẩn (None nếu rỗng). Phải khớp từng bước với sql_expression()"""
+    if raw is None:
+        return None
+    s = str(raw).strip(_WHITESPACE)
+    for ch in _SEPARATORS:
+        s = s.replace(ch, "")
+    if not s:
+        return None
+    if s.startswith("+84"):
+        return "0" + s[3:].lstrip("0")
+    if s.startswith("0084"):
+        return "0" + s[4:].lstrip("0")
+    if s.startswith("84") and len(s) in (11, 12):
+        return "0" + s[2:]
+    if s.startswith("0"):
+        return s
+    return "0" + s
+
+
+def sql_expression(column="phone"):
+    """
+    Biểu thức SQLite tương đương normalize_phone (dùng cho cột sinh phone_normalized). SĐT đã ở dạng chuẩn
+    (chỉ gồm chữ số, bắt đầu bằng 0 nhưng không phải 0084) đi nhánh nhanh, không phải chạy chuỗi replace
+    """
+    s = f"trim({column}, char(32, 9, 10, 13))"
+    for ch in _SEPARATORS:
+        s = f"replace({s}, '{ch}', '')"
+    return (
+        f"CASE WHEN {column} GLOB '0[0-9]*' AND NOT {column} GLOB '*[^0-9]*' "
+        f"AND NOT {column} GLOB '0084*' THEN {column} "
+        f"WHEN {s} = '' THEN NULL "
+        f"WHEN {s} LIKE '+84%' THEN '0' || ltrim(substr({s}, 4), '0') "
+        f"WHEN {s} LIKE '0084%' THEN '0' || ltrim(substr({s}, 5), '0') "
+        f"WHEN {s} LIKE '84%' AND length({s}) IN (11, 12) THEN '0' || substr({s}, 3) "
+        f"WHEN {s} LIKE '0%' THEN {s} "
+        f"ELSE '0' || {s} END"
+    )
+
+
+def install(conn):
+    """
+    Cột sinh customers.phone_normalized (VIRTUAL: SQLite tự tính khi ghi, mọi đường nạp dữ liệu đều được chuẩn
+    hoá mà không cần sửa) + index trên cột đó (idempotent, áp dụng được cho database cũ)
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_xinfo(customers)").fetchall()}
+    if COLUMN not in columns:
+        conn.execute(f"ALTER TABLE customers ADD COLUMN {COLUMN} TEXT "
+                     f"GENERATED ALWAYS AS ({sql_expression()}) VIRTUAL")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {INDEX} ON customers({COLUMN})")
+
+
+def lookup(db, phone):
+    """Khách có SĐT chuẩn `phone` (customer_id nhỏ nhất nếu trùng) qua index — dict hoặc None"""
+    return db.query_one(f"SELECT * FROM customers WHERE {COLUMN} = ? ORDER BY customer_id LIMIT 1", (phone,))
+
+
+class CustomerDirectory:
+    """
+    Bảng tra SĐT chuẩn → khách hàng trong RAM (dict, O(1)), đồng bộ tăng dần từ changelog của bảng customers.
+    Không thấy trong bảng tra (khách vừa tạo, chưa tới lượt đồng bộ) → DatabaseManager tra tiếp qua index.
+    """
+
+    def __init__(self, db, ttl=DIRECTORY_TTL, max_customers=DIRECTORY_MAX_CUSTOMERS):
+        self.db = db
+        self.ttl = ttl
+        self.max_customers = max_customers
+        self.by_phone = {}   # phone_normalized -> tuple các cột của customers
+        self.phone_of = {}   # customer_id -> phone_normalized (để gỡ SĐT cũ khi khách đổi số/bị xoá)
+        self.columns = ()
+        self.loaded_at = None
+        self.changelog_seq = 0
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self.loaded_at is not None
+
+    def is_fresh(self):
+        return self.loaded and (self.ttl <= 0 or time.time() - self.loaded_at < self.ttl)
+
+    def _select(self, conn, where="", params=()):
+        cursor = conn.execute(f"SELECT * FROM customers {where} ORDER BY customer_id", params)
+        return tuple(d[0] for d in cursor.description), cursor.fetchall()
+
+    @staticmethod
+    def _index(columns, rows, by_phone, phone_of):
+        id_col, phone_col = columns.index("customer_id"), columns.index(COLUMN)
+        for row in rows:
+            phone_of[row[id_col]] = row[phone_col]
+            if row[phone_col] is not None:
+                by_phone.setdefault(row[phone_col], row)  # trùng SĐT → giữ customer_id nhỏ nhất
+
+    def refresh(self):
+        """Nạp lại toàn bộ bảng tra (bỏ qua nếu quá DIRECTORY_MAX_CUSTOMERS khách)"""
+        self.db.ensure_phone_index()
+        conn = self.db.connect()
+        try:
+            seq = changelog.latest_seq(conn)
+            count = conn.execute("SELECT COUNT(*) FROM customers").fetchone()[0]
+            if count > self.max_customers:
+                print(f"⚠️ {count:,} khách > {self.max_customers:,}: tra SĐT chỉ qua index SQLite")
+                with self._lock:
+                    self.by_phone, self.phone_of, self.loaded_at = {}, {}, None
+                return self
+            columns, rows = self._select(conn)
+        finally:
+            conn.close()
+        by_phone, phone_of = {}, {}
+        self._index(columns, rows, by_phone, phone_of)
+        with self._lock:
+            self.columns = columns
+            self.by_phone = by_phone
+            self.phone_of = phone_of
+            self.loaded_at = time.time()
+            self.changelog_seq = seq
+        print(f"📇 Danh bạ SĐT: {len(by_phone):,} số ({len(phone_of):,} khách)")
+        return self
+
+    def sync(self):
+        """
+        Cập nhật tăng dần từ changelog: nạp lại các khách có thay đổi và mọi khách dùng chung SĐT cũ/mới của họ.
+        Gặp mốc reset hoặc quá nhiều thay đổi → nạp lại toàn bộ.
+        """
+        conn = self.db.connect()
+        try:
+            changes = changelog.changes_since(conn, self.changelog_seq, SYNC_MAX_CHANGES + 1, ("customers",))
+            if not changes:
+                self.loaded_at = time.time()
+                return 0
+            if len(changes) > SYNC_MAX_CHANGES or any(c["op"] == "R" for c in changes):
+                conn.close()
+                conn = None
+                self.refresh()
+                return len(changes)
+            customer_ids = sorted({c["row_id"] for c in changes if c["row_id"] is not None})
+            placeholders = ",".join("?" * len(customer_ids))
+            columns, changed = self._select(conn, f"WHERE customer_id IN ({placeholders})", customer_ids)
+            phone_col = columns.index(COLUMN)
+            phones = {self.phone_of.get(cid) for cid in customer_ids} | {row[phone_col] for row in changed}
+            phones = sorted(p for p in phones if p is not None)
+            if phones:
+                _, sharing = self._select(conn, f"WHERE {COLUMN} IN ({','.join('?' * len(phones))})", phones)
+            else:
+                sharing = []
+        finally:
+            if conn is not None:
+                conn.close()
+
+        with self._lock:
+            by_phone, phone_of = dict(self.by_phone), dict(self.phone_of)
+            for cid in customer_ids:
+                phone_of.pop(cid, None)
+            for phone in phones:
+                by_phone.pop(phone, None)
+            self._index(columns, sharing, by_phone, phone_of)
+            self._index(columns, changed, by_phone, phone_of)
+            self.columns = columns
+            self.by_phone = by_phone
+            self.phone_of = phone_of
+            self.loaded_at = time.time()
+            self.changelog_seq = changes[-1]["seq"]
+        return len(changes)
+
+    def ensure_fresh(self):
+        if not self.loaded:
+            self.refresh()
+        elif not self.is_fresh():
+            self.sync()
+        return self
+
+    def get(self, phone):
+        """Khách (dict) theo SĐT đã chuẩn hoá, None nếu không có trong bảng tra"""
+        row = self.by_phone.get(phone)
+        record_cache("customer_phones", row is not None)
+        return None if row is None else dict(zip(self.columns, row))
@@ -0,0 +1,203 @@
+import os
+import sys
+import hmac
+import json
+import time
+import uuid
+import pstats
+import cProfile
+import threading
+from collections import Counter
+
+# Token admin bắt buộc để bật profiling theo request (không đặt → tắt hẳn tính năng)
+ADMIN_TOKEN = os.environ.get("PROFILE_ADMIN_TOKEN")
+PROFILE_DIR = os.environ.get("PROFILE_DIR") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data", "profiles")
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "50"))
+SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", "0.002"))
+
+MODES = ("cprofile", "sample")
+TOP_N = 30
+
+
+def requested_mode(value):
+    """Giá trị header X-Profile / ?profile= → 'cprofile' | 'sample' | None"""
+    if not value:
+        return None
+    value = value.strip().lower()
+    if value in ("1", "true", "yes"):
+        return "cprofile"
+    return value if value in MODES else None
+
+
+def is_authorized(token):
+    return bool(ADMIN_TOKEN) and bool(token) and hmac.compare_digest(str(token), ADMIN_TOKEN)
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class CProfileSession:
+    """Đo deterministic bằng cProfile trong luồng của request"""
+
+    mode = "cprofile"
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        stats = pstats.Stats(self.profile)
+        top = []
+        for (filename, line, name), (cc, nc, tt, ct, callers) in stats.stats.items():
+            top.append({
+                "function": f"{name} ({os.path.basename(filename)}:{line})",
+                "calls": nc,
+                "total_ms": round(tt * 1000, 3),
+                "cumulative_ms": round(ct * 1000, 3),
+            })
+        top.sort(key=lambda x: x["cumulative_ms"], reverse=True)
+
+        # Collapsed stack suy ra từ đồ thị caller → callee của cProfile (xấp xỉ theo tottime)
+        collapsed = Counter()
+        for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+            path = [func]
+            seen = {func}
+            while True:
+                parents = stats.stats.get(path[-1], (0, 0, 0, 0, {}))[4]
+                if not parents:
+                    break
+                parent = max(parents, key=lambda p: parents[p][3])  # caller đóng góp nhiều nhất
+                if parent in seen:
+                    break
+                seen.add(parent)
+                path.append(parent)
+            key = ";".join(f"{n} ({os.path.basename(f)}:{l})" for f, l, n in reversed(path))
+            collapsed[key] += int(tt * 1_000_000)  # micro giây
+        return top[:TOP_N], collapsed
+
+    def dump(self, base):
+        """Ghi file .prof (đọc lại bằng pstats / snakeviz)"""
+        self.profile.dump_stats(base + ".prof")
+
+
+class SamplingSession:
+    """Sampling profiler: 1 thread phụ chụp stack của luồng request mỗi SAMPLE_INTERVAL giây"""
+
+    mode = "sample"
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        total = sum(self.samples.values()) or 1
+        inclusive, self_samples = Counter(), Counter()
+        for stack, count in self.samples.items():
+            frames = stack.split(";")
+            for fn in set(frames):
+                inclusive[fn] += count
+            self_samples[frames[-1]] += count
+        top = [{
+            "function": fn,
+            "samples": count,
+            "cumulative_ms": round(count * self.interval * 1000, 3),
+            "cumulative_pct": round(100.0 * count / total, 2),
+            "self_pct": round(100.0 * self_samples.get(fn, 0) / total, 2),
+        } for fn, count in inclusive.most_common(TOP_N)]
+        return top, self.samples
+
+
+def start(mode):
+    session = CProfileSession() if mode == "cprofile" else SamplingSession()
+    session.start()
+    return session
+
+
+def finish(session, endpoint, method, status, duration):
+    """Dừng profiler, lưu kết quả vào PROFILE_DIR, trả về profile id"""
+    top, collapsed = session.stop()
+    profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    meta = {
+        "id": profile_id,
+        "mode": session.mode,
+        "endpoint": endpoint,
+        "method": method,
+        "status": status,
+        "duration_ms": round(duration * 1000, 2),
+        "timestamp": time.time(),
+        "top_functions": top,
+    }
+    base = os.path.join(PROFILE_DIR, profile_id)
+    with open(base + ".collapsed", "w", encoding="utf-8") as f:
+        for stack, count in collapsed.most_common():
+            f.write(f"{stack} {count}\n")
+    dump = getattr(session, "dump", None)  # chỉ cProfile có file .prof
+    if dump:
+        dump(base)
+    with open(base + ".json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    _cleanup()
+    return profile_id
+
+
+def _cleanup():
+    """Chỉ giữ PROFILE_KEEP profile gần nhất"""
+    ids = sorted(f[:-5] for f in os.listdir(PROFILE_DIR) if f.endswith(".json"))
+    for profile_id in ids[:-PROFILE_KEEP] if PROFILE_KEEP > 0 else []:
+        for ext in (".json", ".collapsed", ".prof"):
+            path = os.path.join(PROFILE_DIR, profile_id + ext)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def list_profiles(limit=50):
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    ids = sorted((f[:-5] for f in os.listdir(PROFILE_DIR) if f.endswith(".json")), reverse=True)[:limit]
+    result = []
+    for profile_id in ids:
+        meta = load_profile(profile_id)
+        if meta:
+            meta.pop("top_functions", None)
+            result.append(meta)
+    return result
+
+
+def load_profile(profile_id):
+    path = profile_path(profile_id, "json")
+    if not path:
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def profile_path(profile_id, fmt):
+    """Đường dẫn file của profile (fmt: json | collapsed | prof), None nếu không có"""
+    if fmt not in ("json", "collapsed", "prof") or os.path.basename(profile_id) != profile_id:
+        return None
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.{fmt}")
+    return path if os.path.exists(path) else None
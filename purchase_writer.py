@@ -0,0 +1,205 @@
+import os
+import time
+import queue
+import atexit
+import threading
+from datetime import datetime
+
+try:
+    from utils.metrics import WRITE_BATCH_ROWS, WRITE_COMMIT_LATENCY, WRITE_QUEUE_DEPTH, WRITES
+except ImportError:
+    from metrics import WRITE_BATCH_ROWS, WRITE_COMMIT_LATENCY, WRITE_QUEUE_DEPTH, WRITES
+
+# Cấu hình group commit qua biến môi trường
+WRITE_BATCH_SIZE = int(os.environ.get("WRITE_BATCH_SIZE", "500"))        # số dòng tối đa mỗi transaction
+WRITE_BATCH_MS = float(os.environ.get("WRITE_BATCH_MS", "5"))            # thời gian gom tối đa sau item đầu tiên
+WRITE_QUEUE_SIZE = int(os.environ.get("WRITE_QUEUE_SIZE", "10000"))      # số lệnh ghi chờ tối đa (backpressure)
+WRITE_TIMEOUT = float(os.environ.get("WRITE_TIMEOUT_SECONDS", "10"))
+PURCHASE_ASYNC = os.environ.get("PURCHASE_ASYNC", "0") == "1"            # 1 = trả về ngay khi đã xếp hàng
+WRITE_WAL = os.environ.get("WRITE_WAL", "1") != "0"
+
+MAX_BULK = 1000
+
+INSERT_SQL = ("INSERT INTO purchase_history (customer_id, product_id, quantity, rating, purchase_date) "
+              "VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))")
+
+
+class WriteQueueFull(Exception):
+    """Hàng đợi ghi đầy quá thời gian chờ → API trả 503"""
+
+
+def parse_purchase(item):
+    """Kiểm tra 1 giao dịch từ JSON → tuple (customer_id, product_id, quantity, rating, purchase_date)"""
+    if not isinstance(item, dict):
+        raise ValueError("Mỗi giao dịch phải là object JSON")
+    try:
+        customer_id = int(item["customer_id"])
+        product_id = int(item["product_id"])
+        quantity = int(item.get("quantity", 1))
+        rating = int(item.get("rating", 5))
+    except KeyError as e:
+        raise ValueError(f"Thiếu {e.args[0]}")
+    except (TypeError, ValueError):
+        raise ValueError("customer_id, product_id, quantity, rating phải là số nguyên")
+    if customer_id <= 0 or product_id <= 0:
+        raise ValueError("customer_id và product_id phải dương")
+    if quantity < 1:
+        raise ValueError("quantity phải >= 1")
+    if not 1 <= rating <= 5:
+        raise ValueError("rating phải từ 1 đến 5")
+
+    purchase_date = item.get("purchase_date")
+    if purchase_date is not None:
+        try:
+            purchase_date = datetime.fromisoformat(str(purchase_date)).strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            raise ValueError("purchase_date phải theo định dạng ISO (YYYY-MM-DD[ HH:MM:SS])")
+    return customer_id, product_id, quantity, rating, purchase_date
+
+
+class _Pending:
+    __slots__ = ("rows", "done", "purchase_ids", "error")
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.done = threading.Event()
+        self.purchase_ids = None
+        self.error = None
+
+
+class GroupCommitWriter:
+    """
+    Ghi purchase_history qua 1 thread writer duy nhất: gom các lệnh ghi đang chờ thành 1 transaction
+    (tối đa `batch_size` dòng hoặc `batch_ms` mili giây) → 1 lần fsync cho cả lô thay vì mỗi request 1 lần.
+    Thread request chỉ xếp hàng rồi chờ (sync) hoặc trả về ngay (async).
+    """
+
+    def __init__(self, db, batch_size=WRITE_BATCH_SIZE, batch_ms=WRITE_BATCH_MS, queue_size=WRITE_QUEUE_SIZE):
+        self.db = db
+        self.batch_size = batch_size
+        self.batch_delay = batch_ms / 1000.0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+        atexit.register(self.close)
+
+    def _ensure_started(self):
+        # Khởi động lười (và khởi động lại sau fork: thread không tồn tại trong tiến trình con)
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="purchase-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, rows, wait=True, timeout=WRITE_TIMEOUT):
+        """
+        Xếp hàng các dòng đã kiểm tra (parse_purchase). wait=True → chờ tới khi transaction đã commit,
+        trả về danh sách purchase_id; wait=False → trả về None ngay sau khi xếp hàng.
+        """
+        if self._closed:
+            raise RuntimeError("Writer đã đóng")
+        self._ensure_started()
+        pending = _Pending(list(rows))
+        try:
+            self._queue.put(pending, timeout=timeout)
+        except queue.Full:
+            WRITES.inc(len(pending.rows), result="rejected")
+            raise WriteQueueFull("Hàng đợi ghi đang đầy")
+        WRITE_QUEUE_DEPTH.set(self._queue.qsize())
+        if not wait:
+            return None
+        if not pending.done.wait(timeout):
+            raise TimeoutError("Quá thời gian chờ ghi")
+        if pending.error is not None:
+            raise pending.error
+        return pending.purchase_ids
+
+    def _collect(self, first):
+        """Gom thêm lệnh ghi tới khi đủ batch_size dòng hoặc hết batch_delay → (lô, có tín hiệu dừng)"""
+        batch = [first]
+        n_rows = len(first.rows)
+        deadline = time.monotonic() + self.batch_delay
+        while n_rows < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True  # tín hiệu dừng: ghi nốt lô này rồi thoát
+            batch.append(item)
+            n_rows += len(item.rows)
+        return batch, False
+
+    def _write(self, conn, batch):
+        cursor = conn.cursor()
+        ids = []
+        for pending in batch:
+            pending_ids = []
+            for row in pending.rows:
+                cursor.execute(INSERT_SQL, row)
+                pending_ids.append(cursor.lastrowid)
+            ids.append(pending_ids)
+        conn.commit()
+        return ids
+
+    def _commit(self, conn, batch):
+        start = time.perf_counter()
+        n_rows = sum(len(p.rows) for p in batch)
+        try:
+            results = self._write(conn, batch)
+        except Exception:
+            conn.rollback()
+            # Lô lỗi → ghi lại từng lệnh riêng để chỉ lệnh hỏng nhận lỗi
+            results = []
+            for pending in batch:
+                try:
+                    results.append(self._write(conn, [pending])[0])
+                except Exception as e:
+                    conn.rollback()
+                    results.append(e)
+        WRITE_COMMIT_LATENCY.observe(time.perf_counter() - start)
+        WRITE_BATCH_ROWS.observe(n_rows)
+        for pending, result in zip(batch, results):
+            if isinstance(result, Exception):
+                pending.error = result
+                WRITES.inc(len(pending.rows), result="failed")
+            else:
+                pending.purchase_ids = result
+                WRITES.inc(len(pending.rows), result="ok")
+            pending.done.set()
+
+    def _run(self):
+        conn = self.db.connect()
+        if WRITE_WAL:
+            # WAL: reader không bị chặn khi đang ghi; synchronous=FULL → commit xong là bền vững
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = FULL")
+        try:
+            while True:
+                first = self._queue.get()
+                if first is None:
+                    return
+                batch, stop = self._collect(first)
+                WRITE_QUEUE_DEPTH.set(self._queue.qsize())
+                self._commit(conn, batch)
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def close(self, timeout=WRITE_TIMEOUT):
+        """Ghi nốt các lệnh đang chờ rồi dừng thread writer"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
@@ -0,0 +1,225 @@
+import os
+import re
+import sys
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import deque
+from contextvars import ContextVar
+
+logger = logging.getLogger("sql.profiler")
+
+# Profiler mặc định tắt (mỗi câu SQL phải qua cursor Python + lấy caller); SQL_PROFILER=1 hoặc `main.py --debug`
+# để bật. Ngưỡng slow query (ms) qua biến môi trường
+ENABLED = os.environ.get("SQL_PROFILER", "0") == "1"
+SLOW_QUERY_MS = float(os.environ.get("SQL_SLOW_MS", "100"))
+SLOW_LOG_SIZE = int(os.environ.get("SQL_SLOW_LOG_SIZE", "200"))
+
+_THIS_FILE = os.path.abspath(__file__)
+_LIBRARY_MARKERS = (os.sep + "pandas" + os.sep, os.sep + "sqlite3" + os.sep, "site-packages")
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+# Thống kê của request hiện tại: [số câu SQL, tổng giây]
+_request_stats = ContextVar("sql_request_stats", default=None)
+
+
+def fingerprint(sql):
+    """Chuẩn hoá câu SQL: bỏ literal, gộp IN (?, ?, ...) và khoảng trắng → dùng để gom nhóm"""
+    text = _STRING_LITERAL.sub("?", sql)
+    text = _NUMBER_LITERAL.sub("?", text)
+    text = _WHITESPACE.sub(" ", text).strip()
+    return _IN_LIST.sub("(?...)", text)
+
+
+def _caller():
+    """Hàm gọi truy vấn: frame đầu tiên nằm ngoài profiler/pandas/sqlite3"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename != _THIS_FILE and not any(m in filename for m in _LIBRARY_MARKERS):
+            return f"{os.path.basename(filename)}:{frame.f_code.co_name}:{frame.f_lineno}"
+        frame = frame.f_back
+    return "?"
+
+
+class QueryProfiler:
+    """Gom thống kê theo fingerprint + lưu slow-query log (kèm EXPLAIN QUERY PLAN)"""
+
+    def __init__(self, slow_ms=SLOW_QUERY_MS, slow_log_size=SLOW_LOG_SIZE):
+        self.slow_ms = slow_ms
+        self.stats = {}  # fingerprint -> dict
+        self.slow_log = deque(maxlen=slow_log_size)
+        self._lock = threading.Lock()
+
+    def begin(self, sql, bulk=False):
+        """bulk=True (executemany): vẫn cộng vào thống kê nhưng không ghi slow log (bulk insert luôn "chậm")"""
+        fp = fingerprint(sql)
+        caller = _caller()
+        with self._lock:
+            entry = self.stats.get(fp)
+            if entry is None:
+                entry = self.stats[fp] = {
+                    "id": hashlib.md5(fp.encode("utf-8")).hexdigest()[:12],
+                    "fingerprint": fp,
+                    "calls": 0,
+                    "total_seconds": 0.0,
+                    "max_seconds": 0.0,
+                    "rows": 0,
+                    "callers": {},
+                }
+            entry["calls"] += 1
+            entry["callers"][caller] = entry["callers"].get(caller, 0) + 1
+        req = _request_stats.get()
+        if req is not None:
+            req[0] += 1
+        return {"entry": entry, "sql": sql, "caller": caller, "seconds": 0.0, "rows": 0, "logged": bulk}
+
+    def add(self, record, seconds, rows, connection, params):
+        """Cộng dồn thời gian/số dòng (execute + fetch) của 1 câu lệnh"""
+        record["seconds"] += seconds
+        record["rows"] += rows
+        entry = record["entry"]
+        with self._lock:
+            entry["total_seconds"] += seconds
+            entry["rows"] += rows
+            entry["max_seconds"] = max(entry["max_seconds"], record["seconds"])
+        req = _request_stats.get()
+        if req is not None:
+            req[1] += seconds
+        if not record["logged"] and record["seconds"] * 1000 >= self.slow_ms:
+            record["logged"] = True
+            self._log_slow(record, connection, params)
+
+    def _log_slow(self, record, connection, params):
+        plan = explain(connection, record["sql"], params)
+        item = {
+            "id": record["entry"]["id"],
+            "fingerprint": record["entry"]["fingerprint"],
+            "sql": record["sql"].strip(),
+            "duration_ms": round(record["seconds"] * 1000, 2),
+            "caller": record["caller"],
+            "plan": plan,
+            "timestamp": time.time(),
+        }
+        with self._lock:
+            self.slow_log.append(item)
+        logger.warning("🐢 Slow query %.1fms tại %s: %s | plan: %s",
+                       item["duration_ms"], item["caller"], item["fingerprint"][:200], " / ".join(plan))
+
+    def top(self, n=20, order_by="total_seconds"):
+        with self._lock:
+            entries = [dict(e, callers=dict(e["callers"])) for e in self.stats.values()]
+        entries.sort(key=lambda e: e[order_by], reverse=True)
+        for e in entries:
+            e["avg_ms"] = round(e["total_seconds"] * 1000 / max(e["calls"], 1), 3)
+        return entries[:n]
+
+    def slow_queries(self, n=50):
+        with self._lock:
+            return list(self.slow_log)[-n:][::-1]
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+            self.slow_log.clear()
+
+
+PROFILER = QueryProfiler()
+
+
+def explain(connection, sql, params=()):
+    """EXPLAIN QUERY PLAN trên connection gốc (không đi qua profiler)"""
+    if not sql.lstrip().upper().startswith(("SELECT", "WITH")):
+        return []
+    try:
+        rows = sqlite3.Connection.execute(connection, "EXPLAIN QUERY PLAN " + sql, params or ()).fetchall()
+        return [row[-1] for row in rows]
+    except sqlite3.Error as e:
+        return [f"(không lấy được plan: {e})"]
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    _record = None
+    _params = ()
+
+    def execute(self, sql, parameters=()):
+        self._record = PROFILER.begin(sql)
+        self._params = parameters
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            PROFILER.add(self._record, time.perf_counter() - start, 0, self.connection, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._record = PROFILER.begin(sql, bulk=True)
+        self._params = ()
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            PROFILER.add(self._record, time.perf_counter() - start, max(self.rowcount, 0), self.connection, ())
+
+    def _fetched(self, start, rows):
+        if self._record is not None:
+            PROFILER.add(self._record, time.perf_counter() - start, rows, self.connection, self._params)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows))
+        return rows
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """Connection dùng cho sqlite3.connect(factory=...) — mọi cursor (kể cả của pd.read_sql) đều được đo"""
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def enable(enabled=True):
+    """Bật/tắt profiler lúc chạy (áp dụng cho các connection mở sau đó)"""
+    global ENABLED
+    ENABLED = enabled
+
+
+def connect(db_path, **kwargs):
+    if ENABLED:
+        kwargs.setdefault("factory", ProfiledConnection)
+    return sqlite3.connect(db_path, **kwargs)
+
+
+def start_request():
+    """Bắt đầu đếm câu SQL cho request hiện tại"""
+    _request_stats.set([0, 0.0])
+
+
+def request_stats():
+    """(số câu SQL, tổng thời gian SQL tính bằng giây) của request hiện tại"""
+    stats = _request_stats.get()
+    return (stats[0], stats[1]) if stats is not None else (0, 0.0)
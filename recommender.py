@@ -1,14 +1,9 @@
-import pandas as pd
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.decomposition import TruncatedSVD
-from scipy.sparse.linalg import svds
 import sys
 import os
 from datetime import datetime, timedelta
 import random
 import math
+import contextvars
 
 # Sửa import path
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -26,14 +21,55 @@ except ImportError as e:
     spec.loader.exec_module(database_module)
     DatabaseManager = database_module.DatabaseManager
 
+try:
+    from utils.lazy_imports import lazy_module
+    from utils.columnar import load_interactions
+    from utils.catalog import ProductCatalog
+    from utils.sampler import CatalogSampler
+    from utils.metrics import (span, traced, algorithm_context, record_fallback,
+                               RECOMMENDATIONS, RECOMMEND_LATENCY)
+except ImportError:
+    from lazy_imports import lazy_module
+    from columnar import load_interactions
+    from catalog import ProductCatalog
+    from sampler import CatalogSampler
+    from metrics import (span, traced, algorithm_context, record_fallback,
+                         RECOMMENDATIONS, RECOMMEND_LATENCY)
+
+try:
+    from models.memory_budget import MemoryBudget, dense_bytes, sparse_bytes, PIVOT_OVERHEAD
+except ImportError:
+    from memory_budget import MemoryBudget, dense_bytes, sparse_bytes, PIVOT_OVERHEAD
+
+# Thư viện số học nặng được nạp trễ → import module/khởi động server nhanh
+pd = lazy_module("pandas")
+np = lazy_module("numpy")
+sparse = lazy_module("scipy.sparse")
+sparse_linalg = lazy_module("scipy.sparse.linalg")
+pairwise = lazy_module("sklearn.metrics.pairwise")
+
+# Mô hình được ghim cho request đang chạy: hot swap (retrain) không đổi mô hình giữa chừng một request
+_pinned_model = contextvars.ContextVar("pinned_model", default=None)
+
 
 class AdvancedRecommender:
-    def __init__(self):
-        self.db = DatabaseManager()
+    def __init__(self, db=None):
+        self.db = db or DatabaseManager()
         self.algorithm = "hybrid"
         self.user_profiles = {}
         self.product_features = {}
         self.category_diversity_boost = 0.3  # Tăng cường đa dạng danh mục
+        # Đường dẫn file/thư mục Parquet (xuất bởi columnar.py) để huấn luyện không cần quét SQLite
+        self.interactions_path = os.environ.get("RECOMMENDER_INTERACTIONS_PATH")
+        # Trần điểm của implicit feedback (view/click/add_to_cart) so với rating 1-5 của lượt mua
+        self.implicit_max_rating = float(os.environ.get("IMPLICIT_MAX_RATING", "2.5"))
+        # Giới hạn bộ nhớ cho ma trận/similarity/tái tạo SVD (RECOMMENDER_MEMORY_BUDGET_MB)
+        self.memory_budget = MemoryBudget()
+        # Được gắn bởi warmup: mô hình huấn luyện sẵn (model_store.RecommenderModel) và cache catalog.
+        # Retrain thay mô hình bằng phép gán nguyên tử; request đang chạy dùng bản đã ghim (active_model)
+        self.model = None
+        self.catalog = None
+        self._sampler = None
 
         # ===== Trạng thái phiên để reset khi nhập khách hàng mới =====
         self._current_customer_id = None
@@ -70,30 +106,21 @@ class AdvancedRecommender:
 
     def _column_exists(self, table_name: str, column_name: str) -> bool:
         """Kiểm tra cột có tồn tại trong bảng SQLite không."""
-        conn = self.db.connect()
         try:
-            df = pd.read_sql(f"PRAGMA table_info({table_name})", conn)
-            return column_name in set(df["name"].tolist())
+            return self.db.column_exists(table_name, column_name)
         except Exception as e:
             print(f"❌ Lỗi kiểm tra cột {column_name} trong {table_name}: {e}")
             return False
-        finally:
-            conn.close()
 
     def _get_user_purchased_ids(self, customer_id: int):
         """Lấy set product_id mà user đã mua để loại trừ khỏi gợi ý."""
-        conn = self.db.connect()
         try:
-            df = pd.read_sql(
-                "SELECT DISTINCT product_id FROM purchase_history WHERE customer_id = ?",
-                conn, params=[customer_id]
-            )
-            return set(df["product_id"].tolist())
+            return set(self.db.query_column(
+                "SELECT DISTINCT product_id FROM purchase_history WHERE customer_id = ?", (customer_id,)
+            ))
         except Exception as e:
             print(f"❌ Lỗi lấy danh sách sản phẩm đã mua: {e}")
             return set()
-        finally:
-            conn.close()
 
     def get_category_diversity_score(self, product_category, recommended_categories):
         """Tính điểm đa dạng danh mục - khuyến khích danh mục mới"""
@@ -107,19 +134,15 @@ class AdvancedRecommender:
 
     def get_all_categories(self):
         """Lấy tất cả danh mục sản phẩm có trong hệ thống"""
-        conn = self.db.connect()
         try:
-            query = "SELECT DISTINCT category FROM products WHERE category IS NOT NULL"
-            categories_df = pd.read_sql(query, conn)
-            return categories_df["category"].tolist()
+            return self.db.query_column("SELECT DISTINCT category FROM products WHERE category IS NOT NULL")
         except Exception as e:
             print(f"❌ Lỗi khi lấy danh mục: {e}")
             return ["Thực phẩm", "Điện tử", "Gia dụng", "Thời trang", "Sức khỏe"]
-        finally:
-            conn.close()
 
     # ---------------------- User profile & matrix ----------------------
 
+    @traced("profile")
     def build_enhanced_user_profile(self, customer_id):
         """Xây dựng hồ sơ người dùng mở rộng với đa dạng danh mục"""
         conn = self.db.connect()
@@ -174,46 +197,87 @@ class AdvancedRecommender:
         finally:
             conn.close()
 
-    def get_enhanced_user_item_matrix(self):
-        """
-        Lấy ma trận người dùng - sản phẩm với thông tin mở rộng.
-        Sửa về cú pháp SQLite: dùng julianday('now') thay TIMESTAMPDIFF/NOW().
-        """
-        conn = self.db.connect()
+    def _load_interactions(self, conn):
+        """Nguồn dữ liệu huấn luyện: file Parquet/Arrow nếu đã cấu hình, ngược lại truy vấn SQLite."""
+        if self.interactions_path and os.path.exists(self.interactions_path):
+            df = load_interactions(self.interactions_path)
+            return df[df["rating"] > 0]
+        return pd.read_sql(
+            """
+            SELECT 
+                ph.customer_id, 
+                ph.product_id, 
+                ph.rating,
+                ph.purchase_date,
+                p.category,
+                p.brand,
+                p.price,
+                CAST((julianday('now') - julianday(ph.purchase_date)) AS INTEGER) AS days_since_purchase
+            FROM purchase_history ph
+            JOIN products p ON ph.product_id = p.product_id
+            WHERE ph.rating > 0
+            ORDER BY ph.purchase_date DESC
+            """,
+            conn,
+        )
+
+    def _load_implicit_interactions(self, conn):
+        """Trọng số implicit (view/click/add_to_cart đã rollup), 0 dòng nếu bảng chưa có"""
         try:
-            df = pd.read_sql(
+            return pd.read_sql(
                 """
-                SELECT 
-                    ph.customer_id, 
-                    ph.product_id, 
-                    ph.rating,
-                    ph.purchase_date,
-                    p.category,
-                    p.brand,
-                    p.price,
-                    CAST((julianday('now') - julianday(ph.purchase_date)) AS INTEGER) AS days_since_purchase
-                FROM purchase_history ph
-                JOIN products p ON ph.product_id = p.product_id
-                WHERE ph.rating > 0
-                ORDER BY ph.purchase_date DESC
+                SELECT customer_id, product_id, weight,
+                       (julianday('now') - julianday(last_event_at, 'unixepoch')) AS days_since_event
+                FROM interaction_weights
                 """,
                 conn,
             )
+        except Exception:
+            return pd.DataFrame(columns=["customer_id", "product_id", "weight", "days_since_event"])
 
-            if df.empty:
-                return None, None, None
-
+    def _weighted_interactions(self, conn):
+        df = self._load_interactions(conn)
+        if not df.empty:
             # Trọng số thời gian: mua gần → trọng số cao
             df["time_weight"] = np.exp(-df["days_since_purchase"] / 30.0)
             df["weighted_rating"] = df["rating"] * df["time_weight"]
 
-            user_item_matrix = df.pivot_table(
-                index="customer_id",
-                columns="product_id",
-                values="weighted_rating",
-                fill_value=0,
-                aggfunc="mean",
+        implicit = self._load_implicit_interactions(conn)
+        if not implicit.empty:
+            # Implicit feedback chỉ lấp các cặp (khách, sản phẩm) chưa mua; bị chặn ở IMPLICIT_MAX_RATING
+            # để không lấn át lượt mua thật, và suy giảm theo thời gian như lượt mua
+            if not df.empty:
+                purchased = pd.MultiIndex.from_frame(df[["customer_id", "product_id"]])
+                implicit = implicit[~pd.MultiIndex.from_frame(implicit[["customer_id", "product_id"]]).isin(purchased)]
+            implicit = implicit.assign(
+                weighted_rating=np.minimum(implicit["weight"], self.implicit_max_rating)
+                * np.exp(-implicit["days_since_event"].clip(lower=0) / 30.0)
             )
+            implicit = implicit[["customer_id", "product_id", "weighted_rating"]]
+            df = implicit if df.empty else pd.concat([df, implicit], ignore_index=True)
+        return df
+
+    def get_enhanced_user_item_matrix(self):
+        """
+        Lấy ma trận người dùng - sản phẩm với thông tin mở rộng.
+        Sửa về cú pháp SQLite: dùng julianday('now') thay TIMESTAMPDIFF/NOW().
+        """
+        conn = self.db.connect()
+        try:
+            with span("matrix.load"):
+                df = self._weighted_interactions(conn)
+
+            if df.empty:
+                return None, None, None
+
+            with span("matrix.pivot"):
+                user_item_matrix = df.pivot_table(
+                    index="customer_id",
+                    columns="product_id",
+                    values="weighted_rating",
+                    fill_value=0,
+                    aggfunc="mean",
+                )
             return user_item_matrix, user_item_matrix.index, user_item_matrix.columns
 
         except Exception as e:
@@ -222,100 +286,213 @@ class AdvancedRecommender:
         finally:
             conn.close()
 
+    def get_interaction_matrix(self):
+        """
+        Ma trận user × item cho CF/SVD theo memory budget:
+        - vừa budget → ndarray dense (giá trị như pivot_table, nhưng đủ hàng/cột theo user_ids/product_ids)
+        - vượt budget → CSR sparse (cùng thứ tự user/item)
+        - cả sparse cũng vượt → (None, None, None) để caller rơi về sản phẩm phổ biến
+        """
+        conn = self.db.connect()
+        try:
+            with span("matrix.load"):
+                df = self._weighted_interactions(conn)
+
+            if df.empty:
+                return None, None, None
+
+            with span("matrix.pivot"):
+                user_codes, user_ids = pd.factorize(df["customer_id"], sort=True)
+                item_codes, product_ids = pd.factorize(df["product_id"], sort=True)
+                n_users, n_items = len(user_ids), len(product_ids)
+
+                # Trung bình theo cặp (user, item) giống aggfunc="mean" trên cùng mã factorize với user_ids/product_ids:
+                # rating NaN (purchase_date NULL) bị bỏ qua, cặp toàn NaN bị loại (ô 0) nhưng khách/sản phẩm vẫn giữ
+                # hàng/cột của mình (pivot_table sẽ bỏ hẳn → lệch chỉ mục)
+                pairs = pd.DataFrame({"u": user_codes, "i": item_codes, "r": df["weighted_rating"].values})
+                pairs = pairs.groupby(["u", "i"], sort=False)["r"].mean().dropna().reset_index()
+
+                if self.memory_budget.allows("matrix.pivot", dense_bytes(n_users, n_items, PIVOT_OVERHEAD), "sparse"):
+                    matrix = np.zeros((n_users, n_items), dtype=np.float64)
+                    matrix[pairs["u"].values, pairs["i"].values] = pairs["r"].values
+                else:
+                    if not self.memory_budget.allows("matrix.sparse", sparse_bytes(len(pairs)), "fallback"):
+                        return None, None, None
+                    matrix = sparse.csr_matrix((pairs["r"].values, (pairs["u"].values, pairs["i"].values)),
+                                        shape=(n_users, n_items))
+                self.memory_budget.record("matrix.pivot", matrix)
+            return matrix, pd.Index(user_ids), pd.Index(product_ids)
+
+        except Exception as e:
+            print(f"❌ Lỗi get interaction matrix: {e}")
+            return None, None, None
+        finally:
+            conn.close()
+
+    @property
+    def active_model(self):
+        """Mô hình ghim cho request hiện tại (nếu có), ngược lại mô hình đang phục vụ"""
+        return _pinned_model.get() or self.model
+
+    def _get_matrix(self):
+        """Ma trận từ mô hình đã huấn luyện sẵn nếu có, ngược lại dựng mới từ dữ liệu"""
+        model = self.active_model
+        if model is not None:
+            return model.matrix, model.user_ids, model.product_ids
+        return self.get_interaction_matrix()
+
+    @staticmethod
+    def _matrix_row(matrix, idx):
+        if sparse.issparse(matrix):
+            return matrix.getrow(idx).toarray().ravel()
+        return np.asarray(matrix[idx]).ravel()
+
     # ---------------------- CF / SVD ----------------------
 
     def collaborative_filtering(self, customer_id, n_recommendations=10):
         """Collaborative Filtering với đa dạng danh mục"""
-        user_item_matrix, user_ids, product_ids = self.get_enhanced_user_item_matrix()
+        matrix, user_ids, product_ids = self._get_matrix()
 
-        if user_item_matrix is None or customer_id not in user_ids:
-            return self.get_diverse_popular_products(n_recommendations)
+        if matrix is None or customer_id not in user_ids:
+            return self._fallback_popular(n_recommendations, "cold_start")
 
         try:
-            user_similarity = cosine_similarity(user_item_matrix)
-            user_similarity_df = pd.DataFrame(user_similarity, index=user_ids, columns=user_ids)
+            user_idx = user_ids.get_loc(customer_id)
+            n_users = len(user_ids)
+            with span("cf.similarity"):
+                if self.memory_budget.allows("cf.similarity", dense_bytes(n_users, n_users), "per_user_row"):
+                    user_similarity = pairwise.cosine_similarity(matrix)
+                    self.memory_budget.record("cf.similarity", user_similarity)
+                    similarity_row = user_similarity[user_idx]
+                else:
+                    # Chỉ tính 1 dòng similarity của khách hiện tại: O(users) thay vì O(users²)
+                    similarity_row = pairwise.cosine_similarity(matrix[user_idx:user_idx + 1], matrix)[0]
+                    self.memory_budget.record("cf.similarity", similarity_row)
 
-            similar_users = user_similarity_df[customer_id].sort_values(ascending=False)[1:11]
-            similar_users = similar_users[similar_users > 0.1]
+                similar_users = pd.Series(similarity_row, index=user_ids).sort_values(ascending=False)[1:11]
+                similar_users = similar_users[similar_users > 0.1]
 
             if len(similar_users) == 0:
-                return self.get_diverse_popular_products(n_recommendations)
-
-            product_scores = {}
-            user_purchased = user_item_matrix.columns[user_item_matrix.loc[customer_id] > 0].tolist()
-
-            for similar_user_id, similarity_score in similar_users.items():
-                user_ratings = user_item_matrix.loc[similar_user_id]
-                for product_id in user_ratings.index:
-                    if user_ratings[product_id] > 0 and product_id not in user_purchased:
-                        product_scores[product_id] = product_scores.get(product_id, 0.0) + (
-                            user_ratings[product_id] * similarity_score
-                        )
+                return self._fallback_popular(n_recommendations, "no_similar_users")
+
+            with span("cf.scoring"):
+                product_scores = {}
+                product_list = product_ids.tolist()  # int Python để bind tham số SQLite
+                user_purchased = {product_list[c] for c in np.flatnonzero(self._matrix_row(matrix, user_idx) > 0)}
+
+                for similar_user_id, similarity_score in similar_users.items():
+                    user_ratings = self._matrix_row(matrix, user_ids.get_loc(similar_user_id))
+                    for col in np.flatnonzero(user_ratings > 0):
+                        product_id = product_list[col]
+                        if product_id not in user_purchased:
+                            product_scores[product_id] = product_scores.get(product_id, 0.0) + (
+                                user_ratings[col] * similarity_score
+                            )
 
             top_products = self.apply_category_diversity(product_scores, n_recommendations)
             return self.get_product_details(top_products, "Khách hàng tương tự mua")
 
         except Exception as e:
             print(f"❌ Lỗi collaborative filtering: {e}")
-            return self.get_diverse_popular_products(n_recommendations)
-
-    def svd_recommendation(self, customer_id, n_recommendations=10):
-        """SVD recommendation với đa dạng hóa"""
-        user_item_matrix, user_ids, product_ids = self.get_enhanced_user_item_matrix()
+            return self._fallback_popular(n_recommendations, "error")
 
-        if user_item_matrix is None or customer_id not in user_ids:
-            return self.get_diverse_popular_products(n_recommendations)
+    def factorize(self, matrix, k=20):
+        """
+        Phân rã SVD ma trận đã trừ trung bình theo user.
+        Trả về (user_means, U, sigma, Vt) hoặc None nếu ma trận quá nhỏ.
+        """
+        n_users, n_items = matrix.shape
+        user_means = np.asarray(matrix.mean(axis=1)).ravel()
 
-        try:
-            user_means = user_item_matrix.mean(axis=1)
-            normalized_matrix = user_item_matrix.sub(user_means, axis=0).fillna(0)
+        k = min(k, max(min(matrix.shape) - 1, 2))
+        if k < 2 or k >= min(matrix.shape):
+            return None
 
-            R = normalized_matrix.values.astype(np.float64)
-            k = min(20, max(min(R.shape) - 1, 2))
-            if k < 2:
-                return self.get_diverse_popular_products(n_recommendations)
+        if not sparse.issparse(matrix) and self.memory_budget.allows(
+                "svd.normalize", dense_bytes(n_users, n_items), "linear_operator"):
+            R = matrix - user_means.reshape(-1, 1)
+        else:
+            # Trừ trung bình theo user mà không tạo ma trận dense: (M - μ·1ᵀ) dưới dạng LinearOperator
+            M = matrix
+            ones = np.ones(n_items)
+            R = sparse_linalg.LinearOperator(
+                (n_users, n_items), dtype=np.float64,
+                matvec=lambda x: M @ np.ravel(x) - user_means * ones.dot(np.ravel(x)),
+                rmatvec=lambda y: M.T @ np.ravel(y) - ones * user_means.dot(np.ravel(y)),
+            )
 
-            U, sigma, Vt = svds(R, k=k, which="LM")
-            sigma = np.diag(sigma)
+        with span("svd.svds"):
+            U, sigma, Vt = sparse_linalg.svds(R, k=k, which="LM")
+            self.memory_budget.record("svd.svds", U, sigma, Vt)
+        return user_means, U, sigma, Vt
 
-            predicted_ratings = np.dot(np.dot(U, sigma), Vt) + user_means.values.reshape(-1, 1)
-            predicted_df = pd.DataFrame(predicted_ratings, index=user_ids, columns=product_ids)
+    def svd_recommendation(self, customer_id, n_recommendations=10):
+        """SVD recommendation với đa dạng hóa"""
+        matrix, user_ids, product_ids = self._get_matrix()
 
-            user_idx = list(user_ids).index(customer_id)
-            user_predictions = predicted_df.iloc[user_idx]
+        if matrix is None or customer_id not in user_ids:
+            return self._fallback_popular(n_recommendations, "cold_start")
 
-            user_purchased = user_item_matrix.columns[user_item_matrix.loc[customer_id] > 0].tolist()
-            candidate_products = [(pid, score) for pid, score in user_predictions.items() if pid not in user_purchased and score > 0.1]
+        try:
+            n_users, n_items = matrix.shape
+            model = self.active_model
+            if model is not None:
+                factors = model.factors
+            else:
+                factors = self.factorize(matrix)
+            if factors is None:
+                return self._fallback_popular(n_recommendations, "matrix_too_small")
+            user_means, U, sigma, Vt = factors
+
+            user_idx = user_ids.get_loc(customer_id)
+            with span("svd.reconstruct"):
+                if self.memory_budget.allows("svd.reconstruct", dense_bytes(n_users, n_items), "per_user_row"):
+                    predicted_ratings = np.dot(U * sigma, Vt) + user_means.reshape(-1, 1)
+                    self.memory_budget.record("svd.reconstruct", predicted_ratings)
+                    user_predictions = predicted_ratings[user_idx]
+                else:
+                    # Chỉ tái tạo dòng của khách hiện tại: U[i]·Σ·Vᵀ
+                    user_predictions = np.dot(U[user_idx] * sigma, Vt) + user_means[user_idx]
+                    self.memory_budget.record("svd.reconstruct", user_predictions)
+
+            user_purchased = self._matrix_row(matrix, user_idx) > 0
+            product_list = product_ids.tolist()
+            candidate_products = {
+                product_list[col]: float(user_predictions[col])
+                for col in np.flatnonzero(~user_purchased & (user_predictions > 0.1))
+            }
 
-            top_products = self.apply_category_diversity(dict(candidate_products), n_recommendations)
+            top_products = self.apply_category_diversity(candidate_products, n_recommendations)
             return self.get_product_details(top_products, "Dự đoán theo hành vi")
 
         except Exception as e:
             print(f"❌ Lỗi SVD recommendation: {e}")
-            return self.get_diverse_popular_products(n_recommendations)
+            return self._fallback_popular(n_recommendations, "error")
 
+    @traced("diversification")
     def apply_category_diversity(self, product_scores, n_recommendations):
         """Áp dụng đa dạng hóa danh mục cho danh sách sản phẩm"""
         if not product_scores:
             return []
 
-        conn = self.db.connect()
         try:
             product_ids = list(product_scores.keys())
             if not product_ids:
                 return []
-            placeholders = ",".join(["?"] * len(product_ids))
-            query = f"""
-                SELECT product_id, category 
-                FROM products 
-                WHERE product_id IN ({placeholders})
-            """
-            categories_df = pd.read_sql(query, conn, params=product_ids)
+            cached = [self._cached_product(pid) for pid in sorted(product_ids)]
+            if all(p is not None for p in cached):
+                rows = [(p["product_id"], p["category"]) for p in cached]
+            else:
+                placeholders = ",".join(["?"] * len(product_ids))
+                query = f"""
+                    SELECT product_id, category 
+                    FROM products 
+                    WHERE product_id IN ({placeholders})
+                """
+                rows = self.db.query_rows(query, product_ids)
 
             category_groups = {}
-            for _, row in categories_df.iterrows():
-                category = row["category"]
-                pid = row["product_id"]
+            for pid, category in rows:
                 category_groups.setdefault(category, []).append((pid, product_scores[pid]))
 
             for category in category_groups:
@@ -340,8 +517,6 @@ class AdvancedRecommender:
         except Exception as e:
             print(f"❌ Lỗi apply category diversity: {e}")
             return sorted(product_scores.items(), key=lambda x: x[1], reverse=True)[:n_recommendations]
-        finally:
-            conn.close()
 
     # ---------------------- Content-based ----------------------
 
@@ -353,28 +528,29 @@ class AdvancedRecommender:
         """
         user_profile = self.build_enhanced_user_profile(customer_id)
         if not user_profile:
-            return self.get_diverse_popular_products(n_recommendations)
+            return self._fallback_popular(n_recommendations, "no_profile")
 
         conn = self.db.connect()
         try:
-            base_cols = ["product_id", "name", "category", "brand", "price"]
-            if self._column_exists("products", "description"):
-                base_cols.append("description")
-            select_cols = ", ".join(base_cols)
-
-            products_df = pd.read_sql(
-                f"""
-                SELECT {select_cols}
-                FROM products
-                WHERE product_id NOT IN (
-                    SELECT product_id FROM purchase_history WHERE customer_id = ?
+            with span("content.sql"):
+                base_cols = ["product_id", "name", "category", "brand", "price"]
+                if self._column_exists("products", "description"):
+                    base_cols.append("description")
+                select_cols = ", ".join(base_cols)
+
+                products_df = pd.read_sql(
+                    f"""
+                    SELECT {select_cols}
+                    FROM products
+                    WHERE product_id NOT IN (
+                        SELECT product_id FROM purchase_history WHERE customer_id = ?
+                    )
+                    """,
+                    conn, params=[customer_id]
                 )
-                """,
-                conn, params=[customer_id]
-            )
 
             if products_df.empty:
-                return self.get_diverse_popular_products(n_recommendations)
+                return self._fallback_popular(n_recommendations, "no_candidates")
 
             # Bảo vệ cột text
             for c in ["name", "category", "brand"]:
@@ -391,41 +567,42 @@ class AdvancedRecommender:
                 + products_df["description"].astype(str)
             ).str.strip()
 
-            # Chấm điểm “mềm” theo hồ sơ + random nhỏ để đa dạng
-            product_scores = []
-            for _, product in products_df.iterrows():
-                score = 0.0
-                reason_parts = []
-
-                # Category
-                cat_score = user_profile["preferred_categories"].get(product["category"], 0.0)
-                if cat_score > 0:
-                    score += cat_score * 0.3
-                    reason_parts.append(f"phù hợp {product['category']}")
-                else:
-                    score += 0.2
-                    reason_parts.append(f"khám phá {product['category']}")
-
-                # Brand
-                brand_score = user_profile["preferred_brands"].get(product["brand"], 0.0)
-                if brand_score > 0:
-                    score += brand_score * 0.3
-                    reason_parts.append(f"thương hiệu {product['brand']}")
-
-                # Price
-                price_score = self.calculate_price_affinity(customer_id, float(product["price"]))
-                score += price_score * 0.2
-
-                # Đa dạng nhẹ
-                score += random.uniform(0, 0.2)
-
-                if score > 0:
-                    product_scores.append({
-                        "product_id": product["product_id"],
-                        "score": float(score),
-                        "reason": f"Sản phẩm {' & '.join(reason_parts)}",
-                        "category": product["category"],
-                    })
+            with span("content.scoring"):
+                # Chấm điểm “mềm” theo hồ sơ + random nhỏ để đa dạng
+                product_scores = []
+                for _, product in products_df.iterrows():
+                    score = 0.0
+                    reason_parts = []
+
+                    # Category
+                    cat_score = user_profile["preferred_categories"].get(product["category"], 0.0)
+                    if cat_score > 0:
+                        score += cat_score * 0.3
+                        reason_parts.append(f"phù hợp {product['category']}")
+                    else:
+                        score += 0.2
+                        reason_parts.append(f"khám phá {product['category']}")
+
+                    # Brand
+                    brand_score = user_profile["preferred_brands"].get(product["brand"], 0.0)
+                    if brand_score > 0:
+                        score += brand_score * 0.3
+                        reason_parts.append(f"thương hiệu {product['brand']}")
+
+                    # Price
+                    price_score = self.calculate_price_affinity(customer_id, float(product["price"]))
+                    score += price_score * 0.2
+
+                    # Đa dạng nhẹ
+                    score += random.uniform(0, 0.2)
+
+                    if score > 0:
+                        product_scores.append({
+                            "product_id": product["product_id"],
+                            "score": float(score),
+                            "reason": f"Sản phẩm {' & '.join(reason_parts)}",
+                            "category": product["category"],
+                        })
 
             diversified = self.diversify_recommendations(product_scores, n_recommendations)
             # Ghi nhận ID đã gợi ý trong phiên (tuỳ bạn sử dụng sau này)
@@ -440,10 +617,11 @@ class AdvancedRecommender:
 
         except Exception as e:
             print(f"❌ Lỗi content-based filtering: {e}")
-            return self.get_diverse_popular_products(n_recommendations)
+            return self._fallback_popular(n_recommendations, "error")
         finally:
             conn.close()
 
+    @traced("diversification")
     def diversify_recommendations(self, product_scores, n_recommendations):
         """Đa dạng hóa danh sách gợi ý theo category"""
         if not product_scores:
@@ -474,8 +652,37 @@ class AdvancedRecommender:
 
     # ---------------------- Popular & Random ----------------------
 
+    def _fallback_popular(self, n_recommendations, reason):
+        """Rơi về sản phẩm phổ biến và ghi nhận lý do vào metric recommender_fallback_total"""
+        record_fallback(reason)
+        return self.get_diverse_popular_products(n_recommendations)
+
+    @staticmethod
+    def _popular_item(product):
+        popularity_score = (
+            product["purchase_count"] * 0.6
+            + product["avg_rating"] * 0.3
+            + product["unique_customers"] * 0.1
+        ) / 10.0
+        return {
+            "product_id": product["product_id"],
+            "name": product["name"],
+            "category": product["category"],
+            "price": float(product["price"]),
+            "brand": product["brand"],
+            "avg_rating": float(product["avg_rating"]),
+            "score": float(popularity_score),
+            "reason": f"Sản phẩm phổ biến (⭐{product['avg_rating']:.1f}, 👥{product['unique_customers']})",
+        }
+
+    @traced("popular")
     def get_diverse_popular_products(self, n_recommendations=10):
         """Lấy sản phẩm phổ biến với đa dạng danh mục"""
+        if self.catalog is not None:
+            popular = self.catalog.ensure_fresh().diverse_popular(n_recommendations)
+            if popular:
+                return [self._popular_item(p) for p in popular]
+
         conn = self.db.connect()
         try:
             query = """
@@ -510,24 +717,7 @@ class AdvancedRecommender:
                 if len(final_products) >= n_recommendations * 2:
                     break
 
-            results = []
-            for product in final_products[:n_recommendations]:
-                popularity_score = (
-                    product["purchase_count"] * 0.6
-                    + product["avg_rating"] * 0.3
-                    + product["unique_customers"] * 0.1
-                ) / 10.0
-
-                results.append({
-                    "product_id": product["product_id"],
-                    "name": product["name"],
-                    "category": product["category"],
-                    "price": float(product["price"]),
-                    "brand": product["brand"],
-                    "avg_rating": float(product["avg_rating"]),
-                    "score": float(popularity_score),
-                    "reason": f"Sản phẩm phổ biến (⭐{product['avg_rating']:.1f}, 👥{product['unique_customers']})",
-                })
+            results = [self._popular_item(product) for product in final_products[:n_recommendations]]
 
             print(f"✅ Trả về {len(results)} sản phẩm phổ biến đa dạng")
             return results
@@ -538,22 +728,25 @@ class AdvancedRecommender:
         finally:
             conn.close()
 
-    def get_random_products(self, n_recommendations=10):
+    def ensure_catalog(self):
+        """Catalog trong RAM (warm-up chưa chạy → nạp ở lần gọi đầu)"""
+        if self.catalog is None:
+            self.catalog = ProductCatalog(self.db)
+        return self.catalog.ensure_fresh()
+
+    def sample_products(self, n, categories=None, exclude=(), seed=None, min_price=None, max_price=None):
+        """Sản phẩm ngẫu nhiên (theo danh mục/khoảng giá, loại `exclude`) lấy mẫu từ catalog trong RAM"""
+        self.ensure_catalog()
+        if self._sampler is None or self._sampler.catalog is not self.catalog:
+            self._sampler = CatalogSampler(self.catalog)
+        return self._sampler.sample(n, categories, exclude, seed, min_price, max_price)
+
+    @traced("random")
+    def get_random_products(self, n_recommendations=10, seed=None):
         """Lấy sản phẩm ngẫu nhiên như fallback"""
-        conn = self.db.connect()
         try:
-            df = pd.read_sql_query(
-                """
-                SELECT product_id, name, category, price, brand
-                FROM products 
-                ORDER BY RANDOM() 
-                LIMIT ?
-                """,
-                conn, params=[n_recommendations]
-            )
-
             results = []
-            for _, row in df.iterrows():
+            for row in self.sample_products(n_recommendations, seed=seed):
                 results.append({
                     "product_id": row["product_id"],
                     "name": row["name"],
@@ -569,14 +762,12 @@ class AdvancedRecommender:
         except Exception as e:
             print(f"❌ Lỗi get random products: {e}")
             return []
-        finally:
-            conn.close()
 
     # ---------------------- Price affinity ----------------------
 
+    @traced("content.price_affinity")
     def calculate_price_affinity(self, customer_id, product_price):
         """Tính độ phù hợp về giá dựa trên lịch sử mua hàng (SQLite-safe)"""
-        conn = self.db.connect()
         try:
             price_query = """
                 SELECT p.price
@@ -584,12 +775,11 @@ class AdvancedRecommender:
                 JOIN products p ON ph.product_id = p.product_id
                 WHERE ph.customer_id = ? AND ph.rating >= 4
             """
-            prices_df = pd.read_sql_query(price_query, conn, params=[customer_id])
+            prices = self.db.query_array(price_query, (customer_id,))
 
-            if prices_df.empty:
+            if not len(prices):
                 return 0.5
 
-            prices = prices_df["price"].astype(float).values
             avg_price = float(np.mean(prices))
             std_price = float(np.std(prices, ddof=0))  # population std
             if std_price == 0:
@@ -604,39 +794,48 @@ class AdvancedRecommender:
         except Exception as e:
             print(f"❌ Lỗi calculate price affinity: {e}")
             return 0.5
-        finally:
-            conn.close()
 
     # ---------------------- Hybrid (đã gộp theo product_id) ----------------------
 
-    def hybrid_recommendation(self, customer_id, n_recommendations=10):
-        """
-        Hybrid recommendation với:
-        - Gộp theo product_id từ nhiều nguồn (popular/content/collab/svd)
-        - Cộng trọng số, chuẩn hóa [0,1]
-        - Loại trừ sản phẩm đã mua
-        - Đa dạng hóa & khử trùng theo product_id
-        """
+    # Thứ tự chạy các nguồn của hybrid: rẻ trước (popular dùng catalog cache) → streaming có kết quả sớm
+    HYBRID_SOURCES = ("popular", "content", "collaborative", "svd")
+
+    def _hybrid_weights(self, customer_id):
         user_profile = self.build_enhanced_user_profile(customer_id)
 
         if not user_profile or user_profile.get("total_purchases", 0) < 5:
-            weights = {"popular": 0.3, "content": 0.4, "collaborative": 0.2, "svd": 0.1}
+            return {"popular": 0.3, "content": 0.4, "collaborative": 0.2, "svd": 0.1}
         elif user_profile.get("total_purchases", 0) > 20 and user_profile.get("category_variety", 0) < 3:
-            weights = {"popular": 0.2, "content": 0.3, "collaborative": 0.2, "svd": 0.3}
+            return {"popular": 0.2, "content": 0.3, "collaborative": 0.2, "svd": 0.3}
         else:
-            weights = {"popular": 0.2, "content": 0.3, "collaborative": 0.25, "svd": 0.25}
-
-        purchased_ids = self._get_user_purchased_ids(customer_id)
+            return {"popular": 0.2, "content": 0.3, "collaborative": 0.25, "svd": 0.25}
 
-        # Lấy dư để diversify
-        k = max(n_recommendations * 2, 20)
-        sources = {
-            "popular": self.get_diverse_popular_products(k),
-            "content": self.content_based_filtering(customer_id, k),
-            "collaborative": self.collaborative_filtering(customer_id, k),
-            "svd": self.svd_recommendation(customer_id, k),
+    def _iter_hybrid_sources(self, customer_id, k, model=None):
+        """
+        Chạy lần lượt các nguồn theo HYBRID_SOURCES → sau mỗi nguồn yield
+        (tên nguồn, dict kết quả các nguồn đã xong). model != None → ghim mô hình cho từng nguồn.
+        """
+        source_fns = {
+            "popular": lambda: self.get_diverse_popular_products(k),
+            "content": lambda: self.content_based_filtering(customer_id, k),
+            "collaborative": lambda: self.collaborative_filtering(customer_id, k),
+            "svd": lambda: self.svd_recommendation(customer_id, k),
         }
-
+        sources = {}
+        for src_name in self.HYBRID_SOURCES:
+            fn = source_fns[src_name]
+            # set/reset không vắt qua yield → an toàn khi generator được tiêu thụ ở context khác (streaming)
+            pin = _pinned_model.set(model) if model is not None else None
+            try:
+                with span(f"hybrid.source.{src_name}"):
+                    sources[src_name] = fn()
+            finally:
+                if pin is not None:
+                    _pinned_model.reset(pin)
+            yield src_name, sources
+
+    def _merge_hybrid(self, sources, weights, purchased_ids, n_recommendations, final=True):
+        """Gộp kết quả các nguồn theo product_id, chuẩn hoá, đa dạng hoá → danh sách sản phẩm"""
         # Gộp theo product_id
         agg = {}  # pid -> {product_id, category, brand, price, final_score, reasons}
         for src_name, recs in sources.items():
@@ -663,7 +862,7 @@ class AdvancedRecommender:
                 agg[pid]["reasons"].append(f"{src_name}: {reason_text} (×{w:.2f})")
 
         if not agg:
-            return self.get_diverse_popular_products(n_recommendations)
+            return self._fallback_popular(n_recommendations, "no_candidates") if final else []
 
         # Chuẩn hóa [0,1]
         scores = [v["final_score"] for v in agg.values()]
@@ -693,12 +892,54 @@ class AdvancedRecommender:
         reasons = [x.get("reason") for x in diversified]
         scores = [float(x.get("final_score", x.get("score", 0))) for x in diversified]
 
-        # Ghi nhận ID đã gợi ý trong phiên (nếu bạn cần dùng ở UI)
-        for pid in ids:
-            self._session_recommended_ids.add(pid)
+        # Ghi nhận ID đã gợi ý trong phiên (chỉ với kết quả cuối cùng)
+        if final:
+            for pid in ids:
+                self._session_recommended_ids.add(pid)
 
         return self.get_products_by_ids(ids, reasons, scores)
 
+    def hybrid_recommendation(self, customer_id, n_recommendations=10):
+        """
+        Hybrid recommendation với:
+        - Gộp theo product_id từ nhiều nguồn (popular/content/collab/svd)
+        - Cộng trọng số, chuẩn hóa [0,1]
+        - Loại trừ sản phẩm đã mua
+        - Đa dạng hóa & khử trùng theo product_id
+        """
+        weights = self._hybrid_weights(customer_id)
+        purchased_ids = self._get_user_purchased_ids(customer_id)
+
+        # Lấy dư để diversify
+        k = max(n_recommendations * 2, 20)
+        sources = {}
+        for _, sources in self._iter_hybrid_sources(customer_id, k):
+            pass
+        return self._merge_hybrid(sources, weights, purchased_ids, n_recommendations)
+
+    def iter_hybrid_recommendation(self, customer_id, n_recommendations=10, model=None):
+        """
+        Hybrid theo từng bước: sau mỗi nguồn yield (tên nguồn, các nguồn đã xong, tổng số nguồn, xếp hạng tạm).
+        Xếp hạng sau nguồn cuối cùng giống hệt hybrid_recommendation.
+        """
+        if self._current_customer_id != customer_id:
+            self._reset_state_for_new_customer(customer_id)
+        model = model if model is not None else self.model
+        purchased_ids = self._get_user_purchased_ids(customer_id)
+        k = max(n_recommendations * 2, 20)
+        weights = None
+        total = len(self.HYBRID_SOURCES)
+        for src_name, sources in self._iter_hybrid_sources(customer_id, k, model):
+            done = list(sources)
+            final = len(done) == total
+            if weights is None and src_name != "popular":
+                weights = self._hybrid_weights(customer_id)
+            # Chỉ có popular: trọng số không ảnh hưởng thứ hạng (chuẩn hoá min-max) → chưa cần hồ sơ khách
+            results = self._merge_hybrid(sources, weights or {"popular": 1.0}, purchased_ids,
+                                         n_recommendations, final=final)
+            yield src_name, done, total, results
+
+    @traced("diversification")
     def final_diversification(self, all_recommendations, n_recommendations):
         """Đa dạng hóa cuối cùng; khử trùng theo product_id thay vì so dict object."""
         if not all_recommendations:
@@ -798,70 +1039,95 @@ class AdvancedRecommender:
             })
         return results[:n_recommendations]
 
+    def _cached_product(self, product_id):
+        if self.catalog is None or not self.catalog.loaded:
+            return None
+        return self.catalog.get(product_id)
+
+    @traced("hydration")
     def get_product_details(self, product_scores, reason):
         """Lấy thông tin chi tiết sản phẩm với scoring. product_scores: list[(product_id, score)]."""
         if not product_scores:
             return []
-        conn = self.db.connect()
-        try:
-            results = []
-            for product_id, score in product_scores:
-                df = pd.read_sql(
-                    """
-                    SELECT name, category, price, brand, 
-                           (SELECT AVG(rating) FROM purchase_history WHERE product_id = ?) as avg_rating
-                    FROM products WHERE product_id = ?
-                    """,
-                    conn, params=[product_id, product_id]
-                )
-                if not df.empty:
-                    results.append({
-                        "product_id": product_id,
-                        "name": df.iloc[0]["name"],
-                        "category": df.iloc[0]["category"],
-                        "price": float(df.iloc[0]["price"]),
-                        "brand": df.iloc[0]["brand"],
-                        "score": float(score),
-                        "reason": reason,
-                        "avg_rating": float(df.iloc[0]["avg_rating"] or 0),
-                    })
-            return results
-        finally:
-            conn.close()
+        results = []
+        for product_id, score in product_scores:
+            cached = self._cached_product(product_id)
+            if cached is not None:
+                results.append({
+                    "product_id": product_id,
+                    "name": cached["name"],
+                    "category": cached["category"],
+                    "price": float(cached["price"]),
+                    "brand": cached["brand"],
+                    "score": float(score),
+                    "reason": reason,
+                    "avg_rating": float(cached["avg_rating"] or 0),
+                })
+                continue
+            row = self.db.query_one(
+                """
+                SELECT name, category, price, brand, 
+                       (SELECT AVG(rating) FROM purchase_history WHERE product_id = ?) as avg_rating
+                FROM products WHERE product_id = ?
+                """,
+                (int(product_id), int(product_id))
+            )
+            if row is not None:
+                results.append({
+                    "product_id": product_id,
+                    "name": row["name"],
+                    "category": row["category"],
+                    "price": float(row["price"]),
+                    "brand": row["brand"],
+                    "score": float(score),
+                    "reason": reason,
+                    "avg_rating": float(row["avg_rating"] or 0),
+                })
+        return results
 
+    @traced("hydration")
     def get_products_by_ids(self, product_ids, reasons, scores):
         """Lấy thông tin sản phẩm theo danh sách ID (giữ đúng thứ tự đầu vào)."""
         if not product_ids:
             return []
-        conn = self.db.connect()
-        try:
-            placeholders = ",".join(["?"] * len(product_ids))
-            df = pd.read_sql(
-                f"""
-                SELECT product_id, name, category, price, brand
-                FROM products
-                WHERE product_id IN ({placeholders})
-                """,
-                conn, params=product_ids
-            )
-            # Map để trả ra đúng thứ tự product_ids
-            info = {int(r["product_id"]): r for _, r in df.iterrows()}
-            results = []
-            for i, pid in enumerate(product_ids):
-                row = info.get(int(pid))
-                if not row is None:
-                    results.append({
-                        "product_id": int(row["product_id"]),
-                        "name": row["name"],
-                        "category": row["category"],
-                        "price": float(row["price"]),
-                        "brand": row["brand"],
-                        "score": float(scores[i] if i < len(scores) else 1.0),
-                        "reason": reasons[i] if i < len(reasons) else "Đề xuất phù hợp",
-                    })
-            return results
-        finally:
-            conn.close()
+        # Map để trả ra đúng thứ tự product_ids
+        info = {}
+        for pid in product_ids:
+            cached = self._cached_product(pid)
+            if cached is not None:
+                info[int(pid)] = cached
+        missing = [pid for pid in product_ids if int(pid) not in info]
+        if not missing:
+            return self._ordered_products(product_ids, info, reasons, scores)
+
+        placeholders = ",".join(["?"] * len(missing))
+        rows = self.db.query_dicts(
+            f"""
+            SELECT product_id, name, category, price, brand
+            FROM products
+            WHERE product_id IN ({placeholders})
+            """,
+            [int(pid) for pid in missing]
+        )
+        info.update({int(r["product_id"]): r for r in rows})
+        return self._ordered_products(product_ids, info, reasons, scores)
+
+    @staticmethod
+    def _ordered_products(product_ids, info, reasons, scores):
+        results = []
+        for i, pid in enumerate(product_ids):
+            row = info.get(int(pid))
+            if not row is None:
+                results.append({
+                    "product_id": int(row["product_id"]),
+                    "name": row["name"],
+                    "category": row["category"],
+                    "price": float(row["price"]),
+                    "brand": row["brand"],
+                    "score": float(scores[i] if i < len(scores) else 1.0),
+                    "reason": reasons[i] if i < len(reasons) else "Đề xuất phù hợp",
+                })
+        return results
 
     def recommend_products(self, customer_id, n_recommendations=10, algorithm=None):
         """
@@ -877,31 +1143,37 @@ class AdvancedRecommender:
 
         print(f"🎯 Đang gợi ý cho khách hàng {customer_id} với thuật toán {self.algorithm}...")
         start_time = datetime.now()
+        RECOMMENDATIONS.inc(algorithm=self.algorithm)
+
+        pin = _pinned_model.set(self.model)
+        with algorithm_context(self.algorithm):
+            try:
+                if self.algorithm == "collaborative":
+                    results = self.collaborative_filtering(customer_id, n_recommendations)
+                elif self.algorithm == "content":
+                    results = self.content_based_filtering(customer_id, n_recommendations)
+                elif self.algorithm == "svd":
+                    results = self.svd_recommendation(customer_id, n_recommendations)
+                elif self.algorithm == "hybrid":
+                    results = self.hybrid_recommendation(customer_id, n_recommendations)
+                else:
+                    results = self.get_diverse_popular_products(n_recommendations)
 
-        try:
-            if self.algorithm == "collaborative":
-                results = self.collaborative_filtering(customer_id, n_recommendations)
-            elif self.algorithm == "content":
-                results = self.content_based_filtering(customer_id, n_recommendations)
-            elif self.algorithm == "svd":
-                results = self.svd_recommendation(customer_id, n_recommendations)
-            elif self.algorithm == "hybrid":
-                results = self.hybrid_recommendation(customer_id, n_recommendations)
-            else:
-                results = self.get_diverse_popular_products(n_recommendations)
-
-            execution_time = (datetime.now() - start_time).total_seconds()
-            print(f"✅ Hoàn thành trong {execution_time:.2f}s - Tìm thấy {len(results)} sản phẩm")
+                execution_time = (datetime.now() - start_time).total_seconds()
+                print(f"✅ Hoàn thành trong {execution_time:.2f}s - Tìm thấy {len(results)} sản phẩm")
 
-            categories = [product["category"] for product in results]
-            unique_categories = set(categories)
-            print(f"📊 Đa dạng danh mục: {len(unique_categories)}/{len(results)} danh mục khác nhau")
+                categories = [product["category"] for product in results]
+                unique_categories = set(categories)
+                print(f"📊 Đa dạng danh mục: {len(unique_categories)}/{len(results)} danh mục khác nhau")
 
-            return results
+                return results
 
-        except Exception as e:
-            print(f"❌ Lỗi trong quá trình gợi ý: {e}")
-            return self.get_diverse_popular_products(n_recommendations)
+            except Exception as e:
+                print(f"❌ Lỗi trong quá trình gợi ý: {e}")
+                return self._fallback_popular(n_recommendations, "error")
+            finally:
+                _pinned_model.reset(pin)
+                RECOMMEND_LATENCY.observe((datetime.now() - start_time).total_seconds(), algorithm=self.algorithm)
 
 
 # ---------------------- Test block (tuỳ chọn chạy trực tiếp) ----------------------
@@ -0,0 +1,257 @@
+import os
+import sys
+import time
+import shutil
+import threading
+
+# Sửa import path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_dir = os.path.dirname(current_dir)
+sys.path.append(src_dir)
+
+try:
+    from models.model_store import (RecommenderModel, DEFAULT_MODEL_DIR, save_version, set_current, rollback,
+                                    gc_versions, list_versions, current_version, VERSIONS_DIR)
+    from utils.lazy_imports import lazy_module
+    from utils.metrics import MODEL_RETRAINS, MODEL_TRAINED_AT
+except ImportError:
+    from model_store import (RecommenderModel, DEFAULT_MODEL_DIR, save_version, set_current, rollback,
+                             gc_versions, list_versions, current_version, VERSIONS_DIR)
+    from lazy_imports import lazy_module
+    from metrics import MODEL_RETRAINS, MODEL_TRAINED_AT
+
+np = lazy_module("numpy")
+sparse = lazy_module("scipy.sparse")
+
+# Cấu hình retrain qua biến môi trường
+RETRAIN_ENABLED = os.environ.get("RETRAIN_ENABLED", "1") != "0"
+RETRAIN_INTERVAL = float(os.environ.get("RETRAIN_INTERVAL_SECONDS", "3600"))       # 0 = tắt retrain theo giờ
+RETRAIN_MIN_NEW_PURCHASES = int(os.environ.get("RETRAIN_MIN_NEW_PURCHASES", "1000"))  # 0 = tắt retrain theo lượt mua
+RETRAIN_CHECK_SECONDS = float(os.environ.get("RETRAIN_CHECK_SECONDS", "30"))
+RETRAIN_KEEP_VERSIONS = int(os.environ.get("RETRAIN_KEEP_VERSIONS", "5"))
+# Mô hình mới có ít khách hơn tỉ lệ này so với mô hình đang phục vụ → coi là dữ liệu lỗi, không swap
+MIN_USER_RATIO = float(os.environ.get("RETRAIN_MIN_USER_RATIO", "0.5"))
+
+
+def validate_model(model, previous=None, min_user_ratio=MIN_USER_RATIO):
+    """Kiểm tra mô hình trước khi phục vụ; raise ValueError kèm danh sách lỗi"""
+    problems = []
+    n_users, n_items = model.matrix.shape
+    if n_users == 0 or n_items == 0:
+        problems.append("ma trận rỗng")
+    if n_users != len(model.user_ids) or n_items != len(model.product_ids):
+        problems.append(f"kích thước ma trận {model.matrix.shape} không khớp chỉ mục "
+                        f"({len(model.user_ids)} khách, {len(model.product_ids)} sản phẩm)")
+    values = model.matrix.data if sparse.issparse(model.matrix) else model.matrix
+    if not np.all(np.isfinite(values)):
+        problems.append("ma trận có NaN/inf")
+
+    if model.factors is not None:
+        user_means, U, sigma, Vt = model.factors
+        if U.shape[0] != n_users or Vt.shape[1] != n_items or len(user_means) != n_users:
+            problems.append("nhân tử SVD không khớp kích thước ma trận")
+        elif not all(np.all(np.isfinite(f)) for f in model.factors):
+            problems.append("nhân tử SVD có NaN/inf")
+        elif n_users and not np.all(np.isfinite(np.dot(U[0] * sigma, Vt) + user_means[0])):
+            problems.append("tái tạo điểm cho khách đầu tiên không hợp lệ")
+
+    if previous is not None and len(model.user_ids) < len(previous.user_ids) * min_user_ratio:
+        problems.append(f"số khách giảm bất thường: {len(previous.user_ids)} → {len(model.user_ids)}")
+
+    if problems:
+        raise ValueError("; ".join(problems))
+    return model
+
+
+class RetrainScheduler:
+    """
+    Thread nền huấn luyện lại mô hình CF/SVD theo chu kỳ hoặc khi đủ N lượt mua mới.
+    Mỗi lần: huấn luyện → lưu vào versions/<version> → nạp lại (mmap) + kiểm tra → chuyển CURRENT (os.replace)
+    → gán recommender.model (double buffering: request đang chạy vẫn dùng mô hình cũ đã ghim) → dọn phiên bản cũ.
+    """
+
+    def __init__(self, recommender, db, root=DEFAULT_MODEL_DIR, interval=RETRAIN_INTERVAL,
+                 min_new_purchases=RETRAIN_MIN_NEW_PURCHASES, check_interval=RETRAIN_CHECK_SECONDS,
+                 keep=RETRAIN_KEEP_VERSIONS, rank=20):
+        self.recommender = recommender
+        self.db = db
+        self.root = root
+        self.interval = interval
+        self.min_new_purchases = min_new_purchases
+        self.check_interval = check_interval
+        self.keep = keep
+        self.rank = rank
+        self.last_trained_at = time.monotonic()
+        self.last_purchase_count = None
+        self.last_error = None
+        self._known_current = current_version(root)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _purchase_count(self):
+        conn = self.db.connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM purchase_history").fetchone()[0]
+        finally:
+            conn.close()
+
+    def due(self):
+        """Lý do cần retrain ('initial' | 'interval' | 'new_purchases') hoặc None"""
+        if current_version(self.root) is None:
+            return "initial"
+        if self.interval > 0 and time.monotonic() - self.last_trained_at >= self.interval:
+            return "interval"
+        if self.min_new_purchases > 0 and self.last_purchase_count is not None:
+            if self._purchase_count() - self.last_purchase_count >= self.min_new_purchases:
+                return "new_purchases"
+        return None
+
+    def run_once(self, reason="manual"):
+        """Huấn luyện + kiểm tra + swap; trả về phiên bản mới hoặc None nếu thất bại (giữ nguyên mô hình cũ)"""
+        with self._lock:
+            purchase_count = self._purchase_count()
+            path = None
+            previous = self.recommender.model
+            try:
+                if previous is None and current_version(self.root):
+                    previous = RecommenderModel.load(self.root, mmap=True)
+                model = RecommenderModel.train(self.recommender, k=self.rank)
+                if model is None:
+                    raise ValueError("chưa có dữ liệu tương tác")
+                path = save_version(self.root, model)
+                model = validate_model(RecommenderModel.load(path, mmap=True), previous=previous)
+                set_current(self.root, model.version)
+                self._known_current = model.version
+            except Exception as e:
+                if path is not None:
+                    shutil.rmtree(path, ignore_errors=True)
+                self.last_error = str(e)
+                MODEL_RETRAINS.inc(reason=reason, result="failed")
+                print(f"❌ Retrain ({reason}) thất bại, giữ mô hình hiện tại: {e}")
+                return None
+
+            # Phép gán thuộc tính là nguyên tử: request mới dùng mô hình mới, request đang chạy giữ bản đã ghim
+            self.recommender.model = model
+            if self.recommender.catalog is not None:
+                self.recommender.catalog.refresh()
+            self.last_trained_at = time.monotonic()
+            self.last_purchase_count = purchase_count
+            self.last_error = None
+            MODEL_RETRAINS.inc(reason=reason, result="ok")
+            MODEL_TRAINED_AT.set(model.trained_at)
+            removed = gc_versions(self.root, keep=self.keep)
+            print(f"🔁 Retrain ({reason}): phục vụ mô hình {model.version}"
+                  + (f", đã xoá {len(removed)} phiên bản cũ" if removed else ""))
+            return model.version
+
+    def ensure_model(self):
+        """
+        Mô hình lúc khởi động: nạp phiên bản CURRENT (mmap + kiểm tra) nếu có, ngược lại huấn luyện và publish lần
+        đầu qua run_once("initial") — warm-up gọi trước start() để 'initial' không bị huấn luyện lại ở thread nền
+        """
+        if current_version(self.root) is None:
+            return self.run_once("initial")
+        with self._lock:
+            model = validate_model(RecommenderModel.load(self.root, mmap=True))
+            self.recommender.model = model
+            self._known_current = model.version
+            MODEL_TRAINED_AT.set(model.trained_at)
+        print(f"📂 Phục vụ mô hình {model.version} từ {self.root}")
+        return model.version
+
+    def sync_current(self):
+        """CURRENT bị đổi từ bên ngoài (vd: lệnh rollback) → nạp phiên bản đó và swap"""
+        version = current_version(self.root)
+        if version is None or version == self._known_current:
+            return None
+        with self._lock:
+            model = RecommenderModel.load(self.root, mmap=True)
+            self.recommender.model = model
+            self._known_current = model.version
+            MODEL_TRAINED_AT.set(model.trained_at)
+        print(f"⏪ CURRENT đổi thành {model.version} → đã swap mô hình")
+        return model.version
+
+    def _loop(self):
+        while not self._stop.wait(self.check_interval):
+            try:
+                self.sync_current()
+                reason = self.due()
+            except Exception as e:
+                print(f"❌ Retrain: không kiểm tra được registry/dữ liệu: {e}")
+                continue
+            if reason:
+                self.run_once(reason)
+
+    def start(self):
+        if self._thread is not None:
+            return self._thread
+        self.last_purchase_count = self._purchase_count()
+        self._thread = threading.Thread(target=self._loop, name="retrain", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+def create_scheduler(recommender, db, **kwargs):
+    """Tạo scheduler chưa khởi động (None nếu RETRAIN_ENABLED=0)"""
+    if not RETRAIN_ENABLED:
+        return None
+    return RetrainScheduler(recommender, db, **kwargs)
+
+
+def start_scheduler(recommender, db, **kwargs):
+    """Khởi động scheduler (tắt bằng RETRAIN_ENABLED=0)"""
+    scheduler = create_scheduler(recommender, db, **kwargs)
+    if scheduler is not None:
+        scheduler.start()
+    return scheduler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Quản lý phiên bản mô hình: retrain, rollback, liệt kê, dọn dẹp")
+    parser.add_argument("--root", default=DEFAULT_MODEL_DIR, help="Thư mục registry mô hình")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="Liệt kê phiên bản")
+    sub.add_parser("once", help="Huấn luyện + kiểm tra + publish 1 lần")
+    p_rollback = sub.add_parser("rollback", help="Chuyển CURRENT về phiên bản trước (hoặc --to)")
+    p_rollback.add_argument("--to", default=None)
+    p_gc = sub.add_parser("gc", help="Xoá phiên bản cũ")
+    p_gc.add_argument("--keep", type=int, default=RETRAIN_KEEP_VERSIONS)
+    sub.add_parser("daemon", help="Chạy scheduler (dùng cùng serve.py: worker tự reload khi CURRENT đổi)")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        current = current_version(args.root)
+        for version in list_versions(args.root):
+            print(f"{'*' if version == current else ' '} {version}  {os.path.join(args.root, VERSIONS_DIR, version)}")
+    elif args.command == "rollback":
+        try:
+            print(f"⏪ CURRENT → {rollback(args.root, args.to)}")
+        except ValueError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+    elif args.command == "gc":
+        print(f"🧹 Đã xoá: {', '.join(gc_versions(args.root, keep=args.keep)) or '(không có)'}")
+    else:
+        from models.recommender import AdvancedRecommender
+
+        recommender = AdvancedRecommender()
+        scheduler = RetrainScheduler(recommender, recommender.db, root=args.root)
+        if args.command == "once":
+            sys.exit(0 if scheduler.run_once("manual") else 1)
+        scheduler.start()
+        print(f"⏰ Retrain scheduler: mỗi {scheduler.interval:.0f}s hoặc {scheduler.min_new_purchases} lượt mua mới")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            scheduler.stop()
@@ -0,0 +1,71 @@
+import random
+from bisect import bisect_right
+
+# Số lần rút tối đa = REJECTION_FACTOR * n + REJECTION_SLACK; vượt → lọc tường minh phần còn lại của pool
+REJECTION_FACTOR = 4
+REJECTION_SLACK = 32
+
+
+class CatalogSampler:
+    """
+    Lấy mẫu ngẫu nhiên sản phẩm từ catalog trong RAM (thay cho ORDER BY RANDOM() LIMIT n):
+    rút chỉ số ngẫu nhiên trên mảng product_id theo danh mục (ProductCatalog.ids_by_category),
+    loại các sản phẩm nằm trong `exclude` (vd: đã mua) bằng rejection sampling.
+    Chi phí ~O(n) mỗi lần gọi, không phụ thuộc kích thước catalog; cùng `seed` → cùng kết quả.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def _pools(self, categories, min_price=None, max_price=None):
+        catalog = self.catalog.ensure_fresh()
+        if min_price is not None or max_price is not None:
+            # Lọc khoảng giá: mỗi danh mục là 1 slice (bisect) trên mảng product_id sắp theo giá
+            index = catalog.price_index()
+            pools = [index.band_ids(c, min_price, max_price) for c in dict.fromkeys(categories or index.categories)]
+        elif not categories:
+            pools = [catalog.all_ids]
+        else:
+            index = catalog.ids_by_category
+            pools = [index[c] for c in dict.fromkeys(categories) if c in index]
+        return [pool for pool in pools if len(pool)]
+
+    def sample_ids(self, n, categories=None, exclude=(), seed=None, min_price=None, max_price=None):
+        """
+        Tối đa n product_id khác nhau, phân phối đều trên hợp các danh mục `categories` (None = mọi sản phẩm),
+        có giá trong [min_price, max_price] nếu chỉ định, không thuộc `exclude`. Thứ tự kết quả là thứ tự rút.
+        """
+        pools = self._pools(categories, min_price, max_price)
+        if n <= 0 or not pools:
+            return []
+        exclude = exclude if isinstance(exclude, (set, frozenset, dict)) else set(exclude)
+        # Ghép các pool thành 1 dãy chỉ số ảo [0, total): chỉ số → pool qua bisect trên điểm kết thúc
+        ends, total = [], 0
+        for pool in pools:
+            total += len(pool)
+            ends.append(total)
+
+        rng = random.Random(seed)
+        picked, seen = [], set()
+        for _ in range(REJECTION_FACTOR * n + REJECTION_SLACK):
+            if len(picked) >= n:
+                break
+            i = rng.randrange(total)
+            k = bisect_right(ends, i)
+            product_id = pools[k][i - (ends[k - 1] if k else 0)]
+            if product_id in seen or product_id in exclude:
+                continue
+            seen.add(product_id)
+            picked.append(product_id)
+
+        if len(picked) < n:
+            # Phần lớn pool bị loại (khách đã mua gần hết) hoặc n xấp xỉ kích thước pool → lọc 1 lượt
+            remaining = [pid for pool in pools for pid in pool if pid not in seen and pid not in exclude]
+            picked.extend(rng.sample(remaining, min(n - len(picked), len(remaining))))
+        return picked
+
+    def sample(self, n, categories=None, exclude=(), seed=None, min_price=None, max_price=None):
+        """Như sample_ids nhưng trả về dict sản phẩm của catalog"""
+        ids = self.sample_ids(n, categories, exclude, seed, min_price, max_price)
+        products = self.catalog.products
+        return [products[pid] for pid in ids if pid in products]
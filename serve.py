@@ -0,0 +1,234 @@
+# serve.py
+import sys
+import os
+import io
+import time
+import errno
+import signal
+import socket
+import logging
+import argparse
+import contextlib
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+
+# Thêm src vào path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_dir = os.path.join(current_dir, 'src')
+sys.path.append(src_dir)
+
+from models.model_store import RecommenderModel, DEFAULT_MODEL_DIR, read_version, publish
+
+class QuietHandler(WSGIRequestHandler):
+    """Handler wsgiref không ghi access log ra stderr cho từng request"""
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SharedSocketServer(WSGIServer):
+    """WSGIServer dùng lại socket đã mở sẵn ở master (các worker cùng accept trên 1 cổng)"""
+
+    def __init__(self, sock, app):
+        super().__init__(sock.getsockname()[:2], QuietHandler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = sock
+        self.server_name = socket.getfqdn(self.server_address[0])
+        self.server_port = self.server_address[1]
+        self.setup_environ()
+        self.set_app(app)
+
+
+def load_model(model_dir, recommender, train_if_missing):
+    """Nạp artifact mô hình (mmap, theo CURRENT nếu là registry) — hoặc huấn luyện + publish nếu chưa có"""
+    if read_version(model_dir):
+        model = RecommenderModel.load(model_dir, mmap=True)
+        print(f"📦 Đã nạp mô hình {model.version} từ {model_dir} (mmap)")
+        return model
+    if not train_if_missing:
+        return None
+    model = RecommenderModel.train(recommender)
+    if model is not None:
+        publish(model_dir, model)
+        model = RecommenderModel.load(model_dir, mmap=True)
+    return model
+
+
+def _run_closers(closers):
+    """os._exit bỏ qua atexit → gọi trực tiếp các hàm đóng (flush buffer sự kiện, ghi nốt hàng đợi giao dịch)"""
+    for close in closers:
+        try:
+            close()
+        except Exception as e:
+            print(f"❌ Lỗi khi đóng {getattr(close, '__qualname__', close)}: {e}", file=sys.stderr)
+
+
+def worker_loop(sock, app, quiet=True, poll_interval=0.5, closers=()):
+    """
+    Vòng lặp của worker: xử lý từng request; SIGTERM → xong request hiện tại, gọi `closers` rồi thoát
+    """
+    if quiet:
+        # Bỏ các dòng print chi tiết của recommender trong từng request
+        sys.stdout = open(os.devnull, "w")
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    server = SharedSocketServer(sock, app)
+    server.timeout = poll_interval
+    try:
+        while not stopping:
+            try:
+                server.handle_request()
+            except OSError as e:
+                if e.errno != errno.EINTR:
+                    raise
+    finally:
+        _run_closers(closers)
+    os._exit(0)
+
+
+class Master:
+    """
+    Pre-fork master: nạp app + catalog + mô hình MỘT lần rồi fork worker (dùng chung bộ nhớ copy-on-write,
+    ma trận/nhân tử SVD memory-map từ đĩa). Theo dõi phiên bản mô hình → reload mượt: fork thế hệ worker mới
+    rồi mới dừng thế hệ cũ (worker cũ xử lý xong request đang chạy).
+    """
+
+    def __init__(self, app, recommender, db, sock, workers, model_dir, reload_interval, train_if_missing,
+                 quiet=True, closers=()):
+        self.app = app
+        self.recommender = recommender
+        self.db = db
+        self.sock = sock
+        self.n_workers = workers
+        self.model_dir = model_dir
+        self.reload_interval = reload_interval
+        self.train_if_missing = train_if_missing
+        self.quiet = quiet
+        # Hàm đóng worker gọi trước os._exit (EventBuffer.close, GroupCommitWriter.close)
+        self.closers = tuple(closers)
+        self.workers = {}  # pid -> generation
+        self.generation = 0
+        self.model_version = None
+        self._reload_requested = False
+        self._stopping = False
+
+    def prepare(self):
+        """Nạp mô hình + warm-up trong master (trước khi fork)"""
+        from utils import warmup
+        model = load_model(self.model_dir, self.recommender, self.train_if_missing)
+        with contextlib.redirect_stdout(io.StringIO()) if self.quiet else contextlib.nullcontext():
+            state = warmup.run_warmup(self.recommender, self.db, model=model, train_model=False)
+        if not state.ready:
+            raise RuntimeError(f"warm-up thất bại: {state.error}")
+        self.model_version = model.version if model else None
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                worker_loop(self.sock, self.app, quiet=self.quiet, closers=self.closers)
+            finally:
+                os._exit(1)
+        self.workers[pid] = self.generation
+        return pid
+
+    def spawn_generation(self):
+        self.generation += 1
+        for _ in range(self.n_workers):
+            self.spawn()
+        print(f"👷 Thế hệ {self.generation}: {self.n_workers} worker (mô hình {self.model_version})")
+
+    def stop_generation(self, generation):
+        for pid, gen in list(self.workers.items()):
+            if gen == generation:
+                with contextlib.suppress(ProcessLookupError):
+                    os.kill(pid, signal.SIGTERM)
+
+    def reload(self):
+        """Nạp lại mô hình/catalog trong master → fork thế hệ mới → dừng mượt thế hệ cũ"""
+        old_generation = self.generation
+        try:
+            self.prepare()
+        except Exception as e:
+            print(f"❌ Reload thất bại, giữ nguyên worker hiện tại: {e}")
+            return
+        self.spawn_generation()
+        self.stop_generation(old_generation)
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            generation = self.workers.pop(pid, None)
+            if generation == self.generation and not self._stopping:
+                print(f"⚠️ Worker {pid} thoát bất thường (status {status}) → khởi động lại")
+                self.spawn()
+
+    def run(self):
+        signal.signal(signal.SIGHUP, lambda *_: setattr(self, "_reload_requested", True))
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, "_stopping", True))
+        signal.signal(signal.SIGINT, lambda *_: setattr(self, "_stopping", True))
+        self.spawn_generation()
+        next_check = time.monotonic() + self.reload_interval
+        while not self._stopping:
+            time.sleep(0.2)
+            self.reap()
+            if self.reload_interval > 0 and time.monotonic() >= next_check:
+                next_check = time.monotonic() + self.reload_interval
+                version = read_version(self.model_dir)
+                if version and version != self.model_version:
+                    print(f"🔄 Phiên bản mô hình đổi thành {version} (đang chạy {self.model_version})")
+                    self._reload_requested = True
+            if self._reload_requested:
+                self._reload_requested = False
+                self.reload()
+
+        print("🛑 Đang dừng các worker...")
+        for pid in list(self.workers):
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + 30
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in list(self.workers):
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGKILL)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Server production: pre-fork WSGI, dùng chung mô hình chỉ đọc")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--model-dir", default=DEFAULT_MODEL_DIR, help="Thư mục artifact mô hình (model_store)")
+    parser.add_argument("--no-train", action="store_true", help="Không tự huấn luyện khi chưa có artifact")
+    parser.add_argument("--reload-interval", type=float, default=10.0,
+                        help="Chu kỳ (giây) kiểm tra phiên bản mô hình mới; 0 = chỉ reload khi nhận SIGHUP")
+    parser.add_argument("--backlog", type=int, default=256)
+    parser.add_argument("--verbose", action="store_true", help="Giữ log chi tiết của app")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.INFO)
+
+    sink = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with sink:
+        from main import app, recommender, db, event_buffer, purchase_writer
+        db.create_tables()
+
+    sock = socket.create_server((args.host, args.port), backlog=args.backlog)
+    sock.set_inheritable(True)
+
+    master = Master(app, recommender, db, sock, args.workers, args.model_dir, args.reload_interval,
+                    train_if_missing=not args.no_train, quiet=not args.verbose,
+                    closers=(event_buffer.close, purchase_writer.close))
+    master.prepare()
+    print(f"🚀 Serving http://{args.host}:{args.port} với {args.workers} worker (pid master {os.getpid()})")
+    print("   SIGHUP → reload mô hình/catalog | SIGTERM → dừng mượt")
+    master.run()
@@ -0,0 +1,257 @@
+import os
+import sys
+import contextlib
+
+# Bộ đếm thống kê lưu sẵn trong database, được trigger cập nhật tăng dần ở mỗi lần ghi:
+# dashboard/thẻ khách hàng đọc 1 dòng thay vì quét + join toàn bộ purchase_history.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS system_stats (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    customers INTEGER NOT NULL DEFAULT 0,
+    products INTEGER NOT NULL DEFAULT 0,
+    purchases INTEGER NOT NULL DEFAULT 0,
+    revenue REAL NOT NULL DEFAULT 0,
+    rating_sum REAL NOT NULL DEFAULT 0,
+    rating_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS customer_stats (
+    customer_id INTEGER PRIMARY KEY,
+    purchases INTEGER NOT NULL DEFAULT 0,
+    spent REAL NOT NULL DEFAULT 0,
+    rating_sum REAL NOT NULL DEFAULT 0,
+    rating_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_purchase_history_product ON purchase_history(product_id);
+"""
+
+# Ngữ nghĩa giống truy vấn gốc:
+# - system: purchases = COUNT(*) mọi giao dịch, revenue = SUM(price * quantity) qua JOIN products,
+#   avg_rating = AVG(rating) với rating > 0
+# - customer: chỉ giao dịch có sản phẩm tồn tại (JOIN), avg_rating = AVG(rating)
+_PRICE = "(SELECT price FROM products WHERE product_id = {r}.product_id)"
+_EXISTS = "EXISTS (SELECT 1 FROM products WHERE product_id = {r}.product_id)"
+
+
+def _purchase_delta(r, sign):
+    price, exists = _PRICE.format(r=r), _EXISTS.format(r=r)
+    return f"""
+        UPDATE system_stats SET
+            purchases = purchases {sign} 1,
+            revenue = revenue {sign} COALESCE({price} * {r}.quantity, 0),
+            rating_sum = rating_sum {sign} (CASE WHEN {r}.rating > 0 THEN {r}.rating ELSE 0 END),
+            rating_count = rating_count {sign} COALESCE({r}.rating > 0, 0)
+        WHERE id = 1;
+        INSERT OR IGNORE INTO customer_stats (customer_id)
+        SELECT {r}.customer_id WHERE {r}.customer_id IS NOT NULL AND {exists};
+        UPDATE customer_stats SET
+            purchases = purchases {sign} 1,
+            spent = spent {sign} COALESCE({price} * {r}.quantity, 0),
+            rating_sum = rating_sum {sign} COALESCE({r}.rating, 0),
+            rating_count = rating_count {sign} ({r}.rating IS NOT NULL)
+        WHERE customer_id = {r}.customer_id AND {exists};
+    """
+
+
+def _product_delta(r, sign, count_product=True):
+    """Sản phẩm xuất hiện/biến mất (hoặc đổi giá = rút giá cũ, thêm giá mới) → giao dịch của nó vào/ra khỏi JOIN"""
+    return f"""
+        UPDATE system_stats SET
+            products = products {sign} {1 if count_product else 0},
+            revenue = revenue {sign} COALESCE({r}.price, 0) * COALESCE(
+                (SELECT SUM(quantity) FROM purchase_history WHERE product_id = {r}.product_id), 0)
+        WHERE id = 1;
+        INSERT OR IGNORE INTO customer_stats (customer_id)
+        SELECT DISTINCT customer_id FROM purchase_history
+        WHERE product_id = {r}.product_id AND customer_id IS NOT NULL;
+        UPDATE customer_stats SET
+            purchases = purchases {sign} (SELECT COUNT(*) FROM purchase_history ph
+                WHERE ph.product_id = {r}.product_id AND ph.customer_id = customer_stats.customer_id),
+            spent = spent {sign} COALESCE({r}.price, 0) * (SELECT SUM(quantity) FROM purchase_history ph
+                WHERE ph.product_id = {r}.product_id AND ph.customer_id = customer_stats.customer_id),
+            rating_sum = rating_sum {sign} (SELECT COALESCE(SUM(rating), 0) FROM purchase_history ph
+                WHERE ph.product_id = {r}.product_id AND ph.customer_id = customer_stats.customer_id),
+            rating_count = rating_count {sign} (SELECT COUNT(rating) FROM purchase_history ph
+                WHERE ph.product_id = {r}.product_id AND ph.customer_id = customer_stats.customer_id)
+        WHERE customer_id IN (SELECT customer_id FROM purchase_history WHERE product_id = {r}.product_id);
+    """
+
+
+TRIGGERS = {
+    "stats_purchase_insert": f"AFTER INSERT ON purchase_history BEGIN {_purchase_delta('NEW', '+')} END",
+    "stats_purchase_delete": f"AFTER DELETE ON purchase_history BEGIN {_purchase_delta('OLD', '-')} END",
+    "stats_purchase_update": (f"AFTER UPDATE ON purchase_history BEGIN "
+                              f"{_purchase_delta('OLD', '-')} {_purchase_delta('NEW', '+')} END"),
+    "stats_product_insert": f"AFTER INSERT ON products BEGIN {_product_delta('NEW', '+')} END",
+    "stats_product_delete": f"AFTER DELETE ON products BEGIN {_product_delta('OLD', '-')} END",
+    "stats_product_price": ("AFTER UPDATE OF price ON products WHEN OLD.price IS NOT NEW.price BEGIN "
+                            f"{_product_delta('OLD', '-', False)} {_product_delta('NEW', '+', False)} END"),
+    "stats_customer_insert": "AFTER INSERT ON customers BEGIN "
+                             "UPDATE system_stats SET customers = customers + 1 WHERE id = 1; END",
+    "stats_customer_delete": "AFTER DELETE ON customers BEGIN "
+                             "UPDATE system_stats SET customers = customers - 1 WHERE id = 1; END",
+}
+
+
+def install(conn):
+    """Tạo bảng thống kê + trigger (idempotent); lần đầu (chưa có dòng system_stats) thì tính lại từ dữ liệu"""
+    conn.executescript(SCHEMA)
+    for name, body in TRIGGERS.items():
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+    if conn.execute("SELECT 1 FROM system_stats WHERE id = 1").fetchone() is None:
+        recompute(conn)
+    conn.commit()
+
+
+def drop_triggers(conn):
+    for name in TRIGGERS:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def recompute(conn):
+    """
+    Tính lại toàn bộ bộ đếm bằng MỘT lượt quét purchase_history (GROUP BY khách hàng, LEFT JOIN products);
+    thống kê hệ thống là tổng của các dòng theo khách. Dùng để đối soát hoặc sau khi nạp hàng loạt.
+    """
+    conn.executescript("""
+        BEGIN IMMEDIATE;
+        DROP TABLE IF EXISTS temp.stats_per_customer;
+        CREATE TEMP TABLE stats_per_customer AS
+        SELECT
+            ph.customer_id,
+            COUNT(*) AS all_purchases,
+            COUNT(p.product_id) AS purchases,
+            COALESCE(SUM(p.price * ph.quantity), 0) AS spent,
+            COALESCE(SUM(CASE WHEN p.product_id IS NOT NULL THEN ph.rating END), 0) AS rating_sum,
+            COUNT(CASE WHEN p.product_id IS NOT NULL THEN ph.rating END) AS rating_count,
+            COALESCE(SUM(CASE WHEN ph.rating > 0 THEN ph.rating ELSE 0 END), 0) AS positive_rating_sum,
+            COALESCE(SUM(ph.rating > 0), 0) AS positive_rating_count
+        FROM purchase_history ph
+        LEFT JOIN products p ON p.product_id = ph.product_id
+        GROUP BY ph.customer_id;
+
+        DELETE FROM customer_stats;
+        INSERT INTO customer_stats (customer_id, purchases, spent, rating_sum, rating_count)
+        SELECT customer_id, purchases, spent, rating_sum, rating_count
+        FROM stats_per_customer
+        WHERE customer_id IS NOT NULL AND purchases > 0;
+
+        INSERT OR REPLACE INTO system_stats (id, customers, products, purchases, revenue, rating_sum, rating_count)
+        SELECT 1,
+               (SELECT COUNT(*) FROM customers),
+               (SELECT COUNT(*) FROM products),
+               COALESCE(SUM(all_purchases), 0),
+               COALESCE(SUM(spent), 0),
+               COALESCE(SUM(positive_rating_sum), 0),
+               COALESCE(SUM(positive_rating_count), 0)
+        FROM stats_per_customer;
+
+        DROP TABLE temp.stats_per_customer;
+        COMMIT;
+    """)
+
+
+@contextlib.contextmanager
+def suspended(conn):
+    """Tắt trigger thống kê khi nạp dữ liệu hàng loạt; kết thúc bằng 1 lần recompute"""
+    drop_triggers(conn)
+    conn.commit()
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        recompute(conn)
+        install(conn)
+
+
+def read_system_stats(conn):
+    row = conn.execute(
+        "SELECT customers, products, purchases, revenue, rating_sum, rating_count FROM system_stats WHERE id = 1"
+    ).fetchone()
+    if row is None:
+        return None
+    customers, products, purchases, revenue, rating_sum, rating_count = row
+    return {
+        'total_customers': customers,
+        'total_products': products,
+        'total_purchases': purchases,
+        'total_revenue': revenue or 0,
+        'avg_rating': rating_sum / rating_count if rating_count else 0,
+    }
+
+
+def read_customer_stats(conn, customer_id):
+    row = conn.execute(
+        "SELECT purchases, spent, rating_sum, rating_count FROM customer_stats WHERE customer_id = ?",
+        (customer_id,),
+    ).fetchone()
+    purchases, spent, rating_sum, rating_count = row or (0, 0, 0, 0)
+    return {
+        'total_purchases': purchases,
+        'total_spent': spent,
+        'avg_rating': round(rating_sum / rating_count, 1) if rating_count else 0,
+    }
+
+
+def check(conn):
+    """So sánh bộ đếm đang lưu với giá trị tính lại → danh sách sai lệch (rỗng = khớp)"""
+    stored_system = read_system_stats(conn)
+    stored_customers = {r[0]: r[1:] for r in conn.execute(
+        "SELECT customer_id, purchases, ROUND(spent, 2), rating_sum, rating_count FROM customer_stats "
+        "WHERE purchases > 0")}
+    expected_customers = {r[0]: r[1:] for r in conn.execute("""
+        SELECT ph.customer_id, COUNT(*), COALESCE(ROUND(SUM(p.price * ph.quantity), 2), 0),
+               COALESCE(SUM(ph.rating), 0), COUNT(ph.rating)
+        FROM purchase_history ph JOIN products p ON p.product_id = ph.product_id
+        WHERE ph.customer_id IS NOT NULL
+        GROUP BY ph.customer_id
+    """)}
+
+    expected_system = {
+        'total_customers': conn.execute("SELECT COUNT(*) FROM customers").fetchone()[0],
+        'total_products': conn.execute("SELECT COUNT(*) FROM products").fetchone()[0],
+        'total_purchases': conn.execute("SELECT COUNT(*) FROM purchase_history").fetchone()[0],
+        'total_revenue': conn.execute(
+            "SELECT SUM(p.price * ph.quantity) FROM purchase_history ph JOIN products p "
+            "ON ph.product_id = p.product_id").fetchone()[0] or 0,
+        'avg_rating': conn.execute(
+            "SELECT AVG(rating) FROM purchase_history WHERE rating > 0").fetchone()[0] or 0,
+    }
+    problems = []
+    for key, value in expected_system.items():
+        stored = (stored_system or {}).get(key)
+        if stored is None or abs(stored - value) > 1e-6 * max(1, abs(value)):
+            problems.append(f"system.{key}: lưu {stored}, thực tế {value}")
+    for customer_id in sorted(set(stored_customers) | set(expected_customers)):
+        stored, expected = stored_customers.get(customer_id), expected_customers.get(customer_id)
+        if stored != expected:
+            problems.append(f"customer {customer_id}: lưu {stored}, thực tế {expected}")
+    return problems
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.append(os.path.dirname(current_dir))
+    from utils.database import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Đối soát / tính lại bảng thống kê")
+    parser.add_argument("--check", action="store_true", help="Chỉ so sánh, không sửa")
+    args = parser.parse_args()
+
+    db = DatabaseManager()
+    db.create_tables()
+    conn = db.connect()
+    try:
+        if args.check:
+            problems = check(conn)
+            print("\n".join(problems) if problems else "✅ Bộ đếm khớp với dữ liệu")
+            sys.exit(1 if problems else 0)
+        start = time.perf_counter()
+        recompute(conn)
+        print(f"✅ Đã tính lại thống kê trong {time.perf_counter() - start:.2f}s: {read_system_stats(conn)}")
+    finally:
+        conn.close()
@@ -0,0 +1,78 @@
+import json
+import time
+
+try:
+    from utils.metrics import RECOMMENDATIONS, RECOMMEND_LATENCY, algorithm_context
+except ImportError:
+    from metrics import RECOMMENDATIONS, RECOMMEND_LATENCY, algorithm_context
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+SSE_MIMETYPE = "text/event-stream"
+
+
+def iter_chunks(recommender, customer_id, n_recommendations=10, algorithm="hybrid"):
+    """
+    Gợi ý lũy tiến: mỗi chunk là 1 bản xếp hạng đầy đủ (thay thế bản trước), gắn
+    `version` (tăng dần), `source` vừa xong, `completeness` (tỉ lệ nguồn đã xong) và `complete`.
+    Hybrid: chunk đầu chỉ từ popular (catalog cache, gần như tức thì), sau đó cập nhật khi content,
+    collaborative, svd lần lượt xong. Thuật toán khác: 1 chunk duy nhất.
+    Toàn bộ stream dùng cùng 1 phiên bản mô hình (ghim lúc bắt đầu).
+    """
+    model = recommender.model
+    model_version = getattr(model, "version", None)
+    start = time.perf_counter()
+
+    def chunk(version, source, done, total, results):
+        return {
+            "version": version,
+            "source": source,
+            "sources_done": done,
+            "completeness": round(len(done) / total, 2),
+            "complete": len(done) == total,
+            "model_version": model_version,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+            "recommendations": results,
+            "count": len(results),
+        }
+
+    if algorithm != "hybrid":
+        # recommend_products tự ghi metric gợi ý
+        results = recommender.recommend_products(customer_id, n_recommendations, algorithm)
+        yield chunk(1, algorithm, [algorithm], 1, results)
+        return
+
+    RECOMMENDATIONS.inc(algorithm=algorithm)
+    try:
+        steps = recommender.iter_hybrid_recommendation(customer_id, n_recommendations, model=model)
+        version = 0
+        while True:
+            # Context của span chỉ bao quanh từng bước, không vắt qua yield
+            with algorithm_context(algorithm):
+                step = next(steps, None)
+            if step is None:
+                return
+            version += 1
+            source, done, total, results = step
+            if results or len(done) == total:
+                yield chunk(version, source, done, total, results)
+    except Exception as e:
+        print(f"❌ Lỗi stream gợi ý: {e}")
+        yield {"error": str(e), "complete": True, "model_version": model_version,
+               "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)}
+    finally:
+        RECOMMEND_LATENCY.observe(time.perf_counter() - start, algorithm=algorithm)
+
+
+def ndjson(chunks):
+    """Mỗi chunk 1 dòng JSON (application/x-ndjson)"""
+    for c in chunks:
+        yield json.dumps(c, ensure_ascii=False) + "\n"
+
+
+def sse(chunks):
+    """Server-Sent Events: event `partial`/`final`/`error`, id = version của bản xếp hạng"""
+    yield "retry: 10000\n\n"
+    for c in chunks:
+        event = "error" if "error" in c else ("final" if c["complete"] else "partial")
+        data = json.dumps(c, ensure_ascii=False)
+        yield f"event: {event}\nid: {c.get('version', 0)}\ndata: {data}\n\n"
@@ -0,0 +1,46 @@
+# test_columnar.py
+import sys
+import os
+import time
+import sqlite3
+
+import pytest
+
+# Thêm src vào path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_dir = os.path.join(current_dir, 'src')
+sys.path.append(src_dir)
+
+pytest.importorskip("pyarrow")
+pd = pytest.importorskip("pandas")
+
+try:
+    from utils.columnar import load_interactions
+except ImportError:
+    from columnar import load_interactions
+
+
+@pytest.fixture
+def local_timezone(monkeypatch):
+    """Giờ máy lệch UTC (+7) để lộ lỗi trộn giờ địa phương với giờ UTC của SQLite"""
+    monkeypatch.setenv("TZ", "Asia/Ho_Chi_Minh")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_days_since_purchase_matches_sql(tmp_path, local_timezone):
+    conn = sqlite3.connect(":memory:")
+    offsets = ["-20 hours", "-3 days", "-30 days"]
+    dates = [conn.execute("SELECT datetime('now', ?)", (o,)).fetchone()[0] for o in offsets] + [None]
+    expected = [conn.execute("SELECT CAST((julianday('now') - julianday(?)) AS INTEGER)", (d,)).fetchone()[0] or 0
+                for d in dates]
+    conn.close()
+
+    path = str(tmp_path / "interactions.parquet")
+    pd.DataFrame({"customer_id": [1, 1, 2, 2], "product_id": [10, 11, 10, 12],
+                  "purchase_date": dates}).to_parquet(path)
+
+    df = load_interactions(path, columns=["customer_id", "product_id", "purchase_date"])
+    assert df["days_since_purchase"].tolist() == expected == [0, 3, 30, 0]
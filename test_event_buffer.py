@@ -0,0 +1,76 @@
+# test_event_buffer.py
+import sys
+import os
+import time
+import sqlite3
+
+import pytest
+
+# Thêm src vào path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_dir = os.path.join(current_dir, 'src')
+sys.path.append(src_dir)
+
+try:
+    from utils.database import DatabaseManager
+    from utils import event_buffer
+except ImportError:
+    from database import DatabaseManager
+    import event_buffer
+
+OLD = time.time() - 30 * 86400
+
+
+class _Db:
+    def __init__(self, path):
+        self.path = path
+
+    def connect(self):
+        return sqlite3.connect(self.path)
+
+
+def _legacy_db(path):
+    """Database tạo trước khi interaction_events có AUTOINCREMENT"""
+    conn = sqlite3.connect(path)
+    conn.executescript(event_buffer.SCHEMA.replace("INTEGER PRIMARY KEY AUTOINCREMENT", "INTEGER PRIMARY KEY"))
+    conn.close()
+    return _Db(path)
+
+
+@pytest.fixture(params=["current", "legacy"])
+def db(request, tmp_path):
+    path = str(tmp_path / "events.db")
+    if request.param == "legacy":
+        return _legacy_db(path)
+    db = DatabaseManager(path)
+    db.create_tables()
+    return db
+
+
+def _insert(db, events):
+    conn = db.connect()
+    try:
+        conn.executemany("INSERT INTO interaction_events (customer_id, product_id, event_type, created_at) "
+                         "VALUES (?, ?, ?, ?)", events)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def test_events_after_retention_delete_are_rolled_up(db):
+    """Sự kiện cũ đã rollup bị xoá theo retention → event_id mới vẫn lớn hơn vị trí rollup"""
+    _insert(db, [(1, 10, 1, OLD), (1, 11, 2, OLD), (2, 10, 1, OLD)])
+    assert event_buffer.rollup(db, retention_days=7) == 3
+
+    _insert(db, [(1, 10, event_buffer.EVENT_TYPES["add_to_cart"], time.time())])
+    assert event_buffer.rollup(db, retention_days=7) == 1
+    assert event_buffer.rollup(db, retention_days=7) == 0
+
+    conn = db.connect()
+    try:
+        weight, count = conn.execute("SELECT weight, event_count FROM interaction_weights "
+                                     "WHERE customer_id = 1 AND product_id = 10").fetchone()
+    finally:
+        conn.close()
+    assert count == 2
+    assert weight == pytest.approx(event_buffer.EVENT_WEIGHTS["view"] + event_buffer.EVENT_WEIGHTS["add_to_cart"])
@@ -0,0 +1,68 @@
+# test_interaction_matrix.py
+import sys
+import os
+
+import numpy as np
+import pytest
+
+# Thêm src vào path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_dir = os.path.join(current_dir, 'src')
+sys.path.append(src_dir)
+
+try:
+    from utils.database import DatabaseManager
+except ImportError:
+    from database import DatabaseManager
+
+recommender_module = pytest.importorskip("models.recommender", reason="cần layout src/ để import recommender")
+retrain = pytest.importorskip("models.retrain")
+model_store = pytest.importorskip("models.model_store")
+
+# (customer_id, product_id, purchase_date): khách 2 chỉ có giao dịch không ngày, sản phẩm 13 chỉ được mua không ngày
+PURCHASES = [
+    (1, 10, "now"), (1, 11, "now"), (1, 12, None),
+    (2, 13, None),
+    (3, 10, "now"), (3, 12, "now"),
+    (4, 11, "now"), (4, 12, "now"), (4, 10, None),
+]
+
+
+@pytest.fixture
+def recommender(tmp_path):
+    db = DatabaseManager(str(tmp_path / "matrix.db"))
+    db.create_tables()
+    conn = db.connect()
+    try:
+        conn.executemany("INSERT INTO customers (customer_id, name) VALUES (?, ?)",
+                         [(c, f"Khách {c}") for c in range(1, 5)])
+        conn.executemany("INSERT INTO products (product_id, name, category, price, brand) VALUES (?, ?, ?, ?, ?)",
+                         [(p, f"SP {p}", "Thực phẩm", 10000, "A") for p in range(10, 14)])
+        conn.executemany("INSERT INTO purchase_history (customer_id, product_id, quantity, rating, purchase_date) "
+                         "VALUES (?, ?, 1, 4, CASE WHEN ? IS NULL THEN NULL ELSE datetime('now') END)", PURCHASES)
+        conn.commit()
+    finally:
+        conn.close()
+    return recommender_module.AdvancedRecommender(db=db)
+
+
+@pytest.mark.parametrize("mode", ["dense", "sparse"])
+def test_undated_purchases_keep_matrix_aligned_with_ids(recommender, monkeypatch, mode):
+    if mode == "sparse":
+        monkeypatch.setattr(recommender.memory_budget, "allows", lambda stage, *args: stage != "matrix.pivot")
+    matrix, user_ids, product_ids = recommender.get_interaction_matrix()
+
+    assert list(user_ids) == [1, 2, 3, 4]
+    assert list(product_ids) == [10, 11, 12, 13]
+    assert matrix.shape == (4, 4)
+    dense = matrix.toarray() if mode == "sparse" else matrix
+    assert np.all(np.isfinite(dense))
+    # Hàng/cột chỉ có giao dịch không ngày vẫn tồn tại, toàn 0; các hàng khác đúng khách của mình
+    assert not dense[1].any() and not dense[:, 3].any()
+    assert (dense[2] > 0).tolist() == [True, False, True, False]
+    assert (dense[3] > 0).tolist() == [False, True, True, False]
+
+
+def test_model_with_undated_purchases_passes_validation(recommender):
+    model = model_store.RecommenderModel.train(recommender, k=2)
+    assert retrain.validate_model(model) is model
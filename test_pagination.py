@@ -0,0 +1,61 @@
+# test_pagination.py
+import sys
+import os
+
+# Thêm src vào path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_dir = os.path.join(current_dir, 'src')
+sys.path.append(src_dir)
+
+try:
+    from models.pagination import RecommendationPager
+except ImportError:
+    from pagination import RecommendationPager
+
+
+class FakeRecommender:
+    """Danh sách xếp hạng cố định 1..50, bỏ các sản phẩm đã gợi ý trong phiên (như recommend_products)"""
+
+    model = None
+
+    def __init__(self):
+        self._current_customer_id = None
+        self._session_recommended_ids = set()
+
+    def reset_for_new_customer(self, customer_id):
+        self._current_customer_id = customer_id
+        self._session_recommended_ids = set()
+
+    def recommend_products(self, customer_id, n, algorithm):
+        if self._current_customer_id != customer_id:
+            self.reset_for_new_customer(customer_id)
+        items = [{"product_id": pid} for pid in range(1, 51) if pid not in self._session_recommended_ids][:n]
+        self._session_recommended_ids.update(p["product_id"] for p in items)
+        return items
+
+
+def _ids(page):
+    return [p["product_id"] for p in page["recommendations"]]
+
+
+def test_next_page_on_another_worker_does_not_repeat_shown_items():
+    first = RecommendationPager(FakeRecommender(), depth=20).page("s1", 7, n=5)
+    # Worker khác (cache và tập phiên riêng) nhận cursor của trang đầu
+    other = RecommendationPager(FakeRecommender(), depth=20)
+    second = other.page("s1", 7, n=5, cursor=first["next_cursor"])
+    third = other.page("s1", 7, n=5, cursor=second["next_cursor"])
+    assert _ids(first) == [1, 2, 3, 4, 5]
+    assert _ids(second) == [6, 7, 8, 9, 10]
+    assert _ids(third) == [11, 12, 13, 14, 15]
+
+
+def test_cached_page_does_not_touch_other_customer_session():
+    recommender = FakeRecommender()
+    pager = RecommendationPager(recommender, depth=20)
+    first = pager.page("s1", 7, n=5)
+    # Recommender dùng chung chuyển sang khách 8 (request khác), rồi khách 7 xem tiếp từ cache
+    recommender.recommend_products(8, 3, "hybrid")
+    second = pager.page("s1", 7, n=5, cursor=first["next_cursor"])
+    assert _ids(second) == [6, 7, 8, 9, 10]
+    assert recommender._current_customer_id == 8
+    assert recommender._session_recommended_ids == {1, 2, 3}
@@ -0,0 +1,61 @@
+# test_phones.py
+import sys
+import os
+import sqlite3
+
+import pytest
+
+# Thêm src vào path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_dir = os.path.join(current_dir, 'src')
+sys.path.append(src_dir)
+
+try:
+    from utils.phones import normalize_phone, sql_expression
+except ImportError:
+    from phones import normalize_phone, sql_expression
+
+# (SĐT nhập vào, dạng chuẩn mong đợi)
+PHONE_FORMATS = [
+    ("0899590556", "0899590556"),
+    ("899590556", "0899590556"),
+    ("+84899590556", "0899590556"),
+    ("+84 899 590 556", "0899590556"),
+    ("+840899590556", "0899590556"),
+    ("0084899590556", "0899590556"),
+    ("0084-899-590-556", "0899590556"),
+    ("84899590556", "0899590556"),          # 84 + 9 số = 11 ký tự
+    ("84912345678", "0912345678"),
+    ("841234567890", "01234567890"),        # 84 + 10 số = 12 ký tự
+    ("8489959055", "08489959055"),          # 10 ký tự: không phải mã quốc gia
+    ("8412345678901", "08412345678901"),    # 13 ký tự: không phải mã quốc gia
+    ("0899.590.556", "0899590556"),
+    ("(089) 959-0556", "0899590556"),
+    ("  0899590556\t", "0899590556"),
+    ("0899 590 556\n", "0899590556"),
+    ("", None),
+    ("   ", None),
+    (" - . ", None),
+    (None, None),
+]
+
+
+@pytest.fixture(scope="module")
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE customers (phone TEXT)")
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize("raw,expected", PHONE_FORMATS)
+def test_normalize_phone(raw, expected):
+    assert normalize_phone(raw) == expected
+
+
+@pytest.mark.parametrize("raw,expected", PHONE_FORMATS)
+def test_sql_expression_matches_normalize_phone(conn, raw, expected):
+    """Cột sinh phone_normalized (SQLite) phải cho cùng kết quả với normalize_phone (Python)"""
+    conn.execute("DELETE FROM customers")
+    conn.execute("INSERT INTO customers (phone) VALUES (?)", (raw,))
+    assert conn.execute(f"SELECT {sql_expression()} FROM customers").fetchone()[0] == expected
@@ -0,0 +1,115 @@
+# test_purchase_history.py
+import sys
+import os
+import json
+import base64
+import importlib.util
+
+import pytest
+
+# Thêm src vào path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_dir = os.path.join(current_dir, 'src')
+sys.path.append(src_dir)
+
+try:
+    from utils.database import DatabaseManager
+except ImportError:
+    from database import DatabaseManager
+
+CUSTOMER_ID = 1
+
+# (customer_id, purchase_date) — nhiều giao dịch trùng ngày giờ, vài giao dịch không có ngày,
+# xen kẽ giao dịch của khách khác
+PURCHASES = [
+    (1, "2024-03-01 10:00:00"),
+    (1, "2024-03-02 09:00:00"),
+    (2, "2024-03-02 09:00:00"),
+    (1, None),
+    (1, "2024-03-02 09:00:00"),
+    (1, "2024-03-02 09:00:00"),
+    (2, None),
+    (1, "2024-02-28 23:59:59"),
+    (1, None),
+    (1, "2024-03-05 08:30:00"),
+    (1, "2024-03-02 09:00:00"),
+    (1, None),
+    (1, "2024-03-01 10:00:00"),
+]
+
+
+def _encode(data):
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+
+
+TAMPERED_CURSORS = [
+    "không-phải-cursor",
+    "eyJkIjogMX0",                                  # base64 hợp lệ nhưng thiếu khoá
+    _encode({"d": 20240302, "i": 5}),               # purchase_date không phải chuỗi
+    _encode({"d": "2024-03-02 09:00:00", "i": "x"}),
+    _encode(["2024-03-02 09:00:00", 5]),
+]
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = DatabaseManager(str(tmp_path / "history.db"))
+    db.create_tables()
+    conn = db.connect()
+    try:
+        conn.executemany("INSERT INTO customers (customer_id, name, phone) VALUES (?, ?, ?)",
+                         [(1, "Khách 1", "0899590556"), (2, "Khách 2", "0912345678")])
+        conn.executemany("INSERT INTO products (product_id, name, category, price, brand) VALUES (?, ?, ?, ?, ?)",
+                         [(10, "Sữa tươi", "Thực phẩm", 30000, "Vinamilk"), (11, "Bánh quy", "Thực phẩm", 25000, "Oreo")])
+        conn.executemany("INSERT INTO purchase_history (purchase_id, customer_id, product_id, quantity, rating, "
+                         "purchase_date) VALUES (?, ?, ?, 1, 5, ?)",
+                         [(i, customer_id, 10 + i % 2, date) for i, (customer_id, date) in enumerate(PURCHASES, 1)])
+        conn.commit()
+    finally:
+        conn.close()
+    return db
+
+
+def _expected_ids():
+    """Mới nhất trước theo (purchase_date, purchase_id), giao dịch không có ngày ở cuối"""
+    own = [(i, date) for i, (customer_id, date) in enumerate(PURCHASES, 1) if customer_id == CUSTOMER_ID]
+    dated = sorted((p for p in own if p[1] is not None), key=lambda p: (p[1], p[0]), reverse=True)
+    undated = sorted((p for p in own if p[1] is None), reverse=True)
+    return [i for i, _ in dated + undated]
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 4, 7, 20])
+def test_pages_have_no_duplicates_or_gaps(db, limit):
+    ids, cursor, pages = [], None, 0
+    while True:
+        page = db.get_purchase_history_page(CUSTOMER_ID, limit, cursor)
+        assert 0 < len(page["items"]) <= limit
+        ids += [item["purchase_id"] for item in page["items"]]
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+        assert pages <= len(PURCHASES)
+    assert ids == _expected_ids()
+
+
+@pytest.mark.parametrize("cursor", TAMPERED_CURSORS)
+def test_tampered_cursor_is_rejected(db, cursor):
+    with pytest.raises(ValueError):
+        db.get_purchase_history_page(CUSTOMER_ID, 3, cursor)
+
+
+@pytest.mark.skipif(importlib.util.find_spec("models") is None, reason="cần layout src/ để import main")
+@pytest.mark.parametrize("cursor", TAMPERED_CURSORS)
+def test_tampered_cursor_returns_400(db, monkeypatch, cursor):
+    main = pytest.importorskip("main")
+    monkeypatch.setattr(main, "db", db)
+    client = main.app.test_client()
+
+    response = client.get(f"/api/customer/{CUSTOMER_ID}/purchases", query_string={"limit": 3, "cursor": cursor})
+    assert response.status_code == 400
+    assert response.get_json()["success"] is False
+
+    response = client.get(f"/api/customer/{CUSTOMER_ID}/purchases", query_string={"limit": 3})
+    assert response.status_code == 200
+    assert [p["purchase_id"] for p in response.get_json()["purchases"]] == _expected_ids()[:3]
@@ -0,0 +1,66 @@
+# test_purchase_writer.py
+import sys
+import os
+import sqlite3
+
+import pytest
+
+# Thêm src vào path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_dir = os.path.join(current_dir, 'src')
+sys.path.append(src_dir)
+
+try:
+    from utils.purchase_writer import GroupCommitWriter, _Pending
+except ImportError:
+    from purchase_writer import GroupCommitWriter, _Pending
+
+SCHEMA = """
+    CREATE TABLE customers (customer_id INTEGER PRIMARY KEY);
+    CREATE TABLE products (product_id INTEGER PRIMARY KEY);
+    CREATE TABLE purchase_history (
+        purchase_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        customer_id INTEGER REFERENCES customers(customer_id),
+        product_id INTEGER REFERENCES products(product_id),
+        quantity INTEGER DEFAULT 1,
+        rating INTEGER DEFAULT 5 CHECK (rating BETWEEN 1 AND 5),
+        purchase_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    INSERT INTO customers VALUES (1), (2);
+    INSERT INTO products VALUES (10), (11);
+"""
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "writer.db"))
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.executescript(SCHEMA)
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize("bad_row", [
+    (1, 999, 1, 5, None),   # vi phạm khoá ngoại: sản phẩm không tồn tại
+    (2, 10, 1, 9, None),    # vi phạm CHECK: rating ngoài 1..5
+], ids=["foreign_key", "check"])
+def test_commit_isolates_failed_write_in_batch(conn, bad_row):
+    """Lô có 1 lệnh hỏng: lệnh hợp lệ vẫn được commit, chỉ lệnh hỏng nhận lỗi"""
+    writer = GroupCommitWriter(db=None)
+    good = _Pending([(1, 10, 2, 4, "2024-05-01 10:00:00")])
+    bad = _Pending([(1, 11, 1, 5, None), bad_row])
+    after = _Pending([(2, 11, 1, 3, None)])
+
+    writer._commit(conn, [good, bad, after])
+
+    for pending in (good, bad, after):
+        assert pending.done.is_set()
+    assert good.error is None and len(good.purchase_ids) == 1
+    assert after.error is None and len(after.purchase_ids) == 1
+    assert isinstance(bad.error, sqlite3.IntegrityError)
+    assert bad.purchase_ids is None
+
+    rows = conn.execute("SELECT purchase_id, customer_id, product_id FROM purchase_history "
+                        "ORDER BY purchase_id").fetchall()
+    # Lệnh hỏng bị rollback toàn bộ, kể cả dòng hợp lệ đi cùng nó
+    assert rows == [(good.purchase_ids[0], 1, 10), (after.purchase_ids[0], 2, 11)]
@@ -75,6 +75,17 @@ def test_all_apis():
             print(f"   Recommendations: {len(data.get('recommendations', []))} sản phẩm")
     except Exception as e:
         print(f"   ❌ Lỗi: {e}")
+    
+    # Test 5: Metrics
+    print("\n5. 📈 Testing /api/metrics...")
+    try:
+        response = requests.get(f"{base_url}/api/metrics")
+        lines = [l for l in response.text.splitlines() if l and not l.startswith('#')]
+        print(f"   Status: {response.status_code}")
+        print(f"   Content-Type: {response.headers.get('Content-Type')}")
+        print(f"   Series: {len(lines)}")
+    except Exception as e:
+        print(f"   ❌ Lỗi: {e}")
 
 if __name__ == "__main__":
     test_all_apis()
\ No newline at end of file
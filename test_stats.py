@@ -0,0 +1,32 @@
+# test_stats.py
+import sys
+import os
+
+# Thêm src vào path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_dir = os.path.join(current_dir, 'src')
+sys.path.append(src_dir)
+
+try:
+    from utils.database import DatabaseManager
+    from utils import stats
+except ImportError:
+    from database import DatabaseManager
+    import stats
+
+
+def test_check_accepts_groups_without_price_or_rating(tmp_path):
+    """Khách chỉ mua sản phẩm không có giá / không chấm điểm: SUM(...) là NULL nhưng bộ đếm lưu 0 → vẫn khớp"""
+    db = DatabaseManager(str(tmp_path / "stats.db"))
+    db.create_tables()
+    conn = db.connect()
+    try:
+        conn.executemany("INSERT INTO customers (customer_id, name) VALUES (?, ?)", [(1, "A"), (2, "B")])
+        conn.executemany("INSERT INTO products (product_id, name, category, price) VALUES (?, ?, ?, ?)",
+                         [(10, "Không giá", "Khác", None), (11, "Có giá", "Khác", 20000)])
+        conn.executemany("INSERT INTO purchase_history (customer_id, product_id, quantity, rating) "
+                         "VALUES (?, ?, ?, ?)", [(1, 10, 2, None), (2, 11, 1, 4), (2, 10, 1, None)])
+        conn.commit()
+        assert stats.check(conn) == []
+    finally:
+        conn.close()
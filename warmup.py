@@ -0,0 +1,183 @@
+import os
+import time
+import threading
+import contextlib
+
+try:
+    from utils.catalog import ProductCatalog
+    from utils.phones import CustomerDirectory
+    from utils.lazy_imports import preload
+    from models.model_store import RecommenderModel
+except ImportError:
+    from catalog import ProductCatalog
+    from phones import CustomerDirectory
+    from lazy_imports import preload
+    from model_store import RecommenderModel
+
+# Cấu hình warm-up qua biến môi trường
+WARMUP_ENABLED = os.environ.get("WARMUP_ENABLED", "1") != "0"
+WARMUP_TRAIN_MODEL = os.environ.get("WARMUP_TRAIN_MODEL", "1") != "0"
+WARMUP_REQUESTS = int(os.environ.get("WARMUP_REQUESTS", "3"))
+WARMUP_ALGORITHMS = tuple(a for a in os.environ.get("WARMUP_ALGORITHMS", "hybrid").split(",") if a)
+
+HEAVY_MODULES = ("numpy", "pandas", "scipy.sparse", "scipy.sparse.linalg", "sklearn.metrics.pairwise")
+
+
+class WarmupState:
+    """Trạng thái warm-up cho /api/ready: pending → running → ready | failed"""
+
+    def __init__(self):
+        self.status = "pending"
+        self.steps = []
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self.status == "ready"
+
+    def begin(self):
+        with self._lock:
+            self.status = "running"
+            self.steps = []
+            self.error = None
+            self.started_at = time.time()
+            self.finished_at = None
+
+    def step_done(self, name, seconds, **info):
+        with self._lock:
+            self.steps.append(dict(name=name, seconds=round(seconds, 3), **info))
+
+    def finish(self, error=None):
+        with self._lock:
+            self.status = "failed" if error else "ready"
+            self.error = str(error) if error else None
+            self.finished_at = time.time()
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "status": self.status,
+                "ready": self.status == "ready",
+                "steps": list(self.steps),
+                "error": self.error,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+
+STATE = WarmupState()
+
+
+@contextlib.contextmanager
+def _step(state, name):
+    start = time.perf_counter()
+    info = {}
+    yield info
+    state.step_done(name, time.perf_counter() - start, **info)
+
+
+def _sample_customers(db, n):
+    conn = db.connect()
+    try:
+        rows = conn.execute(
+            "SELECT customer_id FROM purchase_history GROUP BY customer_id ORDER BY COUNT(*) DESC LIMIT ?", (n,)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [r[0] for r in rows]
+
+
+def _synthetic_recommender(recommender, db):
+    """
+    Recommender riêng cho request giả lập: dùng chung mô hình + catalog (phần cần làm nóng) nhưng có trạng thái
+    phiên riêng — warm-up chạy nền trong khi server đã nhận request trên recommender dùng chung
+    """
+    synthetic = type(recommender)(db=db)
+    synthetic.model = recommender.model
+    synthetic.catalog = recommender.catalog
+    synthetic.interactions_path = recommender.interactions_path
+    return synthetic
+
+
+def run_warmup(recommender, db, state=STATE, train_model=WARMUP_TRAIN_MODEL,
+               n_requests=WARMUP_REQUESTS, algorithms=WARMUP_ALGORITHMS, model=None, scheduler=None):
+    """
+    Chạy warm-up đồng bộ:
+    1. nạp thư viện số học (lazy import) 2. làm nóng SQLite page cache 3. nạp catalog + độ phổ biến
+    4. nạp/huấn luyện mô hình 5. chạy vài lượt gợi ý giả lập.
+    `model`: mô hình đã nạp sẵn (vd: từ đĩa) — bỏ qua bước huấn luyện.
+    `scheduler`: RetrainScheduler chưa khởi động — mô hình được nạp từ registry hoặc huấn luyện + publish qua
+    scheduler (không huấn luyện riêng trong RAM), rồi scheduler mới được khởi động khi warm-up kết thúc.
+    """
+    state.begin()
+    try:
+        with _step(state, "imports"):
+            preload(*HEAVY_MODULES)
+
+        with _step(state, "database") as info:
+            conn = db.connect()
+            try:
+                for table in ("customers", "products", "purchase_history"):
+                    info[table] = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            finally:
+                conn.close()
+
+        with _step(state, "catalog") as info:
+            catalog = ProductCatalog(db).refresh()
+            recommender.catalog = catalog
+            db.catalog = catalog
+            info["products"] = len(catalog.products)
+
+        with _step(state, "customer_phones") as info:
+            directory = CustomerDirectory(db).refresh()
+            db.customers = directory
+            info["phones"] = len(directory.by_phone)
+
+        if model is not None or train_model:
+            with _step(state, "model") as info:
+                if model is None and scheduler is not None:
+                    scheduler.ensure_model()
+                    model = recommender.model
+                elif model is None:
+                    model = RecommenderModel.train(recommender)
+                recommender.model = model
+                info.update(model.summary() if model else {"skipped": "no interactions"})
+
+        with _step(state, "synthetic_requests") as info:
+            customers = _sample_customers(db, n_requests)
+            synthetic = _synthetic_recommender(recommender, db)
+            for customer_id in customers:
+                for algorithm in algorithms:
+                    synthetic.recommend_products(customer_id, 5, algorithm)
+            info["requests"] = len(customers) * len(algorithms)
+    except Exception as e:
+        print(f"❌ Warm-up lỗi: {e}")
+        state.finish(error=e)
+        return state
+    finally:
+        if scheduler is not None:
+            scheduler.start()
+    state.finish()
+    total = sum(s["seconds"] for s in state.steps)
+    print(f"🔥 Warm-up xong trong {total:.2f}s: " + ", ".join(f"{s['name']} {s['seconds']}s" for s in state.steps))
+    return state
+
+
+def start_warmup(recommender, db, background=True, state=STATE, **kwargs):
+    """Bắt đầu warm-up (mặc định ở thread nền để server nhận /api/ready ngay). Tắt bằng WARMUP_ENABLED=0."""
+    if not WARMUP_ENABLED:
+        state.begin()
+        state.finish()
+        if kwargs.get("scheduler") is not None:
+            kwargs["scheduler"].start()
+        return None
+    if not background:
+        run_warmup(recommender, db, state=state, **kwargs)
+        return None
+    thread = threading.Thread(target=run_warmup, args=(recommender, db), kwargs=dict(state=state, **kwargs),
+                              name="warmup", daemon=True)
+    thread.start()
+    return thread